@@ -15,6 +15,9 @@
 from migen import *
 from migen.fhdl import verilog
 from migen.fhdl.bitcontainer import bits_for
+from migen.genlib.cdc import MultiReg
+
+from trigger import DoubleBuffer
 
 class CrossBarCell(Module):
 
@@ -58,23 +61,46 @@ class CrossBar(Module):
 
 class CrossBarControl(Module):
 
-    def __init__(self, baseaddr, registers, inputs, bank_a, bank_b):
+    def __init__(self, baseaddr, registers, inputs, bank_a, bank_b, domain=None, hold=None, load=None):
 
         a_count = len(bank_a)
         b_count = len(bank_b)
         outputs = Signal(a_count + b_count)
 
-        self.submodules.crossbar = CrossBar(inputs, outputs)
+        ## When the inputs are in another clock domain, the crossbar runs there too so that
+        ## outputs keep that domain's timing.  Controls only change on reconfiguration, so 
+        ## each is simply resynchronized.
+        if domain is None:
+            counting = lambda module: module
+        else:
+            counting = ClockDomainsRenamer(domain)
+
+        self.submodules.crossbar = counting(CrossBar(inputs, outputs))
+
+        ## With ``hold`` and ``load`` masks (one bit per output, in the crossbar's domain) the
+        ## control registers are double buffered : see CommitControl
+        def control(i, ctrl):
+            if domain is not None:
+                synced = Signal.like(ctrl)
+                self.specials += MultiReg(ctrl, synced, domain, reset=ctrl.reset)
+                ctrl = synced
+
+            if hold is not None:
+                shadow = counting(DoubleBuffer([ctrl], hold[i], load[i]))
+                self.submodules += shadow
+                ctrl = shadow.live[0]
+
+            self.comb += self.crossbar.controls[i].eq(ctrl)
 
         for i in range(a_count):
             ctrl, _ = registers.create("Crossbar A{}".format(i), addr=baseaddr+i, default=0b0100_0000)
 
-            self.comb += self.crossbar.controls[i].eq(ctrl),
+            control(i, ctrl)
             self.comb += bank_a[i].eq(outputs[i])
         
         for i in range(b_count):
             ctrl, _ = registers.create("Crossbar B{}".format(i), addr=baseaddr+i+a_count, default=0b0100_0000)
 
-            self.comb += self.crossbar.controls[i + a_count].eq(ctrl),
+            control(i + a_count, ctrl)
             self.comb += bank_b[i].eq(outputs[i + a_count])
 
@@ -69,11 +69,56 @@ class I2CRegisters(Registers):
 
     Note that for multibyte registers, the register data is read in little endian, but written
     in big endian. This replaces a huge multiplexer with a shift register, but is a bit cursed.
+
+    For 8-bit registers the register pointer auto-increments after every data octet that is read
+    or written, so a range of adjacent registers can be accessed in a single transaction. The
+    pointer wraps around to address 0 after the last register. Multibyte registers keep the
+    shift register behavior above and do not advance the pointer.
+
+    Values spanning several 8-bit registers can be created with :meth:`add_atomic`. Such a
+    value only follows its registers while no transaction addressed to us is in progress, so
+    every byte written within one transaction takes effect at the same time, on the stop
+    condition.
+
+    :attr idle:
+        High between transactions addressed to this target.
     """
     def __init__(self, i2c_target):
         super().__init__()
         self.i2c_target = i2c_target
 
+        self.idle = Signal(reset=1)
+        self.sync += [
+            If(self.i2c_target.start,
+                self.idle.eq(0)
+            ).Elif(self.i2c_target.bus.stop,
+                self.idle.eq(1)
+            )
+        ]
+
+    def add_atomic(self, length, reset=0, addr=None):
+        """
+        Add ``length`` consecutive 8-bit read/write registers holding a little endian value.
+        Returns the value, which is updated from the registers only when :attr:`idle`, and
+        the list of register addresses.
+        """
+        value = Signal(8 * length, reset=reset)
+        regs, addrs = [], []
+
+        for idx in range(length):
+            kwargs = dict() if addr is None else dict(addr=addr + idx)
+            reg, reg_addr = self.add_rw(8, reset=(reset >> (8 * idx)) & 0xFF, **kwargs)
+
+            if reg is None:
+                return None, reg_addr
+
+            regs.append(reg)
+            addrs.append(reg_addr)
+
+        self.sync += If(self.idle, value.eq(Cat(*regs)))
+
+        return value, addrs
+
     def do_finalize(self):
         super().do_finalize()
 
@@ -83,6 +128,17 @@ class I2CRegisters(Registers):
         latch_addr = Signal()
         reg_addr   = Signal(max=max(self.reg_count, 2))
         reg_data   = Signal(max(s.nbits for s in self.regs_r))
+
+        narrow     = Array(C(s.nbits <= 8, 1) for s in self.regs_r)
+        next_addr  = Signal.like(reg_addr)
+        self.comb += [
+            If(reg_addr == self.reg_count - 1,
+                next_addr.eq(0)
+            ).Else(
+                next_addr.eq(reg_addr + 1)
+            )
+        ]
+
         self.comb += [
             self.i2c_target.data_o.eq(reg_data),
             If(self.i2c_target.write,
@@ -104,13 +160,22 @@ class I2CRegisters(Registers):
                 If(latch_addr,
                     reg_addr.eq(self.i2c_target.data_i),
                     reg_data.eq(self.regs_r[self.i2c_target.data_i]),
+                ).Elif(narrow[reg_addr],
+                    self.regs_w[reg_addr].eq(self.i2c_target.data_i),
+                    reg_addr.eq(next_addr),
+                    reg_data.eq(self.regs_r[next_addr]),
                 ).Else(
                     reg_data.eq(Cat(self.i2c_target.data_i, reg_data)),
                     self.regs_w[reg_addr].eq(Cat(self.i2c_target.data_i, reg_data)),
                 )
             ),
             If(self.i2c_target.read,
-                reg_data.eq(reg_data >> 8),
+                If(narrow[reg_addr],
+                    reg_addr.eq(next_addr),
+                    reg_data.eq(self.regs_r[next_addr]),
+                ).Else(
+                    reg_data.eq(reg_data >> 8),
+                )
             )
         ]
 
@@ -133,6 +198,7 @@ class I2CRegistersTestbench(Module):
         self.reg_ro_16, self.addr_ro_16 = self.dut.add_ro(16)
         self.reg_rw_12, self.addr_rw_12 = self.dut.add_rw(12)
         self.reg_ro_12, self.addr_ro_12 = self.dut.add_ro(12)
+        self.reg_atomic, self.addr_atomic = self.dut.add_atomic(2, reset=0x1234)
 
 
 class I2CRegistersTestCase(unittest.TestCase):
@@ -246,4 +312,58 @@ class I2CRegistersTestCase(unittest.TestCase):
         yield from tb.i2c.write_bit(0)
         self.assertEqual((yield from tb.i2c.read_octet()), 0b00001110)
         yield from tb.i2c.write_bit(1)
-        yield from tb.i2c.stop()
\ No newline at end of file
+        yield from tb.i2c.stop()
+
+    @simulation_test
+    def test_data_write_burst(self, tb):
+        yield from tb.i2c.start()
+        yield from tb.i2c.write_octet(0b00010000)
+        self.assertEqual((yield from tb.i2c.read_bit()), 0)
+        yield from tb.i2c.write_octet(self.tb.addr_dummy)
+        self.assertEqual((yield from tb.i2c.read_bit()), 0)
+        yield from tb.i2c.write_octet(0b01011010)
+        self.assertEqual((yield from tb.i2c.read_bit()), 0)
+        yield from tb.i2c.write_octet(0b10100101)
+        self.assertEqual((yield from tb.i2c.read_bit()), 0)
+        self.assertEqual((yield tb.dut.regs_r[self.tb.addr_dummy]), 0b01011010)
+        self.assertEqual((yield tb.dut.regs_r[self.tb.addr_rw_8]), 0b10100101)
+        yield from tb.i2c.stop()
+
+    @simulation_test
+    def test_data_read_burst(self, tb):
+        yield (tb.dut.regs_r[self.tb.addr_rw_8].eq(0b01011010))
+        yield (tb.dut.regs_r[self.tb.addr_ro_8].eq(0b10100101))
+        yield (tb.dut.regs_r[self.tb.addr_ro_16].eq(0b1111000000001111))
+        yield from tb.i2c.start()
+        yield from tb.i2c.write_octet(0b00010000)
+        self.assertEqual((yield from tb.i2c.read_bit()), 0)
+        yield from tb.i2c.write_octet(self.tb.addr_rw_8)
+        self.assertEqual((yield from tb.i2c.read_bit()), 0)
+        yield from tb.i2c.rep_start()
+        yield from tb.i2c.write_octet(0b00010001)
+        self.assertEqual((yield from tb.i2c.read_bit()), 0)
+        self.assertEqual((yield from tb.i2c.read_octet()), 0b01011010)
+        yield from tb.i2c.write_bit(0)
+        self.assertEqual((yield from tb.i2c.read_octet()), 0b10100101)
+        yield from tb.i2c.write_bit(1)
+        yield from tb.i2c.stop()
+
+    @simulation_test
+    def test_data_write_atomic(self, tb):
+        self.assertEqual((yield self.tb.reg_atomic), 0x1234)
+        yield from tb.i2c.start()
+        yield from tb.i2c.write_octet(0b00010000)
+        self.assertEqual((yield from tb.i2c.read_bit()), 0)
+        yield from tb.i2c.write_octet(self.tb.addr_atomic[0])
+        self.assertEqual((yield from tb.i2c.read_bit()), 0)
+        yield from tb.i2c.write_octet(0b10100101)
+        self.assertEqual((yield from tb.i2c.read_bit()), 0)
+        yield from tb.i2c.write_octet(0b11110000)
+        self.assertEqual((yield from tb.i2c.read_bit()), 0)
+        self.assertEqual((yield tb.dut.regs_r[self.tb.addr_atomic[0]]), 0b10100101)
+        self.assertEqual((yield tb.dut.regs_r[self.tb.addr_atomic[1]]), 0b11110000)
+        self.assertEqual((yield self.tb.reg_atomic), 0x1234)
+        yield from tb.i2c.stop()
+        yield
+        yield
+        self.assertEqual((yield self.tb.reg_atomic), 0b1111000010100101)
@@ -0,0 +1,43 @@
+# Copyright 2022 Chris Osterwood for Capable Robot Components
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from migen import *
+from migen.genlib.resetsync import AsyncResetSynchronizer
+
+
+class FastClock(Module):
+    """
+    Creates the 48 MHz ``fast`` clock domain from the 12 MHz system clock with the iCE40
+    SB_PLL40_CORE.  The domain is held in reset until the PLL has locked.
+    """
+    def __init__(self, refclk):
+        self.clock_domains.cd_fast = ClockDomain("fast")
+        self.locked = Signal()
+
+        ## Settings from `icepll -i 12 -o 48` : 12 MHz x 64 = 768 MHz VCO, divided by 2^4
+        self.specials += Instance("SB_PLL40_CORE",
+            p_FEEDBACK_PATH="SIMPLE",
+            p_DIVR=0,
+            p_DIVF=63,
+            p_DIVQ=4,
+            p_FILTER_RANGE=1,
+            i_REFERENCECLK=refclk,
+            i_RESETB=1,
+            i_BYPASS=0,
+            o_PLLOUTGLOBAL=self.cd_fast.clk,
+            o_LOCK=self.locked,
+        )
+
+        self.specials += AsyncResetSynchronizer(self.cd_fast, ~self.locked)
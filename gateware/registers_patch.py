@@ -24,16 +24,30 @@ def apply(obj):
     
     return obj
 
+def _offset(kwargs, idx):
+    ## Bytes of a multibyte register follow on from an explicit base address
+    if 'addr' in kwargs:
+        kwargs = dict(kwargs, addr=kwargs['addr'] + idx)
+    return kwargs
+
 def _hex(value):
     return "0x" + format(value, '02X')
 
-def create(self, name, length=1, default=0, ro=False, desc='', **kwargs):
+def create(self, name, length=1, default=0, ro=False, desc='', atomic=False, **kwargs):
+    """
+    Create a register of ``length`` bytes.  Multibyte registers return a list of 8-bit
+    registers, unless ``atomic`` is set : then a single little endian value is returned, which
+    only changes once the I2C transaction writing it has ended (see I2CRegisters.add_atomic).
+    """
     if not hasattr(self, 'registers'):
         self.registers = []
 
     reg, addr = [], []
     
-    if ro:
+    if atomic and not ro and length > 1:
+        reg, addr = self.add_atomic(length, reset=default, **kwargs)
+
+    elif ro:
         if length == 1:
             reg, addr  = self.add_ro(8, reset=default, **kwargs)
 
@@ -43,7 +57,7 @@ def create(self, name, length=1, default=0, ro=False, desc='', **kwargs):
                 if default != 0:
                     value = ord(default[idx])
 
-                r, a = self.add_ro(8, reset=value, **kwargs)
+                r, a = self.add_ro(8, reset=value, **_offset(kwargs, idx))
                 reg.append(r)
                 addr.append(a)
 
@@ -52,7 +66,7 @@ def create(self, name, length=1, default=0, ro=False, desc='', **kwargs):
             reg, addr = self.add_rw(8, reset=default, **kwargs)
         else:
             for idx in range(length):
-                r, a = self.add_rw(8, reset=default, **kwargs)
+                r, a = self.add_rw(8, reset=(default >> (8 * idx)) & 0xFF, **_offset(kwargs, idx))
                 reg.append(r)
                 addr.append(a)
 
@@ -61,7 +75,7 @@ def create(self, name, length=1, default=0, ro=False, desc='', **kwargs):
     else:
         baseaddr = addr
 
-    if reg is None or len(reg) == 0:
+    if reg is None or (type(reg) is list and (len(reg) == 0 or any(r is None for r in reg))):
         print("Cannot add a register '{}' at address {} ({}) as one exists".format(name, baseaddr, hex(baseaddr)))
         print()
         self.display_table()
@@ -0,0 +1,104 @@
+# Copyright 2022 Chris Osterwood for Capable Robot Components
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+## Compare the resource usage of gateware variants.
+##
+##   python resources.py
+##
+## Flip-flops are counted from the elaborated design, so this runs anywhere Migen does.  When
+## yosys is on the PATH each variant is also synthesized with synth_ice40 and its cell usage
+## (LUTs, carries, flip-flops) reported.
+
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from migen import *
+from migen.fhdl.tools import list_targets
+
+from target import TriggerTarget
+from target_platform import TriggerPlatform
+
+VARIANTS = [
+    ("shared strobe",       dict(prescalers=False, dds=False, shadow=False)),
+    ("per-trigger prescalers", dict(prescalers=True, dds=False, shadow=False)),
+    ("DDS trigger mode",       dict(prescalers=True, dds=True, shadow=False)),
+    ("shadow registers",       dict(prescalers=True, dds=True, shadow=True)),
+    ("48 MHz PLL timebase",    dict(pll=True)),
+]
+
+CELLS = ["SB_LUT4", "SB_CARRY", "SB_DFF*"]
+
+
+def _target(options):
+    platform = TriggerPlatform()
+    target = TriggerTarget(platform, **options)
+
+    ## Name the default clock domain explicitly, as newer Pythons trip Migen's name inference
+    target.clock_domains.cd_sys = ClockDomain("sys")
+
+    return platform, target
+
+
+def flip_flops(options):
+    _, target = _target(options)
+    fragment = target.get_fragment()
+
+    return sum(len(signal) for statements in fragment.sync.values() for signal in list_targets(statements))
+
+
+def synthesize(options):
+    platform, target = _target(options)
+
+    with tempfile.TemporaryDirectory() as build_dir:
+        source = os.path.join(build_dir, "top.v")
+        platform.get_verilog(target, name="top").write(source)
+
+        result = subprocess.run(["yosys", "-q", "-p", "synth_ice40 -top top; stat", source],
+            capture_output=True, text=True, check=True)
+
+    usage = dict()
+
+    for cell in CELLS:
+        pattern = cell.replace("*", r"\w*")
+        usage[cell] = sum(int(count) for count in re.findall(r"^\s+{}\s+(\d+)$".format(pattern), result.stdout, re.M))
+
+    return usage
+
+
+def main():
+    have_yosys = shutil.which("yosys") is not None
+
+    headers = ["variant", "FFs (elaborated)"] + (CELLS if have_yosys else [])
+    print("  ".join(h.ljust(24) for h in headers))
+
+    for name, options in VARIANTS:
+        row = [name, str(flip_flops(options))]
+
+        if have_yosys:
+            usage = synthesize(options)
+            row += [str(usage[cell]) for cell in CELLS]
+
+        print("  ".join(value.ljust(24) for value in row))
+
+    if not have_yosys:
+        print()
+        print("yosys not found : LUT and carry usage not reported", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import sys
+from fractions import Fraction
 from shutil import copyfile
 
 from migen import *
@@ -25,26 +26,40 @@ from target_platform import TriggerPlatform
 import registers_patch
 
 
-from trigger import TriggerController, IdentRegisters, ClockDivider, Divider
+from trigger import TriggerController, IdentRegisters, ClockDivider, Divider, CommitControl, synchronize
 from crossbar import CrossBarControl
+from pll import FastClock
 
 class TriggerTarget(Module):
     sys_clk_freq = 12e6
+    fast_clk_freq = 48e6
     trigger_count = 4
 
-    def __init__(self, platform=None):
+    def __init__(self, platform=None, tick_period=1200, timing_width=8, prescalers=True, pll=False, dds=True, 
+                 shadow=True):
         self.platform = platform
+        self.timing_width = timing_width
+        self.prescalers = prescalers
+        self.pll = pll
+        self.dds = dds
+        self.shadow = shadow
         self.registers = None
         self.enums = dict()
 
         if platform == 'sim':
+            ## In simulation the I2C target is driven by a testbench initiator, and the
+            ## board I/O are plain signals which can be inspected or driven by the simulation.
             self.submodules.i2c_target = I2CTargetTestbench()
             self.submodules.registers = registers_patch.apply(I2CRegisters(self.i2c_target.dut))
-            self.submodules.tick = ClockDivider(2)
-            self.submodules.wall = Divider(self.tick.strobe, 2, 255)
+            self.comb += self.i2c_target.dut.address.eq(0b0001000)
 
-            self.enable = Signal()
-            self.submodules.trig_ctrl  = TriggerController(0, self.registers, self.wall.strobe, self.enable)
+            resets   = [Signal(name="reset{}".format(i)) for i in range(8)]
+            triggers = [Signal(name="trigger{}".format(i)) for i in range(8)]
+
+            camera_power_3v3 = Signal()
+            camera_power_5v0 = Signal()
+            camera_sense_3v3 = Signal()
+            camera_sense_5v0 = Signal()
 
         else:
             self.submodules.i2c_pads  = Pads(self.platform.request("i2c"))
@@ -62,50 +77,113 @@ class TriggerTarget(Module):
             triggers = [("csi_trig",i) for i in range(6)] + [("aux",0), ("aux",1)]
             triggers = [platform.request(name, num) for name,num in triggers]
 
-            self.submodules.ident      = IdentRegisters(self.registers, self.product_id, self.hardware_revision, self.gateware_revision)
+            camera_power_3v3 = platform.request("camera_power_3v3", 0)
+            camera_power_5v0 = platform.request("camera_power_5v0", 0)
 
-            self.registers.create("Trigger Count", default=self.trigger_count, ro=True)
+            camera_sense_3v3 = platform.request("camera_sense_3v3", 0)
+            camera_sense_5v0 = platform.request("camera_sense_5v0", 0)
 
-            ## Create a 10 kHz clock (0.1 ms) from 12 MHz source
-            self.submodules.tick = ClockDivider(1200)
+        self.resets   = resets
+        self.triggers = triggers
+        self.camera_sense = [camera_sense_3v3, camera_sense_5v0]
 
-            ## Create a adjustable divider on that 10 kHz clock.  
-            ## Default is 10, to create a 1 ms strobe for the trigger. 
-            reg_wall, _     = self.registers.create("Clock Divider", default=10, addr=20)
-            self.submodules.wall = Divider(self.tick.strobe, 10, 255)
-            self.comb += [
-                self.wall.period.eq(reg_wall)
-            ]
+        self.submodules.ident      = IdentRegisters(self.registers, self.product_id, self.hardware_revision, self.gateware_revision)
 
-            reg_power, _  = self.registers.create("Power Control", default=0x03, addr=21)
-            reg_sense, _  = self.registers.create("Power Sense", default=0x00, addr=22, ro=True) 
+        self.registers.create("Trigger Count", default=self.trigger_count, ro=True)
+        self.registers.create("Timing Width", default=self.timing_width, ro=True, addr=13)
 
-            camera_power_3v3 = platform.request("camera_power_3v3", 0)
-            camera_power_5v0 = platform.request("camera_power_5v0", 0)
+        ## With the PLL, the timebase, triggers and crossbar all run from the 48 MHz 'fast' clock
+        ## and the registers (in the I2C / sys domain) are synchronized into it.  Each trigger
+        ## then has a Fine Delay register, in cycles of that clock.
+        if self.pll:
+            domain = "fast"
+            counting = ClockDomainsRenamer(domain)
+            ratio = int(self.fast_clk_freq // self.sys_clk_freq)
 
-            camera_sense_3v3 = platform.request("camera_sense_3v3", 0)
-            camera_sense_5v0 = platform.request("camera_sense_5v0", 0)
+            if platform == 'sim':
+                self.clock_domains.cd_fast = ClockDomain(domain)
+            else:
+                self.submodules.fast_clock = FastClock(ClockSignal("sys"))
+        else:
+            domain = None
+            counting = lambda module: module
+            ratio = 1
+
+        fine_mhz = int(self.fast_clk_freq / 1e6) if self.pll else 0
+        self.registers.create("Fine Clock", default=fine_mhz, ro=True, addr=14)
+
+        ## Optional features of this build : the host can't tell them from the revision alone
+        capabilities = int(self.prescalers) << 0 | int(self.dds) << 1 | int(self.shadow) << 2
+        self.registers.create("Capabilities", default=capabilities, ro=True, addr=15)
+
+        ## Create a 10 kHz clock (0.1 ms) from 12 MHz source (or the 48 MHz PLL clock)
+        self.submodules.tick = counting(ClockDivider(tick_period * ratio))
+
+        ## Create a adjustable divider on that 10 kHz clock.  
+        ## Default is 10, to create a 1 ms strobe for the trigger. 
+        reg_wall, _     = self.registers.create("Clock Divider", default=10, addr=20)
+        reg_enable, _   = self.registers.create("Trigger Enables", addr=60)
+
+        if self.pll:
+            reg_wall, reg_enable = synchronize(self, [reg_wall, reg_enable], domain)
+
+        self.submodules.wall = counting(Divider(self.tick.strobe, 10, 255))
+        self.comb += [
+            self.wall.period.eq(reg_wall)
+        ]
+
+        reg_power, _  = self.registers.create("Power Control", default=0x03, addr=21)
+        reg_sense, _  = self.registers.create("Power Sense", default=0x00, addr=22, ro=True) 
+
+        self.comb += [
+            camera_power_3v3.eq(reg_power[0]),
+            camera_power_5v0.eq(reg_power[1])
+        ]
+
+        self.comb += [
+            reg_sense.eq(Cat(camera_sense_3v3, camera_sense_5v0))
+        ]
+
+        ## Shadow Hold and Commit double buffer the trigger timing and crossbar registers, so a
+        ## new configuration lands on one Clock Divider strobe
+        if self.shadow:
+            self.submodules.commit = CommitControl(self.registers, self.registers.idle, self.wall.strobe, 
+                hold_addr=56, commit_addr=61, domain=domain)
+            hold, load = self.commit.hold, self.commit.load
+
+        trigger_outputs = []
+
+        for num in range(self.trigger_count):
+            ## Per-trigger prescalers divide the 10 kHz tick, starting in phase with the wall strobe
+            if self.prescalers:
+                options = dict(tick=self.tick.strobe, reference=self.wall.next)
+            else:
+                options = dict()
 
-            self.comb += [
-                camera_power_3v3.eq(reg_power[0]),
-                camera_power_5v0.eq(reg_power[1])
-            ]
+            ## 16-bit Fine Delay registers follow each other from 0x30
+            if self.pll:
+                options.update(domain=domain, fine_addr=48+(num*2))
 
-            self.comb += [
-                reg_sense.eq(Cat(camera_sense_3v3, camera_sense_5v0))
-            ]
+            ## 32-bit DDS Tuning registers follow the trigger blocks from 0x60
+            if self.dds:
+                options.update(tuning_addr=96+(num*4))
 
-            reg_enable, _  = self.registers.create("Trigger Enables", addr=60)
-            trigger_outputs = []
+            if self.shadow:
+                options.update(hold=hold[num], load=load[num])
 
-            for num in range(self.trigger_count):
-                trigger = TriggerController(num, 64+(num*8), self.registers, self.wall.strobe, reg_enable[num])
+            trigger = TriggerController(num, 64+(num*8), self.registers, self.wall.strobe, reg_enable[num], 
+                width=self.timing_width, **options)
 
-                setattr(self.submodules, "trigger{}".format(chr(0x41+num)), trigger)
-                trigger_outputs.append(trigger.output)
+            setattr(self.submodules, "trigger{}".format(chr(0x41+num)), trigger)
+            trigger_outputs.append(trigger.output)
+
+        inputs = Array(trigger_outputs)
+        if self.shadow:
+            pins = dict(hold=hold[8:], load=load[8:])
+        else:
+            pins = dict()
 
-            inputs = Array(trigger_outputs)
-            self.submodules.crossbar = CrossBarControl(32, self.registers, inputs, triggers, resets)
+        self.submodules.crossbar = CrossBarControl(32, self.registers, inputs, triggers, resets, domain=domain, **pins)
 
     @property
     def product_id(self):
@@ -117,71 +195,340 @@ class TriggerTarget(Module):
 
     @property
     def gateware_revision(self):
-        return 1
+        return 8
 
 def test_trigger_control(dut):
-    
+
+    regs = dut.registers.regs_r
+
+    ## Route trigger 0 to crossbar output A0
+    yield regs[0x20].eq(0b1000_0000)
+
     ## Set mode to interval
-    yield dut.registers.regs_r[0].eq(2)
+    yield regs[0x40].eq(2)
 
     ## Set phase
-    yield dut.registers.regs_r[3].eq(2)
+    yield regs[0x43].eq(2)
 
     ## Set trigger interval & duration
-    yield dut.registers.regs_r[1].eq(8)
+    yield regs[0x41].eq(8)
+
+    ## Set the clock divider to 2 so the simulation doesn't take forever
+    yield regs[0x14].eq(2)
 
-    yield dut.enable.eq(1)
+    yield regs[0x3C].eq(1)
 
     # Simulate waiting before setting duration 
     # (trigger should not start yet)
     for i in range(10):
         yield
 
-    yield dut.registers.regs_r[2].eq(3)
+    yield regs[0x42].eq(3)
 
     for i in range(100):
         yield
 
-    yield dut.enable.eq(0)
+    yield regs[0x3C].eq(0)
 
     for i in range(20):
         yield
 
-    yield dut.registers.regs_r[3].eq(4)
-    yield dut.enable.eq(1)
+    yield regs[0x43].eq(4)
+    yield regs[0x3C].eq(1)
 
     for i in range(100):
         yield
 
     # Change the interval & duration values
-    yield dut.registers.regs_r[1].eq(16)
-    yield dut.registers.regs_r[2].eq(5)
+    yield regs[0x41].eq(16)
+    yield regs[0x42].eq(5)
 
     for i in range(100):
         yield
 
 
 
+def test_prescaler_alignment(dut, cycles=2000):
+    """
+    Trigger 0 runs off the wall strobe while triggers 1 and 2 use their own prescalers, all
+    with the same overall period.  Their rising edges must coincide.
+    """
+    regs = dut.registers.regs_r
+
+    yield regs[0x14].eq(6)
+
+    ## Trigger0 : wall strobe (6 ticks) x 2, Trigger1 : 4 ticks x 3, Trigger2 : 3 ticks x 4
+    for idx, (prescaler, interval) in enumerate([(0, 2), (4, 3), (3, 4)]):
+        base = 0x40 + idx * 8
+        yield regs[0x20 + idx].eq(0b1000_0000 | idx)
+        yield regs[base + 7].eq(prescaler)
+        yield regs[base + 1].eq(interval)
+        yield regs[base + 2].eq(1)
+        yield regs[base].eq(2)
+
+    ## Enable at an arbitrary point, not on a wall strobe
+    for i in range(7):
+        yield
+
+    yield regs[0x3C].eq(0b111)
+
+    previous = [0, 0, 0]
+    edges = [[], [], []]
+
+    for cycle in range(cycles):
+        yield
+        for idx in range(3):
+            value = yield dut.triggers[idx]
+            if value and not previous[idx]:
+                edges[idx].append(cycle)
+            previous[idx] = value
+
+    print("Rising edges :", edges[0][:8], "...")
+    assert len(edges[0]) > 2
+    assert edges[0] == edges[1] == edges[2], "prescaled triggers are not aligned with the wall strobe"
+
+
+def test_fine_delay(dut, cycles=3000):
+    """
+    Runs in the fast clock domain.  Four triggers share one timebase; Trigger0 and Trigger1 have
+    no Fine Delay, Trigger2 is delayed by one fast clock cycle and Trigger3 by seven.  Every 
+    edge must be offset by exactly its Fine Delay : zero skew between Trigger0 and Trigger1, and 
+    single cycle steps otherwise.
+    """
+    regs = dut.registers.regs_r
+    fine = [0, 0, 1, 7]
+
+    yield regs[0x14].eq(4)
+
+    for idx, delay in enumerate(fine):
+        base = 0x40 + idx * 8
+        yield regs[0x20 + idx].eq(0b1000_0000 | idx)
+        yield regs[0x30 + idx * 2].eq(delay)
+        yield regs[base + 1].eq(2)
+        yield regs[base + 2].eq(1)
+        yield regs[base].eq(2)
+
+    ## Give the synchronizers time to carry the configuration over before enabling
+    for i in range(100):
+        yield
+
+    yield regs[0x3C].eq(0b1111)
+
+    previous = [0] * len(fine)
+    edges = [[] for _ in fine]
+
+    for cycle in range(cycles):
+        yield
+        for idx in range(len(fine)):
+            value = yield dut.triggers[idx]
+            if value != previous[idx]:
+                edges[idx].append(cycle)
+            previous[idx] = value
+
+    resolution = 1e9 / dut.fast_clk_freq
+    skews = [[edge - ref for edge, ref in zip(edges[idx], edges[0])] for idx in range(len(fine))]
+
+    print("Edges        :", edges[0][:6], "...")
+    print("Resolution   : {:.1f} ns".format(resolution))
+
+    for idx, delay in enumerate(fine):
+        print("Trigger{} skew : {} cycles ({:.1f} ns)".format(idx, sorted(set(skews[idx])), skews[idx][0] * resolution))
+
+    assert len(edges[0]) > 4
+    for idx, delay in enumerate(fine):
+        assert len(edges[idx]) == len(edges[0])
+        assert set(skews[idx]) == {delay}, "Trigger{} edges are not offset by its Fine Delay".format(idx)
+
+
+def test_dds_rate(dut, cycles=4000, ratio=0.3):
+    """
+    Trigger0 in DDS mode, counting every tick, with a tuning word for ``ratio`` triggers per
+    tick.  Triggers must come every 3 or 4 ticks, and each edge must be within one tick of its 
+    ideal time.
+    """
+    regs = dut.registers.regs_r
+    tick = 2
+    tuning = round(ratio * 2**32)
+
+    yield regs[0x20].eq(0b1000_0000)
+    yield regs[0x47].eq(1)
+    yield regs[0x42].eq(1)
+
+    for byte in range(4):
+        yield regs[0x60 + byte].eq((tuning >> (8 * byte)) & 0xFF)
+
+    yield regs[0x40].eq(5)
+    yield regs[0x3C].eq(1)
+
+    previous = 0
+    edges = []
+
+    for cycle in range(cycles):
+        yield
+        value = yield dut.triggers[0]
+        if value and not previous:
+            edges.append(cycle)
+        previous = value
+
+    ## The accumulator starts one short of wrapping, so the first trigger comes on the first
+    ## tick.  Trigger n is then ideally due (n * 2^32 + 1) / tuning - 1 ticks after it.
+    ticks = [(edge - edges[0]) // tick for edge in edges]
+    ideal = [Fraction(n * 2**32 + 1, tuning) - 1 for n in range(len(ticks))]
+    lag = [t - i for t, i in zip(ticks, ideal)]
+
+    intervals = sorted(set(b - a for a, b in zip(ticks, ticks[1:])))
+    period = Fraction(ticks[-1], len(ticks) - 1)
+
+    print("DDS intervals: {} ticks, mean {:.5f} (ideal {:.5f}), lag {:.3f} to {:.3f} ticks".format(
+        intervals, float(period), 1 / ratio, float(min(lag)), float(max(lag))))
+
+    assert len(edges) > 100
+    assert intervals == [3, 4]
+    assert all(0 <= l < 1 for l in lag), "DDS edges are more than one tick from their ideal times"
+
+
+def test_commit(dut):
+    """
+    Triggers 0 and 1 run with an interval of 4 strobes, and output A2 follows Trigger1.  With their
+    Shadow Hold bits set, new intervals (6 and 8 strobes) and inverting A2 must have no effect until
+    the Commit, after which all three change within one strobe and the Commit register clears.
+    """
+    regs = dut.registers.regs_r
+    strobe = 4
+
+    yield regs[0x14].eq(2)
+
+    for idx in range(2):
+        base = 0x40 + idx * 8
+        yield regs[0x20 + idx].eq(0b1000_0000 | idx)
+        yield regs[base + 1].eq(4)
+        yield regs[base + 2].eq(1)
+        yield regs[base].eq(2)
+
+    yield regs[0x22].eq(0b1000_0001)
+    yield regs[0x3C].eq(0b11)
+
+    edges = [[], []]
+    previous = [0, 0]
+    inverted = []
+    committed = None
+
+    for cycle in range(1000):
+        if cycle == 200:
+            yield regs[0x38].eq(0b11)
+            yield regs[0x39].eq(0b100)
+
+        if cycle == 210:
+            yield regs[0x41].eq(6)
+            yield regs[0x49].eq(8)
+            yield regs[0x22].eq(0b1010_0001)
+
+        if cycle == 500:
+            yield regs[0x3D].eq(0b11)
+            yield regs[0x3E].eq(0b100)
+            committed = cycle
+
+        yield
+
+        for idx in range(2):
+            value = yield dut.triggers[idx]
+            if value and not previous[idx]:
+                edges[idx].append(cycle)
+            previous[idx] = value
+
+        if (yield dut.triggers[2]) != (yield dut.triggers[1]):
+            inverted.append(cycle)
+
+        if cycle == 520:
+            assert (yield regs[0x3D]) == 0 and (yield regs[0x3E]) == 0, "Commit register did not clear"
+
+    switches = []
+
+    for idx, interval in enumerate([6, 8]):
+        periods = [(b - a) // strobe for a, b in zip(edges[idx], edges[idx][1:])]
+        switch = next(b for a, b in zip(edges[idx], edges[idx][1:]) if (b - a) // strobe != 4)
+        switches.append(switch)
+
+        print("Trigger{} periods : {} (switch at cycle {})".format(idx, periods, switch))
+
+        assert set(periods) <= {4, interval} and switch > committed, \
+            "Trigger{} changed before the commit or glitched".format(idx)
+
+    print("A2 inverted from cycle {}".format(inverted[0]))
+
+    ## Both triggers take their new interval from the same strobe, which their next edge shows
+    assert switches[0] - edges[0][edges[0].index(switches[0]) - 1] == 6 * strobe
+    assert switches[1] - edges[1][edges[1].index(switches[1]) - 1] == 8 * strobe
+    assert committed < inverted[0] <= committed + 2 * strobe
+    assert inverted == list(range(inverted[0], 1000)), "A2 glitched after the commit"
+
+
+def test_capabilities(dut, expected):
+    """
+    The Capabilities register reports the optional features the gateware was built with.
+    """
+    value = yield dut.registers.regs_r[15]
+    revision = yield dut.registers.regs_r[7]
+
+    print("Revision {} capabilities {:03b}".format(revision, value))
+    assert revision == 8 and value == expected, "Capabilities {:03b}, expected {:03b}".format(value, expected)
+
+
 class SimpleTests():
 
     def trigger(self):
 
-        dut = TriggerTarget('sim')
+        dut = TriggerTarget('sim', tick_period=2)
         # dut.clock_domains.cd_sys = ClockDomain("sys")
         run_simulation(dut, test_trigger_control(dut), vcd_name="trigger_test.vcd")
 
+    def prescaler(self):
+
+        dut = TriggerTarget('sim', tick_period=2)
+        run_simulation(dut, test_prescaler_alignment(dut), vcd_name="prescaler_test.vcd")
+
+    def dds(self):
+
+        dut = TriggerTarget('sim', tick_period=2)
+        run_simulation(dut, test_dds_rate(dut), vcd_name="dds_test.vcd")
+
+    def commit(self):
+
+        dut = TriggerTarget('sim', tick_period=2)
+        run_simulation(dut, test_commit(dut), vcd_name="commit_test.vcd")
+
+    def capabilities(self):
+
+        for options, expected in [(dict(), 0b111), (dict(prescalers=False, dds=False, shadow=False), 0b000), 
+                                  (dict(dds=False), 0b101)]:
+            dut = TriggerTarget('sim', tick_period=2, **options)
+            run_simulation(dut, test_capabilities(dut, expected))
+
+    def pll(self):
+
+        ## The fast domain runs at 4x the system clock, as the PLL does on hardware
+        dut = TriggerTarget('sim', tick_period=4, pll=True)
+        run_simulation(dut, dict(fast=test_fine_delay(dut)), clocks=dict(sys=8, fast=2), vcd_name="pll_test.vcd")
+
 if __name__ == "__main__":
 
     if len(sys.argv) > 1:
         if sys.argv[1] == 'sim':
             sim = SimpleTests()
             sim.trigger()
+            sim.prescaler()
+            sim.dds()
+            sim.commit()
+            sim.capabilities()
+            sim.pll()
 
         elif sys.argv[1] == 'ice':
+            ## 'wide' builds 16-bit Trigger Interval, Duration and Delay registers
+            ## 'pll' runs the triggers from the 48 MHz PLL clock, with Fine Delay registers
             platform = TriggerPlatform()
-            target = TriggerTarget(platform)
+            target = TriggerTarget(platform, timing_width=16 if 'wide' in sys.argv else 8, pll='pll' in sys.argv)
             
-            if len(sys.argv) > 2 and sys.argv[2] == 'flash':
+            if 'flash' in sys.argv[2:]:
                 platform.build(target, do_program=True)
             else:
                 platform.build(target)
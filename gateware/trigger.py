@@ -1,4 +1,5 @@
 from migen import *
+from migen.genlib.cdc import MultiReg, PulseSynchronizer
 
 class IdentRegisters(Module):
 
@@ -47,6 +48,10 @@ class Divider(Module):
         self.clock = Signal()
         self.strobe = Signal()
 
+        ## High in the cycle before our strobe, so other dividers can start in phase with it
+        self.next = Signal()
+        self.comb += self.next.eq(strobe & (counter == 0))
+
         self.sync += If(strobe,
             If(counter == 0,
                 self.clock.eq(~self.clock),
@@ -61,14 +66,196 @@ class Divider(Module):
         ## is 1 system clock long, instead of length of paree
         self.sync += If(self.strobe, self.strobe.eq(0))
 
+class Prescaler(Module):
+    """
+    Divides ``tick`` by ``period`` while ``enable`` is set.  Counting starts in phase with a
+    reference divider : the first strobe after enabling coincides with the reference's next
+    strobe, so every prescaler enabled at the same time (and the reference itself) stays aligned.
+    """
+    def __init__(self, tick, reference, enable, period):
+        counter = Signal.like(period)
+        armed   = Signal()
+
+        self.strobe = Signal()
+
+        self.sync += [
+            self.strobe.eq(0),
+            If(~enable,
+                armed.eq(0)
+            ).Elif(tick,
+                If(armed,
+                    If(counter == 0,
+                        self.strobe.eq(1),
+                        counter.eq(period - 1),
+                    ).Else(
+                        counter.eq(counter - 1),
+                    )
+                ).Elif(reference,
+                    armed.eq(1),
+                    self.strobe.eq(1),
+                    counter.eq(period - 1),
+                )
+            )
+        ]
+
+class StrobeDelay(Module):
+    """
+    Delays single cycle strobes by ``delay`` cycles (plus one register stage).  A strobe
+    arriving while the previous one is still being delayed restarts the count, so ``delay``
+    must be shorter than the strobe period.
+    """
+    def __init__(self, strobe, delay):
+        counter = Signal.like(delay)
+        pending = Signal()
+
+        self.strobe = Signal()
+
+        self.sync += [
+            self.strobe.eq(0),
+            If(strobe,
+                If(delay == 0,
+                    self.strobe.eq(1),
+                ).Else(
+                    counter.eq(delay - 1),
+                    pending.eq(1),
+                )
+            ).Elif(pending,
+                If(counter == 0,
+                    self.strobe.eq(1),
+                    pending.eq(0),
+                ).Else(
+                    counter.eq(counter - 1),
+                )
+            )
+        ]
+
+class WordSynchronizer(Module):
+    """
+    Carries a multi-bit value from the sys domain into ``domain``.  The bits are resynchronized
+    individually, which can tear a word for one cycle while it changes, so the output only follows
+    once two consecutive samples agree.  Register values are held far longer than that.
+    Unlike BusSynchronizer, the output starts at the reset value of the input.
+    """
+    def __init__(self, i, domain):
+        self.o = Signal.like(i)
+
+        sampled  = Signal.like(i)
+        previous = Signal.like(i, reset_less=True)
+        sync = getattr(self.sync, domain)
+
+        self.specials += MultiReg(i, sampled, domain, reset=i.reset)
+        sync += [
+            previous.eq(sampled),
+            If(sampled == previous, self.o.eq(sampled)),
+        ]
+
+def synchronize(module, signals, domain):
+    """
+    Copies of the sys domain ``signals`` in ``domain``.  They are transferred together as
+    one word, so a multibyte register is never seen half-updated on the other side.
+    """
+    reset, width = 0, 0
+    for s in signals:
+        reset |= s.reset.value << width
+        width += len(s)
+
+    word = Signal(width, reset=reset)
+    copies = [Signal.like(s) for s in signals]
+
+    sync = WordSynchronizer(word, domain)
+    module.submodules += sync
+    module.comb += [
+        word.eq(Cat(*signals)),
+        Cat(*copies).eq(sync.o),
+    ]
+
+    return copies
+
+class DoubleBuffer(Module):
+    """
+    Live copies of the register ``values``.  They pass the registers straight through while
+    ``hold`` is clear; while it is set they keep their values (the registers acting as a shadow)
+    until ``load`` copies every one of them across in the same cycle.
+    """
+    def __init__(self, values, hold, load):
+        self.live = [Signal.like(value) for value in values]
+
+        for live, value in zip(self.live, values):
+            held = Signal.like(value)
+
+            self.sync += If(~hold | load, held.eq(value))
+            self.comb += live.eq(Mux(hold, held, value))
+
+class CommitControl(Module):
+    """
+    Shadow Hold and Commit registers, each a mask of the 4 triggers (first byte) and the 8 + 8
+    crossbar outputs (bank A, then bank B).  While a Hold bit is set, writes to the timing
+    registers of that trigger, or to the crossbar register of that output, only reach the shadow.
+    Writing a Commit mask makes the shadows of those triggers and outputs live together, on the
+    first ``strobe`` after the I2C transaction has ended.  The Commit register then reads zero.
+
+    ``hold`` and ``load`` are bit masks in the counting ``domain``, that of ``strobe``.
+    """
+    def __init__(self, registers, idle, strobe, hold_addr, commit_addr, domain=None):
+        reg_hold, _   = registers.create("Shadow Hold", 3, addr=hold_addr)
+        reg_commit, _ = registers.create("Commit", 3, addr=commit_addr)
+
+        width = 8 * len(reg_commit)
+
+        self.hold = Signal(width)
+        self.load = Signal(width)
+
+        ## A commit written in an I2C transaction only counts once that transaction has ended
+        hold      = Signal(width)
+        requested = Signal(width)
+        self.comb += [
+            hold.eq(Cat(*reg_hold)),
+            requested.eq(Mux(idle, Cat(*reg_commit), 0)),
+        ]
+
+        if domain is None:
+            sync = self.sync
+        else:
+            sync = getattr(self.sync, domain)
+            hold, requested = synchronize(self, [hold, requested], domain)
+
+        applied = Signal()
+        apply   = Signal()
+
+        self.comb += [
+            self.hold.eq(hold),
+            apply.eq(strobe & (requested != 0) & ~applied),
+            self.load.eq(Mux(apply, requested, 0)),
+        ]
+
+        ## Apply each request once, even while the cleared register is on its way back
+        sync += If(apply,
+            applied.eq(1)
+        ).Elif(requested == 0,
+            applied.eq(0)
+        )
+
+        if domain is None:
+            done = apply
+        else:
+            self.submodules.done = PulseSynchronizer(domain, "sys")
+            self.comb += self.done.i.eq(apply)
+            done = self.done.o
+
+        self.sync += If(done, [reg.eq(0) for reg in reg_commit])
+
 TRIG_MODE = dict(
     stop = 0x00,
     idle = 0x01,
     interval = 0x02,
     oneshot = 0x03,
-    constant = 0x04
+    constant = 0x04,
+    dds = 0x05
 )
 
+## Width of the phase accumulator, and of the tuning word, of the DDS trigger mode
+TUNING_WIDTH = 32
+
 TRIG_STATE = dict(
     off = 0x00,
     init = 0x01,
@@ -78,13 +265,14 @@ TRIG_STATE = dict(
 
 class Trigger(Module):
 
-    def __init__(self, strobe, enable, width=8):
+    def __init__(self, strobe, enable, width=8, dds=False):
     
         self.trigger  = Signal()
         self.mode     = Signal(width)
         self.interval = Signal(width)
         self.duration = Signal(width)
         self.phase    = Signal(width)
+        self.tuning   = Signal(TUNING_WIDTH)
 
         trigger_state = Signal(max=max(TRIG_STATE.values()))
 
@@ -93,6 +281,33 @@ class Trigger(Module):
         phase_counter    = Signal(width)
 
         return_mode = Signal(width)
+
+        ## DDS mode adds the tuning word to a phase accumulator on every strobe and starts the
+        ## trigger when it overflows, giving an average rate of strobe * tuning / 2^32.  Each edge
+        ## is within one strobe of its ideal time.  The accumulator restarts full, so the first
+        ## trigger happens on the first strobe (as in interval mode).
+        modes = dict()
+
+        if dds:
+            accumulator = Signal(TUNING_WIDTH, reset=(1 << TUNING_WIDTH) - 1)
+            accumulated = Signal(TUNING_WIDTH + 1)
+            self.comb += accumulated.eq(accumulator + self.tuning)
+
+            modes[TRIG_MODE['dds']] = [
+                If(self.duration != 0,
+                    If(self.tuning != 0,
+                        accumulator.eq(accumulated[:TUNING_WIDTH]),
+                        If(accumulated[TUNING_WIDTH],
+                            duration_counter.eq(self.duration-1),   # Setup the trigger duration
+                            trigger_state.eq(TRIG_STATE['init']),   # Start the trigger
+                        )
+                    )
+                )
+            ]
+
+            self.sync += If(~enable | (self.mode == TRIG_MODE['stop']),
+                accumulator.eq(accumulator.reset)
+            )
         
         self.sync += If(enable,
             If(strobe,
@@ -135,7 +350,9 @@ class Trigger(Module):
                         If(trigger_state == TRIG_STATE['off'], 
                             trigger_state.eq(TRIG_STATE['init'])
                         )
-                    ]
+                    ],
+
+                    **modes
 
                 }).makedefault(TRIG_MODE['idle'])
             )
@@ -195,35 +412,102 @@ class Trigger(Module):
 
 class TriggerController(Module):
 
-    def __init__(self, idx, baseaddr, registers, strobe, enable):
-        self.submodules.trigger = Trigger(strobe, enable)
+    def __init__(self, idx, baseaddr, registers, strobe, enable, width=8, tick=None, reference=None,
+                 domain=None, fine_addr=None, tuning_addr=None, hold=None, load=None):
 
-        self.modes = TRIG_MODE
+        ## Interval, Duration and Delay are width/8 bytes each, little endian, following the
+        ## Mode register.  Multibyte values are updated atomically at the end of the I2C write.
+        length = width // 8
+
+        if width % 8 != 0 or 1 + 3 * length > 8:
+            raise ValueError("Trigger registers must be 8 or 16 bits wide, not {}".format(width))
 
-        ## TODO : support register widths != 8 bits
         reg_mode, _     = registers.create("Trigger{} Mode".format(idx), addr=baseaddr)
-        reg_interval, _ = registers.create("Trigger{} Interval".format(idx), addr=baseaddr+1)
-        reg_duration, _ = registers.create("Trigger{} Duration".format(idx), addr=baseaddr+2)
-        reg_phase, _    = registers.create("Trigger{} Delay".format(idx), addr=baseaddr+3)
+        reg_interval, _ = registers.create("Trigger{} Interval".format(idx), length, atomic=True, addr=baseaddr+1)
+        reg_duration, _ = registers.create("Trigger{} Duration".format(idx), length, atomic=True, addr=baseaddr+1+length)
+        reg_phase, _    = registers.create("Trigger{} Delay".format(idx), length, atomic=True, addr=baseaddr+1+2*length)
+
+        values = dict(mode=reg_mode, interval=reg_interval, duration=reg_duration, phase=reg_phase)
+
+        ## With a tick (and the reference divider's ``next``), the trigger gets its own Prescaler
+        ## register.  A non-zero value divides the tick for this trigger alone, zero keeps the 
+        ## shared strobe.
+        if tick is not None:
+            reg_prescaler, _ = registers.create("Trigger{} Prescaler".format(idx), addr=baseaddr+7)
+            values["prescaler"] = reg_prescaler
+
+        ## A Fine Delay register shifts every edge of the trigger by a number of counting clock
+        ## cycles, for phase control below the resolution of the strobe
+        if fine_addr is not None:
+            reg_fine, _ = registers.create("Trigger{} Fine Delay".format(idx), 2, atomic=True, addr=fine_addr)
+            values["fine"] = reg_fine
+
+        ## A Tuning register, the frequency tuning word of the DDS trigger mode
+        if tuning_addr is not None:
+            reg_tuning, _ = registers.create("Trigger{} Tuning".format(idx), TUNING_WIDTH // 8, atomic=True, addr=tuning_addr)
+            values["tuning"] = reg_tuning
+
+        ## Counting can run in a faster clock domain than the registers.  The strobe, tick,
+        ## reference and enable must then already be in that domain.
+        if domain is None:
+            counting = lambda module: module
+        else:
+            counting = ClockDomainsRenamer(domain)
+            values = dict(zip(values.keys(), synchronize(self, list(values.values()), domain)))
+
+        ## With ``hold`` and ``load`` (in the counting domain) everything but the mode is double
+        ## buffered : see CommitControl
+        if hold is not None:
+            names = [name for name in values.keys() if name != "mode"]
+            self.submodules.shadow = counting(DoubleBuffer([values[name] for name in names], hold, load))
+            values.update(zip(names, self.shadow.live))
+
+        if tick is not None:
+            self.submodules.prescaler = counting(Prescaler(tick, reference, enable, values["prescaler"]))
+
+            shared = strobe
+            strobe = Signal()
+            self.comb += strobe.eq(Mux(values["prescaler"] == 0, shared, self.prescaler.strobe))
+
+        if fine_addr is not None:
+            self.submodules.fine = counting(StrobeDelay(strobe, values["fine"]))
+            strobe = self.fine.strobe
+
+        self.submodules.trigger = counting(Trigger(strobe, enable, width=width, dds=tuning_addr is not None))
+
+        self.modes = TRIG_MODE
 
         self.comb += [
-            self.trigger.mode.eq(reg_mode),
-            self.trigger.interval.eq(reg_interval),
-            self.trigger.duration.eq(reg_duration),
-            self.trigger.phase.eq(reg_phase),
+            self.trigger.mode.eq(values["mode"]),
+            self.trigger.interval.eq(values["interval"]),
+            self.trigger.duration.eq(values["duration"]),
+            self.trigger.phase.eq(values["phase"]),
         ]
 
+        if tuning_addr is not None:
+            self.comb += self.trigger.tuning.eq(values["tuning"])
+
+        if domain is None:
+            started = strobe
+            output = self.trigger.trigger
+        else:
+            ## The strobe is in the counting domain, so follow the synchronized trigger output
+            ## instead.  The mode register has settled long before the next strobe.
+            started = 1
+            output = Signal()
+            self.specials += MultiReg(self.trigger.trigger, output)
+
         self.sync += [
-            If(strobe,
+            If(started,
                 ## We've started the trigger, can now return to IDLE mode
                 If(reg_mode == TRIG_MODE['oneshot'],
-                    If(self.trigger.trigger == 1,
+                    If(output == 1,
                         reg_mode.eq(TRIG_MODE['idle']) 
                     )
                 ),
                 ## We're IDLE and trigger has stopped, go to STOP
                 If(reg_mode == TRIG_MODE['idle'],
-                    If(self.trigger.trigger == 0,
+                    If(output == 0,
                         reg_mode.eq(TRIG_MODE['stop'])
                     )
                 )
@@ -0,0 +1,332 @@
+import asyncio
+import concurrent.futures
+
+from trigger_controller import TriggerController
+
+
+class _Request:
+    __slots__ = ("kind", "key", "func", "futures")
+
+    def __init__(self, kind, key, func):
+        self.kind = kind
+        self.key = key
+        self.func = func
+        self.futures = []
+
+
+class AsyncTrigger:
+
+    def __init__(self, ctrl, index):
+        self._ctrl = ctrl
+        self.index = index
+
+    def _get(self, attr):
+        return self._ctrl._read(("trigger", self.index, attr), lambda ctrl: getattr(ctrl.trigger(self.index), attr))
+
+    def _set(self, attr, value):
+        return self._ctrl._write(lambda ctrl: setattr(ctrl.trigger(self.index), attr, value))
+
+    async def mode(self):
+        return await self._get("mode")
+
+    async def set_mode(self, name):
+        await self._set("mode", name)
+
+    async def interval(self):
+        return await self._get("interval")
+
+    async def set_interval(self, value):
+        await self._set("interval", value)
+
+    async def duration(self):
+        return await self._get("duration")
+
+    async def set_duration(self, value):
+        await self._set("duration", value)
+
+    async def delay(self):
+        return await self._get("delay")
+
+    async def set_delay(self, value):
+        await self._set("delay", value)
+
+    async def prescaler(self):
+        return await self._get("prescaler")
+
+    async def set_prescaler(self, value):
+        await self._set("prescaler", value)
+
+    async def fine_delay(self):
+        return await self._get("fine_delay")
+
+    async def set_fine_delay(self, value):
+        await self._set("fine_delay", value)
+
+    async def rate(self):
+        return await self._get("rate")
+
+    async def set_rate(self, value):
+        await self._set("rate", value)
+
+
+class AsyncPin:
+
+    def __init__(self, ctrl, name):
+        self._ctrl = ctrl
+        self.name = name
+
+    def _get(self, attr):
+        return self._ctrl._read(("pin", self.name, attr), lambda ctrl: getattr(ctrl.pin(self.name), attr))
+
+    def _set(self, attr, value):
+        return self._ctrl._write(lambda ctrl: setattr(ctrl.pin(self.name), attr, value))
+
+    async def reset(self):
+        await self._ctrl._write(lambda ctrl: ctrl.pin(self.name).reset())
+
+    async def enable(self):
+        return await self._get("enable")
+
+    async def set_enable(self, value):
+        await self._set("enable", value)
+
+    async def default(self):
+        return await self._get("default")
+
+    async def set_default(self, value):
+        await self._set("default", value)
+
+    async def invert(self):
+        return await self._get("invert")
+
+    async def set_invert(self, value):
+        await self._set("invert", value)
+
+    async def trigger(self):
+        return await self._get("trigger")
+
+    async def set_trigger(self, value):
+        await self._set("trigger", value)
+
+    async def inverted_trigger(self):
+        return await self._get("inverted_trigger")
+
+    async def set_inverted_trigger(self, value):
+        await self._set("inverted_trigger", value)
+
+
+class AsyncTriggerController:
+    """
+    asyncio front-end for TriggerController.
+
+    All bus access runs on one dedicated I/O worker thread, so the event loop never blocks on
+    an ioctl and accesses from concurrent coroutines are serialized.  Requests made during the
+    same event loop iteration are handed to the worker together : consecutive writes are
+    issued as one batched transaction, and identical reads share a single bus access.
+
+        async with AsyncTriggerController() as ctrl:
+            await ctrl.trigger(0).set_interval(20)
+            await ctrl.enable(mask=1)
+
+    The synchronous controller is created on the worker on first use.  ``bus`` is passed
+    through to it, so a BusSession with a FakeDevice backend runs it without hardware.
+    """
+
+    def __init__(self, bus=None):
+        self._bus = bus
+        self._sync = None
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="trigger-io")
+        self._queue = []
+        self._scheduled = False
+        self._inflight = 0
+
+        self._triggers = dict()
+        self._pins = dict()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close)
+        self._executor.shutdown()
+
+    def _close(self):
+        if self._sync is not None:
+            self._sync.close()
+
+    def _controller(self):
+        if self._sync is None:
+            self._sync = TriggerController(self._bus)
+
+        return self._sync
+
+    def _submit(self, kind, key, func):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        ## Coalesce with an identical read already waiting for the worker, as long as no write
+        ## has been queued after it
+        request = None
+        if kind == "read" and key is not None:
+            for queued in reversed(self._queue):
+                if queued.kind != "read":
+                    break
+                if queued.key == key:
+                    request = queued
+                    break
+
+        if request is None:
+            request = _Request(kind, key, func)
+            self._queue.append(request)
+
+        request.futures.append(future)
+
+        if not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(self._drain, loop)
+
+        return future
+
+    def _read(self, key, func):
+        return self._submit("read", key, func)
+
+    def _write(self, func):
+        return self._submit("write", None, func)
+
+    def _drain(self, loop):
+        requests, self._queue = self._queue, []
+        self._scheduled = False
+
+        self._inflight += 1
+        job = loop.run_in_executor(self._executor, self._run, requests)
+        job.add_done_callback(lambda job: self._complete(requests, job))
+
+    def _run(self, requests):
+        ## Executes on the worker thread.  Returns a (result, exception) pair per request.
+        results = []
+        ctrl = self._controller()
+
+        idx = 0
+        while idx < len(requests):
+            if requests[idx].kind == "write":
+                ## Group a run of writes into one bus transaction
+                end = idx
+                while end < len(requests) and requests[end].kind == "write":
+                    end += 1
+
+                run = []
+                try:
+                    with ctrl.batch():
+                        for request in requests[idx:end]:
+                            ## A failed request's own queued writes are dropped, not flushed
+                            try:
+                                with ctrl.bus.savepoint():
+                                    run.append((request.func(ctrl), None))
+                            except Exception as exc:
+                                run.append((None, exc))
+                except Exception as exc:
+                    ## The flush itself failed, so none of the writes can be reported as done
+                    run = [(None, exc)] * (end - idx)
+
+                results.extend(run)
+                idx = end
+
+            else:
+                try:
+                    results.append((requests[idx].func(ctrl), None))
+                except Exception as exc:
+                    results.append((None, exc))
+                idx += 1
+
+        return results
+
+    def _complete(self, requests, job):
+        self._inflight -= 1
+
+        if job.exception() is not None:
+            results = [(None, job.exception())] * len(requests)
+        else:
+            results = job.result()
+
+        for request, (result, exc) in zip(requests, results):
+            for future in request.futures:
+                if future.cancelled():
+                    continue
+                if exc is not None:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(result)
+
+    @property
+    def idle(self):
+        """True when no request is queued for, or being handled by, the worker"""
+        return len(self._queue) == 0 and self._inflight == 0
+
+    def shadow(self, address, length=1):
+        """
+        Return register values straight from the shadow registers, without involving the
+        worker, or None if any of them isn't cached or the worker has requests outstanding
+        (whose effects the shadow copy may not reflect yet).
+        """
+        if self._sync is None or not self.idle:
+            return None
+
+        cache = self._sync.cache
+        if not all(cache.cached(address+idx) for idx in range(length)):
+            return None
+
+        values = [cache.get(address+idx) for idx in range(length)]
+
+        if length == 1:
+            return values[0]
+        return bytearray(values)
+
+    async def read_register(self, address, length=1):
+        return await self._read(("register", address, length), lambda ctrl: ctrl.bus.read_register(address, length))
+
+    async def write_register(self, address, value):
+        await self._write(lambda ctrl: ctrl.bus.write_register(address, value))
+
+    async def call(self, func, write=True):
+        """
+        Run func(ctrl) on the worker with the synchronous controller.  Writes made by func
+        are batched with neighbouring write requests.
+        """
+        if write:
+            return await self._write(func)
+        return await self._submit("read", None, func)
+
+    async def ident(self):
+        return await self._read(("ident",), lambda ctrl: ctrl.ident())
+
+    def trigger(self, index):
+        if index not in self._triggers.keys():
+            self._triggers[index] = AsyncTrigger(self, index)
+
+        return self._triggers[index]
+
+    def pin(self, name):
+        if name not in self._pins.keys():
+            self._pins[name] = AsyncPin(self, name)
+
+        return self._pins[name]
+
+    async def enables(self):
+        return await self._read(("enables",), lambda ctrl: ctrl.enables)
+
+    async def enable(self, mask=0xFF):
+        await self._write(lambda ctrl: ctrl.enable(mask))
+
+    async def disable(self):
+        await self._write(lambda ctrl: ctrl.disable())
+
+    async def clock_divider(self):
+        return await self._read(("clock_divider",), lambda ctrl: ctrl.clock_divider)
+
+    async def set_clock_divider(self, value):
+        await self._write(lambda ctrl: setattr(ctrl, "clock_divider", value))
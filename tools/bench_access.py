@@ -0,0 +1,63 @@
+import logging
+import time
+
+from smbus2 import i2c_msg
+from smbus2.smbus2 import i2c_rdwr_ioctl_data
+
+from trigger_controller import BusSession, DEVICE_ADDRESS, _REG_CLOCK_DIVIDER, _REG_POWER_SENSE
+from fake_device import FakeDevice
+
+logger = logging.getLogger("trigger_controller")
+
+
+def legacy_write(rdwr, address, value):
+    ## Register write as originally implemented : fresh messages and an eager debug string
+    logger.debug("W " + hex(address) + " " + "".join("{:02x}".format(x) for x in [value]))
+
+    msg_set = i2c_msg.write(DEVICE_ADDRESS, [address, value])
+    rdwr(i2c_rdwr_ioctl_data.create(msg_set))
+
+
+def legacy_read(rdwr, address):
+    result = []
+    tmp = bytearray(1)
+
+    msg_set = i2c_msg.write(DEVICE_ADDRESS, [address])
+    msg_get = i2c_msg.read(DEVICE_ADDRESS, 1)
+    rdwr(i2c_rdwr_ioctl_data.create(msg_set, msg_get))
+
+    result.append(list(msg_get)[0])
+
+    logger.debug("R " + hex(address) + " " + "".join("{:02x}".format(x) for x in result))
+
+    return result[0]
+
+
+def cpu_time(func, count):
+    start = time.process_time()
+    for _ in range(count):
+        func()
+    return (time.process_time() - start) / count
+
+
+def main(count=100000):
+    device = FakeDevice()
+    bus = BusSession(backend=device)
+
+    ## Power Sense is never cached, so every fast path read reaches the (fake) device
+    rows = [
+        ("write", 
+            cpu_time(lambda: legacy_write(device.rdwr, _REG_CLOCK_DIVIDER, 10), count), 
+            cpu_time(lambda: bus.write_register(_REG_CLOCK_DIVIDER, 10), count)),
+        ("read", 
+            cpu_time(lambda: legacy_read(device.rdwr, _REG_POWER_SENSE), count), 
+            cpu_time(lambda: bus.read_register(_REG_POWER_SENSE), count)),
+    ]
+
+    print("{:8} {:>12} {:>12}".format("access", "legacy (us)", "fast (us)"))
+    for name, legacy, fast in rows:
+        print("{:8} {:12.2f} {:12.2f}".format(name, legacy * 1e6, fast * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import json
+import platform
+import sys
+import time
+
+from trigger_controller import BusSession, TriggerController, LinuxBackend, I2CBUS, _REG_CLOCK_DIVIDER, _REG_POWER_SENSE
+from fake_device import FakeDevice
+
+
+PERCENTILES = [50, 90, 99, 99.9]
+
+
+def percentile(ordered, pct):
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def measure(func, count, warmup):
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    start = time.perf_counter_ns()
+
+    for _ in range(count):
+        t0 = time.perf_counter_ns()
+        func()
+        samples.append(time.perf_counter_ns() - t0)
+
+    elapsed = (time.perf_counter_ns() - start) / 1e9
+    samples.sort()
+
+    result = dict(
+        count = count,
+        ops_per_sec = count / elapsed,
+        mean_us = sum(samples) / len(samples) / 1e3,
+        min_us = samples[0] / 1e3,
+        max_us = samples[-1] / 1e3,
+    )
+
+    for pct in PERCENTILES:
+        result["p{}_us".format(pct)] = percentile(samples, pct) / 1e3
+
+    return result
+
+
+def workloads(ctrl):
+    """
+    Driver operations to benchmark, as a name -> callable mapping.  Every operation reaches
+    the device : configure alternates between two configurations, and reads use Power Sense
+    (never cached) or invalidate the shadow registers first.
+    """
+    bus = ctrl.bus
+    state = dict(flip=False)
+
+    def write():
+        bus.write_register(_REG_CLOCK_DIVIDER, 10)
+
+    def read():
+        bus.read_register(_REG_POWER_SENSE)
+
+    def read_cached():
+        return ctrl.clock_divider
+
+    def ident():
+        bus.cache.invalidate()
+        ctrl.ident()
+
+    def configure():
+        state['flip'] = not state['flip']
+        offset = 1 if state['flip'] else 0
+
+        with ctrl.batch():
+            ctrl.clock_divider = 10 + offset
+            for idx in range(4):
+                trigger = ctrl.trigger(idx)
+                trigger.interval = 33 + offset
+                trigger.duration = 5 + offset
+                trigger.delay = idx + offset
+                trigger.mode = "interval"
+            for bank in "AB":
+                for idx in range(8):
+                    ctrl.pin("{}{}".format(bank, idx)).trigger = (idx + offset) % 4
+
+    def start_stop():
+        with ctrl.batch():
+            for idx in range(4):
+                ctrl.trigger(idx).mode = "interval"
+            ctrl.enable(mask=0x0F)
+
+        with ctrl.batch():
+            ctrl.disable()
+            for idx in range(4):
+                ctrl.trigger(idx).mode = "stop"
+
+    return dict(
+        write = write,
+        read = read,
+        read_cached = read_cached,
+        ident = ident,
+        configure = configure,
+        start_stop = start_stop,
+    )
+
+
+def run(ctrl, count, warmup, only=None):
+    results = dict()
+
+    for name, func in workloads(ctrl).items():
+        if only and name not in only:
+            continue
+
+        results[name] = measure(func, count, warmup)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return the workloads whose p50 or p99 latency regressed by more than ``tolerance``
+    (a fraction) against ``baseline``.
+    """
+    regressions = []
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        for key in ["p50_us", "p99_us"]:
+            before, after = baseline[name][key], result[key]
+
+            if after > before * (1 + tolerance):
+                regressions.append((name, key, before, after))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the trigger controller host driver")
+    parser.add_argument("--hardware", action="store_true", help="run against the board instead of a fake device")
+    parser.add_argument("--bus", type=int, default=I2CBUS, help="I2C bus number of the board")
+    parser.add_argument("--count", type=int, default=10000, help="measured iterations per workload")
+    parser.add_argument("--warmup", type=int, default=100, help="unmeasured iterations per workload")
+    parser.add_argument("--only", nargs="*", help="workloads to run (default : all)")
+    parser.add_argument("--output", help="write JSON results to this file (default : stdout)")
+    parser.add_argument("--baseline", help="JSON results to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed latency regression (fraction)")
+    args = parser.parse_args()
+
+    if args.hardware:
+        backend = LinuxBackend(args.bus)
+    else:
+        backend = FakeDevice()
+
+    ## The controller doesn't own a session it is given, so close the session (and with it
+    ## the device node) here
+    with BusSession(backend=backend) as bus:
+        results = run(TriggerController(bus), args.count, args.warmup, args.only)
+
+    report = dict(
+        backend = type(backend).__name__,
+        python = platform.python_version(),
+        machine = platform.machine(),
+        timestamp = time.time(),
+        results = results,
+    )
+
+    output = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+        regressions = compare(results, baseline, args.tolerance)
+
+        for name, key, before, after in regressions:
+            print("REGRESSION {} {} : {:.2f} us -> {:.2f} us".format(name, key, before, after), file=sys.stderr)
+
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
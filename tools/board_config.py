@@ -0,0 +1,338 @@
+import json
+import sys
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+from trigger_controller import (
+    TriggerController, Pin, TRIG_MODE, TICK_HZ, set_bit, clear_bit, trigger_offsets, tuning_word, shadow_bit,
+    _REG_CLOCK_DIVIDER, _REG_POWER_CONTROL, _REG_TRIGGER_ENABLES, _REG_CROSSBAR_A0, _REG_CROSSBAR_B0,
+    _REG_TRIGGER0_MODE, _REG_TRIGGER1_MODE, _REG_TRIGGER0_PRESCALER, _REG_TRIGGER0_FINE_DELAY,
+    _REG_TRIGGER0_TUNING,
+)
+
+TRIGGER_COUNT = 4
+PIN_COUNT = 8
+
+## Timing registers of a trigger, in the order they are written; the mode follows them
+TRIGGER_FIELDS = ["prescaler", "fine_delay", "interval", "duration", "delay", "rate", "mode"]
+
+## Widest trigger timing registers the gateware can be built with
+MAX_TIMING_WIDTH = 16
+
+PIN_BITS = dict(
+    enable = Pin.ENABLE_BIT,
+    default = Pin.DEFAULT_BIT,
+    invert = Pin.INVERT_BIT,
+)
+
+
+def _byte(value, what):
+    if not isinstance(value, int) or value < 0 or value > 0xFF:
+        raise ValueError("{} must be an integer between 0 and 255, not {!r}".format(what, value))
+    return value
+
+
+def _timing(value, what, width=MAX_TIMING_WIDTH):
+    if not isinstance(value, int) or value < 0 or value >= (1 << width):
+        raise ValueError("{} must be an integer between 0 and {}, not {!r}".format(what, (1 << width) - 1, value))
+    return value
+
+
+def _pin_address(name):
+    if len(name) != 2 or name[0] not in "AB" or not name[1].isdigit() or int(name[1]) >= PIN_COUNT:
+        raise ValueError("Unknown crossbar pin '{}'".format(name))
+
+    if name[0] == 'A':
+        return _REG_CROSSBAR_A0 + int(name[1])
+    else:
+        return _REG_CROSSBAR_B0 + int(name[1])
+
+
+class BoardConfig:
+    """
+    Desired state of the trigger board, as loaded from a JSON or TOML description :
+
+        clock_divider = 10
+        power = 3
+        enables = [0, 1]
+
+        [triggers.0]
+        mode = "interval"
+        interval = 33
+        duration = 5
+        delay = 0
+        prescaler = 0
+        fine_delay = 0
+
+        [triggers.1]
+        mode = "dds"
+        rate = 29.97
+        duration = 5
+
+        [pins.A0]
+        trigger = 0
+        invert = false
+
+    Every key is optional; registers which are not mentioned are left as they are.  A pin's
+    ``trigger`` routes it to that trigger and enables the output (as Pin.trigger does), while
+    ``enable``, ``default`` and ``invert`` set the individual bits.  ``enables`` is either a
+    bit mask or a list of trigger indices.  A non-zero trigger ``prescaler`` (gateware
+    revision 4 and later) runs that trigger off its own tick divider instead of clock_divider.
+    ``fine_delay`` (16 bits, in cycles of the fine clock) needs gateware built with the PLL.
+    ``rate`` (Hz) sets the tuning word of the "dds" mode (gateware revision 6 and later) for
+    the trigger's strobe, taken from its prescaler or the clock divider.
+
+    On gateware with Shadow Hold and Commit registers (revision 7 and later) the new trigger
+    timing and crossbar settings are staged and committed together, so they all take effect on
+    the same Clock Divider strobe.
+
+    Note that a trigger in "oneshot" mode fires again whenever the config is applied after the
+    gateware has returned that trigger to stop.
+    """
+
+    def __init__(self, clock_divider=None, power=None, enables=None, triggers=None, pins=None):
+        self.clock_divider = clock_divider
+        self.power = power
+        self.enables = enables
+        self.triggers = triggers or dict()
+        self.pins = pins or dict()
+
+        self._validate()
+
+    @classmethod
+    def from_dict(cls, data):
+        unknown = set(data.keys()) - set(["clock_divider", "power", "enables", "triggers", "pins"])
+        if len(unknown) > 0:
+            raise ValueError("Unknown config keys : {}".format(", ".join(sorted(unknown))))
+
+        triggers = {int(idx): dict(fields) for idx, fields in data.get("triggers", dict()).items()}
+        pins = {name: dict(fields) for name, fields in data.get("pins", dict()).items()}
+
+        return cls(data.get("clock_divider"), data.get("power"), data.get("enables"), triggers, pins)
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith(".toml"):
+            if tomllib is None:
+                raise RuntimeError("Loading TOML configs requires Python 3.11 or later")
+
+            with open(path, "rb") as f:
+                return cls.from_dict(tomllib.load(f))
+
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def _validate(self):
+        if self.clock_divider is not None:
+            _byte(self.clock_divider, "clock_divider")
+            if self.clock_divider == 0:
+                raise ValueError("clock_divider must be non-zero")
+
+        if self.power is not None:
+            _byte(self.power, "power")
+
+        if isinstance(self.enables, list):
+            mask = 0
+            for idx in self.enables:
+                if idx not in range(TRIGGER_COUNT):
+                    raise ValueError("Unknown trigger {!r} in enables".format(idx))
+                mask = set_bit(mask, idx)
+            self.enables = mask
+        elif self.enables is not None:
+            _byte(self.enables, "enables")
+
+        for idx, fields in self.triggers.items():
+            if idx not in range(TRIGGER_COUNT):
+                raise ValueError("Unknown trigger {!r}".format(idx))
+
+            for field, value in fields.items():
+                if field not in TRIGGER_FIELDS:
+                    raise ValueError("Unknown trigger field '{}'".format(field))
+                if field == "mode":
+                    if value not in TRIG_MODE:
+                        raise ValueError("Unknown trigger mode '{}'".format(value))
+                elif field == "prescaler":
+                    _byte(value, "Trigger{} prescaler".format(idx))
+                elif field == "fine_delay":
+                    _timing(value, "Trigger{} fine_delay".format(idx), 16)
+                elif field == "rate":
+                    if not isinstance(value, (int, float)) or value <= 0:
+                        raise ValueError("Trigger{} rate must be a positive number of Hz, not {!r}".format(idx, value))
+                else:
+                    _timing(value, "Trigger{} {}".format(idx, field))
+
+        for name, fields in self.pins.items():
+            _pin_address(name)
+
+            for field, value in fields.items():
+                if field == "trigger":
+                    if value not in range(TRIGGER_COUNT):
+                        raise ValueError("Pin {} routed to unknown trigger {!r}".format(name, value))
+                elif field not in PIN_BITS:
+                    raise ValueError("Unknown pin field '{}'".format(field))
+
+    def registers(self, read, width=8):
+        """
+        Desired register values, as an ordered list of (address, value).
+
+        ``read`` returns the current value of a register; it is used to merge pin settings
+        with the bits the config doesn't mention.  ``width`` is the width of the board's
+        trigger timing registers; wider values become one entry per byte.  Within a trigger
+        the timing registers come before the mode, and Trigger Enables comes last.
+        """
+        offsets = trigger_offsets(width)
+        desired = []
+
+        if self.clock_divider is not None:
+            desired.append((_REG_CLOCK_DIVIDER, self.clock_divider))
+
+        if self.power is not None:
+            desired.append((_REG_POWER_CONTROL, self.power))
+
+        for name in sorted(self.pins.keys()):
+            fields = self.pins[name]
+            address = _pin_address(name)
+            reg = read(address)
+
+            if "trigger" in fields:
+                reg = (reg & 0b1110_0000) | fields["trigger"]
+                reg = set_bit(reg, Pin.ENABLE_BIT)
+
+            for field, bit in PIN_BITS.items():
+                if field in fields:
+                    reg = set_bit(reg, bit) if fields[field] else clear_bit(reg, bit)
+
+            desired.append((address, reg))
+
+        for idx in sorted(self.triggers.keys()):
+            fields = self.triggers[idx]
+            offset = idx * (_REG_TRIGGER1_MODE - _REG_TRIGGER0_MODE)
+
+            for field in TRIGGER_FIELDS:
+                if field not in fields:
+                    continue
+
+                if field == "mode":
+                    desired.append((_REG_TRIGGER0_MODE + offset, TRIG_MODE[fields[field]]))
+                    continue
+
+                if field == "prescaler":
+                    desired.append((_REG_TRIGGER0_PRESCALER + offset, fields[field]))
+                    continue
+
+                if field == "fine_delay":
+                    address = _REG_TRIGGER0_FINE_DELAY + 2 * idx
+                    desired += [(address, fields[field] & 0xFF), (address + 1, fields[field] >> 8)]
+                    continue
+
+                if field == "rate":
+                    ticks = fields.get("prescaler", read(_REG_TRIGGER0_PRESCALER + offset))
+                    if ticks == 0:
+                        ticks = self.clock_divider or read(_REG_CLOCK_DIVIDER)
+
+                    word = tuning_word(fields[field], ticks / TICK_HZ)
+                    address = _REG_TRIGGER0_TUNING + 4 * idx
+                    desired += [(address + byte, (word >> (8 * byte)) & 0xFF) for byte in range(4)]
+                    continue
+
+                value = _timing(fields[field], "Trigger{} {}".format(idx, field), width)
+                address = _REG_TRIGGER0_MODE + offset + offsets[field]
+
+                for byte in range(width // 8):
+                    desired.append((address + byte, (value >> (8 * byte)) & 0xFF))
+
+        if self.enables is not None:
+            desired.append((_REG_TRIGGER_ENABLES, self.enables))
+
+        return desired
+
+    def diff(self, ctrl):
+        """
+        The writes needed to bring the board to this config, as an ordered list of
+        (address, value).  Current values come from the controller's shadow registers, so
+        an unchanged board costs neither reads nor writes.
+        """
+        read = ctrl.bus.read_register
+        width = ctrl.timing_width
+
+        if not ctrl.prescalers and any("prescaler" in fields for fields in self.triggers.values()):
+            raise ValueError("Trigger prescalers need gateware revision 4 or later, built with them")
+
+        if not ctrl.fine_clock_hz and any("fine_delay" in fields for fields in self.triggers.values()):
+            raise ValueError("Trigger fine_delay needs gateware built with the PLL timebase")
+
+        if not ctrl.dds and any("rate" in fields or fields.get("mode") == "dds" for fields in self.triggers.values()):
+            raise ValueError("The dds trigger mode needs gateware revision 6 or later, built with it")
+
+        ## Fetch whatever isn't shadowed yet with one burst read over the span of those registers.
+        ## Only the addresses matter here; reading 1 keeps a dds rate computable.
+        addresses = [address for address, _ in self.registers(lambda address: 1, width)]
+        missing = [address for address in addresses if not ctrl.cache.cached(address)]
+
+        if len(missing) > 0:
+            read(min(missing), max(missing) - min(missing) + 1)
+
+        return [(address, value) for address, value in self.registers(read, width) if read(address) != value]
+
+    def apply(self, ctrl):
+        """
+        Write the minimal set of registers in one batched transaction.  Returns the writes made.
+
+        With double buffering, the Clock Divider and Power Control go out first, then the staged
+        trigger timing and crossbar writes with their commit, then the modes and Trigger Enables.
+        """
+        writes = self.diff(ctrl)
+
+        if not ctrl.shadow:
+            with ctrl.batch():
+                for address, value in writes:
+                    ctrl.bus.write_register(address, value)
+
+            return writes
+
+        mask = 0
+        for address, _ in writes:
+            bit = shadow_bit(address)
+            if bit is not None:
+                mask = set_bit(mask, bit)
+
+        staged = [(address, value) for address, value in writes if shadow_bit(address) is not None]
+        before = [(address, value) for address, value in writes if address < _REG_CROSSBAR_A0]
+        after = [(address, value) for address, value in writes 
+            if address >= _REG_CROSSBAR_A0 and shadow_bit(address) is None]
+
+        with ctrl.batch():
+            for address, value in before:
+                ctrl.bus.write_register(address, value)
+
+        if mask:
+            with ctrl.staged(triggers=mask & 0xFF, pins=mask >> 8):
+                for address, value in staged:
+                    ctrl.bus.write_register(address, value)
+
+        with ctrl.batch():
+            for address, value in after:
+                ctrl.bus.write_register(address, value)
+
+        return before + staged + after
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        print("Usage : {} CONFIG [--dry-run]".format(sys.argv[0]))
+        sys.exit(1)
+
+    config = BoardConfig.load(sys.argv[1])
+
+    with TriggerController() as ctrl:
+        if "--dry-run" in sys.argv:
+            writes = config.diff(ctrl)
+        else:
+            writes = config.apply(ctrl)
+
+    for address, value in writes:
+        print("W {} {:02x}".format(hex(address), value))
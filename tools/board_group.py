@@ -0,0 +1,180 @@
+import concurrent.futures
+import glob
+import threading
+import time
+
+from trigger_controller import (
+    BusSession, TriggerController, LinuxBackend, DEVICE_ADDRESS, _REG_PRODUCT_ID, _REG_TRIGGER_ENABLES,
+)
+
+## Product IDs of the camera interface boards running this gateware
+PRODUCT_IDS = ["CRFDJ1", "CRZDGE", "CRMHJN"]
+
+
+def _probe(path, address):
+    ## Returns a controller if a trigger board answers on this bus, otherwise None
+    bus = int(path.rsplit("-", 1)[1])
+
+    try:
+        backend = LinuxBackend(bus)
+    except OSError:
+        return None
+
+    session = BusSession(bus, address, backend=backend)
+
+    ## Check the Product ID before anything else touches the device, which may not be ours.
+    ## Single register reads work whatever the gateware revision.
+    try:
+        mpn = "".join(chr(value) for value in session.read_registers(range(_REG_PRODUCT_ID, _REG_PRODUCT_ID + 6)))
+    except Exception:
+        mpn = None
+
+    if mpn not in PRODUCT_IDS:
+        session.close()
+        return None
+
+    try:
+        return TriggerController(session)
+    except Exception:
+        session.close()
+        raise
+
+
+class BoardGroup:
+    """
+    Several trigger boards, one per I2C bus, driven in parallel.
+
+    Every board gets its own worker thread, so work on different buses overlaps instead of
+    adding up.  ``arm()`` writes the Trigger Enables register of all boards at (as near as the
+    host can manage) the same instant, and reports the spread it achieved.
+
+    :attr boards:
+        Mapping of I2C bus number to TriggerController.
+    """
+
+    def __init__(self, boards):
+        self.boards = dict(boards)
+        self._workers = {bus: concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="i2c-{}".format(bus))
+            for bus in self.boards.keys()}
+
+    @classmethod
+    def discover(cls, pattern="/dev/i2c-*", address=DEVICE_ADDRESS):
+        """Probe every matching bus concurrently and group the boards which answer"""
+        paths = glob.glob(pattern)
+
+        if len(paths) == 0:
+            return cls(dict())
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(paths)) as pool:
+            ctrls = pool.map(lambda path: _probe(path, address), paths)
+
+        return cls({ctrl.bus.bus: ctrl for ctrl in ctrls if ctrl is not None})
+
+    def __len__(self):
+        return len(self.boards)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        ## The controllers don't own the sessions they were given, so close those directly
+        try:
+            self.map(lambda ctrl: ctrl.bus.close())
+        finally:
+            for worker in self._workers.values():
+                worker.shutdown()
+
+    def map(self, func):
+        """
+        Run func(ctrl) for every board on that board's worker, and return a mapping of bus
+        number to result.  If any call raises, the first exception is re-raised once all
+        boards are done.
+        """
+        futures = {bus: self._workers[bus].submit(func, ctrl) for bus, ctrl in self.boards.items()}
+        concurrent.futures.wait(futures.values())
+
+        return {bus: future.result() for bus, future in futures.items()}
+
+    def configure(self, config):
+        """
+        Apply a BoardConfig to every board, or a mapping of bus number to BoardConfig to
+        configure boards differently.  Each board is written in one batched transaction.
+        """
+        if isinstance(config, dict):
+            return self.map(lambda ctrl: config[ctrl.bus.bus].apply(ctrl))
+
+        return self.map(config.apply)
+
+    def arm(self, mask=0xFF, timeout=1.0):
+        """
+        Write Trigger Enables on all boards simultaneously.
+
+        The writes are prepared on every worker, which then wait on a common barrier and
+        issue them together.  Returns a dict with the per-bus issue and completion times
+        (perf_counter ns) and the spread of each across boards, which is the host-side skew.
+
+        If any board fails to prepare, or they don't all reach the barrier within ``timeout``
+        seconds, no board is armed and the error is raised.
+        """
+        if len(self.boards) == 0:
+            return self._skew(dict())
+
+        barrier = threading.Barrier(len(self.boards), timeout=timeout)
+        failures = []
+
+        def arm_one(ctrl):
+            try:
+                issue = ctrl.bus.prepare_write(_REG_TRIGGER_ENABLES, mask)
+            except Exception as exc:
+                failures.append(exc)
+                barrier.abort()
+                raise
+
+            barrier.wait()
+
+            start = time.perf_counter_ns()
+            issue()
+            return start, time.perf_counter_ns()
+
+        try:
+            times = self.map(arm_one)
+        except threading.BrokenBarrierError:
+            ## Report why the barrier was broken rather than the boards left waiting on it
+            if len(failures) > 0:
+                raise failures[0]
+            raise
+
+        return self._skew(times)
+
+    def disarm(self):
+        return self.map(lambda ctrl: ctrl.disable())
+
+    @staticmethod
+    def _skew(times):
+        starts = [start for start, _ in times.values()]
+        ends = [end for _, end in times.values()]
+
+        return dict(
+            times = times,
+            issue_skew_ns = max(starts) - min(starts) if len(starts) > 0 else 0,
+            complete_skew_ns = max(ends) - min(ends) if len(ends) > 0 else 0,
+        )
+
+
+if __name__ == "__main__":
+
+    start = time.perf_counter()
+    group = BoardGroup.discover()
+    print("Found {} board(s) on bus {} in {:.1f} ms".format(
+        len(group), sorted(group.boards.keys()), (time.perf_counter() - start) * 1e3))
+
+    if len(group) > 0:
+        with group:
+            result = group.arm(mask=0x01)
+            group.disarm()
+
+            print("Arm skew : issue {:.1f} us, complete {:.1f} us".format(
+                result['issue_skew_ns'] / 1e3, result['complete_skew_ns'] / 1e3))
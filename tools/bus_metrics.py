@@ -0,0 +1,209 @@
+import bisect
+import contextlib
+import http.server
+import threading
+import time
+
+## Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (50e-6, 100e-6, 200e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3)
+
+METRICS_PORT = 9108
+
+
+class Histogram:
+    """
+    Latency histogram : counts[idx] is the number of observations at or
+    below BUCKETS[idx] and above the previous bound, the last count being the overflow.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in (None if empty,
+        infinity if it is in the overflow bucket).
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        seen = 0
+
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                return BUCKETS[idx] if idx < len(BUCKETS) else float("inf")
+
+        return float("inf")
+
+
+class BusMetrics:
+    """
+    Operation counters, error counters and latency histograms of a BusSession, per
+    operation type and per register.
+
+    Operations are "read", "write", "flush" (a batch flush) and "ident".  A transfer
+    covering a range of registers is accounted to the first register of the range.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = dict()       ## op -> Histogram
+        self.registers = dict()     ## (op, register) -> Histogram
+        self.errors = dict()        ## op -> count
+        self.register_errors = dict()
+        self.cache = None
+
+    def reset(self):
+        with self._lock:
+            self.latency.clear()
+            self.registers.clear()
+            self.errors.clear()
+            self.register_errors.clear()
+
+    def observe(self, op, address, seconds):
+        with self._lock:
+            hist = self.latency.get(op)
+            if hist is None:
+                hist = self.latency[op] = Histogram()
+            hist.observe(seconds)
+
+            if address is not None:
+                hist = self.registers.get((op, address))
+                if hist is None:
+                    hist = self.registers[(op, address)] = Histogram()
+                hist.observe(seconds)
+
+    def error(self, op, address):
+        with self._lock:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+            if address is not None:
+                key = (op, address)
+                self.register_errors[key] = self.register_errors.get(key, 0) + 1
+
+    @contextlib.contextmanager
+    def timed(self, op, address=None):
+        start = time.perf_counter()
+
+        try:
+            yield
+        except OSError:
+            self.error(op, address)
+            raise
+
+        self.observe(op, address, time.perf_counter() - start)
+
+    def summary(self):
+        """
+        Per operation type : count, errors, mean and estimated p50 / p99 / p999 latency in seconds.
+        """
+        with self._lock:
+            result = dict()
+
+            for op in set(self.latency) | set(self.errors):
+                hist = self.latency.get(op, Histogram())
+                result[op] = dict(
+                    count=hist.count,
+                    errors=self.errors.get(op, 0),
+                    mean=hist.sum / hist.count if hist.count else None,
+                    p50=hist.quantile(0.5),
+                    p99=hist.quantile(0.99),
+                    p999=hist.quantile(0.999),
+                )
+
+            return result
+
+    def _histogram_lines(self, name, labels, hist):
+        lines = []
+        cumulative = 0
+
+        for bound, count in zip(BUCKETS, hist.counts):
+            cumulative += count
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, cumulative))
+
+        lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(name, labels, hist.count))
+        lines.append('{}_sum{{{}}} {}'.format(name, labels, hist.sum))
+        lines.append('{}_count{{{}}} {}'.format(name, labels, hist.count))
+
+        return lines
+
+    def prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                "# HELP trigger_i2c_latency_seconds Latency of bus operations by type",
+                "# TYPE trigger_i2c_latency_seconds histogram",
+            ]
+            for op, hist in sorted(self.latency.items()):
+                lines += self._histogram_lines("trigger_i2c_latency_seconds", 'op="{}"'.format(op), hist)
+
+            lines += [
+                "# HELP trigger_i2c_register_latency_seconds Latency of bus operations by register",
+                "# TYPE trigger_i2c_register_latency_seconds histogram",
+            ]
+            for (op, address), hist in sorted(self.registers.items()):
+                labels = 'op="{}",register="0x{:02x}"'.format(op, address)
+                lines += self._histogram_lines("trigger_i2c_register_latency_seconds", labels, hist)
+
+            lines += [
+                "# HELP trigger_i2c_errors_total Failed bus operations by type",
+                "# TYPE trigger_i2c_errors_total counter",
+            ]
+            for op, count in sorted(self.errors.items()):
+                lines.append('trigger_i2c_errors_total{{op="{}"}} {}'.format(op, count))
+
+            lines += [
+                "# HELP trigger_i2c_register_errors_total Failed bus operations by register",
+                "# TYPE trigger_i2c_register_errors_total counter",
+            ]
+            for (op, address), count in sorted(self.register_errors.items()):
+                lines.append('trigger_i2c_register_errors_total{{op="{}",register="0x{:02x}"}} {}'.format(op, address, count))
+
+        if self.cache is not None:
+            stats = self.cache.stats()
+            lines += [
+                "# HELP trigger_register_cache_total Register cache lookups by result",
+                "# TYPE trigger_register_cache_total counter",
+                'trigger_register_cache_total{{result="hit"}} {}'.format(stats["hits"]),
+                'trigger_register_cache_total{{result="miss"}} {}'.format(stats["misses"]),
+            ]
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=METRICS_PORT, host="127.0.0.1"):
+        """
+        Serve the metrics at http://host:port/metrics from a background thread.  Returns the
+        server; call shutdown() on it to stop.
+        """
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        return server
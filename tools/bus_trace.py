@@ -0,0 +1,148 @@
+import collections
+import ctypes
+import struct
+import time
+
+from smbus2.smbus2 import I2C_M_RD
+
+
+## File layout : magic, record size, record count, then records oldest first
+MAGIC = b"CRTRACE1"
+HEADER = struct.Struct("<8sII")
+
+## Payloads longer than this are truncated; it covers a burst read of the whole register map
+## (0x00 thru 0x6F, as BusSession.dump() reads it) with room to spare
+MAX_PAYLOAD = 128
+
+## Monotonic timestamp (ns), duration of the transfer (ns), flags, device address, register
+## address, payload length, then the payload
+RECORD = struct.Struct("<QIBBBB{}s".format(MAX_PAYLOAD))
+
+FLAG_READ = 0x01        ## Register read (pointer write + read), otherwise a register write
+FLAG_CONTINUED = 0x02   ## Part of the same transfer as the previous record
+FLAG_TRUNCATED = 0x04   ## Payload was longer than MAX_PAYLOAD
+FLAG_ERROR = 0x08       ## The transfer failed (data of reads is not valid)
+
+TraceRecord = collections.namedtuple("TraceRecord", 
+    ["timestamp", "duration", "read", "device", "address", "data", "continued", "error", "truncated"])
+
+
+class TraceBuffer:
+    """
+    Fixed-size, in-memory ring buffer of bus transactions.
+
+    Each I2C message (or pointer write + read pair) of a transfer is one record of the
+    monotonic (perf_counter) issue time, transfer duration, direction, device and register address and the
+    bytes moved.  Once full, the oldest records are overwritten.  Nothing is formatted or
+    allocated per record beyond packing into the preallocated buffer.
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self._buffer = bytearray(RECORD.size * size)
+        self._next = 0
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def clear(self):
+        self._next = 0
+        self.count = 0
+
+    def _append(self, timestamp, duration, flags, device, address, data):
+        if len(data) > MAX_PAYLOAD:
+            flags |= FLAG_TRUNCATED
+            data = data[:MAX_PAYLOAD]
+
+        RECORD.pack_into(self._buffer, self._next * RECORD.size, 
+            timestamp, duration, flags, device, address, len(data), data)
+
+        self._next = (self._next + 1) % self.size
+        self.count += 1
+
+    def record(self, data, start, end, error=False):
+        """
+        Record one I2C_RDWR transfer.  ``data`` is the ioctl argument after completion and
+        ``start`` / ``end`` are perf_counter_ns() values around it.
+        """
+        duration = min(end - start, 0xFFFFFFFF)
+        flags = FLAG_ERROR if error else 0
+        idx = 0
+
+        while idx < data.nmsgs:
+            msg = data.msgs[idx]
+            payload = ctypes.string_at(msg.buf, msg.len)
+
+            if msg.flags & I2C_M_RD:
+                ## A read without a preceding pointer write continues from the current pointer
+                self._append(start, duration, flags | FLAG_READ, msg.addr, 0xFF, payload)
+                idx += 1
+
+            elif idx + 1 < data.nmsgs and data.msgs[idx+1].flags & I2C_M_RD and msg.len == 1:
+                read = data.msgs[idx+1]
+                self._append(start, duration, flags | FLAG_READ, msg.addr, payload[0], 
+                    ctypes.string_at(read.buf, read.len))
+                idx += 2
+
+            else:
+                self._append(start, duration, flags, msg.addr, payload[0] if msg.len > 0 else 0xFF, payload[1:])
+                idx += 1
+
+            flags = (flags & FLAG_ERROR) | FLAG_CONTINUED
+
+    def records(self):
+        """Recorded transactions, oldest first"""
+        count = len(self)
+        first = (self._next - count) % self.size
+
+        for idx in range(count):
+            offset = ((first + idx) % self.size) * RECORD.size
+            yield self._unpack(self._buffer, offset)
+
+    @staticmethod
+    def _unpack(buffer, offset):
+        timestamp, duration, flags, device, address, length, data = RECORD.unpack_from(buffer, offset)
+        return TraceRecord(timestamp, duration, bool(flags & FLAG_READ), device, address, 
+            data[:length], bool(flags & FLAG_CONTINUED), bool(flags & FLAG_ERROR), bool(flags & FLAG_TRUNCATED))
+
+    def dump(self, path):
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, RECORD.size, len(self)))
+
+            count = len(self)
+            first = (self._next - count) % self.size
+
+            for idx in range(count):
+                offset = ((first + idx) % self.size) * RECORD.size
+                f.write(self._buffer[offset:offset+RECORD.size])
+
+    @staticmethod
+    def load(path):
+        """Read a trace written by dump(), as a list of TraceRecord"""
+        with open(path, "rb") as f:
+            magic, size, count = HEADER.unpack(f.read(HEADER.size))
+
+            if magic != MAGIC or size != RECORD.size:
+                raise ValueError("{} is not a bus trace".format(path))
+
+            buffer = f.read(size * count)
+
+        return [TraceBuffer._unpack(buffer, idx * size) for idx in range(count)]
+
+
+def traced(rdwr, trace):
+    """Wrap a backend's rdwr so every transfer is recorded into ``trace``"""
+
+    def rdwr_traced(data):
+        start = time.perf_counter_ns()
+
+        try:
+            rdwr(data)
+        except OSError:
+            trace.record(data, start, time.perf_counter_ns(), error=True)
+            raise
+
+        trace.record(data, start, time.perf_counter_ns())
+
+    return rdwr_traced
@@ -0,0 +1,196 @@
+import collections
+import ctypes
+import errno
+import time
+
+from smbus2.smbus2 import I2C_M_RD
+
+from trigger_controller import (
+    Backend, DEVICE_ADDRESS, TICK_HZ, TRIG_MODE, _CAP_DDS, _CAP_PRESCALERS, _CAP_SHADOW, _MODE_REGISTERS,
+    _REG_CLOCK_DIVIDER, _REG_COMMIT, _REG_SHADOW_HOLD, _REG_TRIGGER0_MODE, _REG_TRIGGER0_PRESCALER,
+    register_map, shadow_bit, trigger_offsets,
+)
+
+
+## Power-on values of the gateware registers which are not zero
+DEFAULTS = {
+    "Product ID": b"CRFDJ1",
+    "Hardware Revision": 10,
+    "Gateware Revision": 8,
+    "Camera Count": 6,
+    "GPIO Count": 4,
+    "Trigger Count": 4,
+    "Clock Divider": 10,
+    "Power Control": 0x03,
+}
+
+CROSSBAR_DEFAULT = 0b0100_0000
+
+
+class FakeDevice(Backend):
+    """
+    In-memory stand-in for the trigger board, for exercising and benchmarking the host
+    driver without hardware.
+
+    It decodes I2C_RDWR transfers the way the gateware's I2CRegisters does : the first byte
+    of a write sets the register pointer, which then auto-increments over every byte read
+    or written.  Writes to read-only registers are ignored.
+
+    A trigger put in oneshot mode returns to stop, in real time, once its Delay and Duration
+    have elapsed at the current Clock Divider, or at its own Prescaler when that is non-zero.
+    Trigger timing and crossbar registers are double buffered as in the gateware : ``live()``
+    gives the value in use, which stays latched while its Shadow Hold bit is set.  A Commit
+    applies at once (there is no strobe to wait for) and reads back zero, unless
+    ``applies_commits`` is cleared to model gateware which never gets to apply it.
+
+    ``timing_width`` is the width of the trigger timing registers the fake gateware was
+    built with, and ``fine_clock`` its Fine Clock in MHz (non-zero for the PLL timebase, which
+    adds the Fine Delay registers).  ``prescalers``, ``dds`` and ``shadow`` are the optional
+    features it was built with, as reported by its Capabilities register.  Pass it as the
+    ``backend`` of a BusSession.
+
+    :attr transfers:
+        Number of I2C_RDWR transfers issued to the device.
+    :attr messages:
+        Number of I2C messages carried by those transfers.
+    """
+
+    def __init__(self, address=DEVICE_ADDRESS, timing_width=8, fine_clock=0, prescalers=True, dds=True, 
+        shadow=True):
+        self.address = address
+        self.timing_width = timing_width
+
+        registers = register_map(timing_width, prescalers=prescalers, fine_clock=fine_clock, dds=dds, 
+            shadow=shadow, capabilities=True)
+        self.regs = bytearray(max(addr + length for _, addr, length, _ in registers))
+        self.ro = set()
+        self.pointer = 0
+
+        ## Mode register address -> monotonic time at which its oneshot completes
+        self.oneshots = dict()
+
+        ## Shadow Hold / Commit mask bit -> addresses it covers, and address -> latched live value
+        self.shadowed = collections.defaultdict(list)
+        for addr in range(len(self.regs)):
+            if shadow_bit(addr) is not None:
+                self.shadowed[shadow_bit(addr)].append(addr)
+
+        self.latched = dict()
+        self.applies_commits = True
+
+        self.transfers = 0
+        self.messages = 0
+
+        for name, addr, length, ro in registers:
+            if name.startswith("Crossbar"):
+                self.regs[addr] = CROSSBAR_DEFAULT
+
+            if name in DEFAULTS:
+                value = DEFAULTS[name]
+
+                if isinstance(value, bytes):
+                    self.regs[addr:addr+length] = value
+                else:
+                    self.regs[addr] = value
+
+            if name == "Timing Width":
+                self.regs[addr] = timing_width
+
+            if name == "Fine Clock":
+                self.regs[addr] = fine_clock
+
+            if name == "Capabilities":
+                self.regs[addr] = prescalers << _CAP_PRESCALERS | dds << _CAP_DDS | shadow << _CAP_SHADOW
+
+            if ro:
+                self.ro.update(range(addr, addr+length))
+
+    def live(self, addr):
+        """Value of a register as the gateware logic sees it"""
+        return self.latched.get(addr, self.regs[addr])
+
+    def _mask(self, addr):
+        return int.from_bytes(self.regs[addr:addr+3], "little")
+
+    def _latch(self, mask, hold):
+        ## Latch the registers of the set bits of ``mask``, or release them when ``hold`` is clear
+        for bit, addrs in self.shadowed.items():
+            if mask & (1 << bit):
+                for addr in addrs:
+                    if hold:
+                        self.latched[addr] = self.regs[addr]
+                    else:
+                        self.latched.pop(addr, None)
+
+    def _advance(self):
+        self.pointer = (self.pointer + 1) % len(self.regs)
+
+    def _settle(self):
+        now = time.monotonic()
+
+        for addr, end in list(self.oneshots.items()):
+            if now >= end:
+                self.regs[addr] = TRIG_MODE['stop']
+                del self.oneshots[addr]
+
+    def read(self, length):
+        self._settle()
+        data = bytearray(length)
+
+        for idx in range(length):
+            data[idx] = self.regs[self.pointer]
+            self._advance()
+
+        return data
+
+    def write(self, data):
+        if len(data) == 0:
+            return
+
+        if data[0] >= len(self.regs):
+            raise OSError(errno.EREMOTEIO, "Register address NAK")
+
+        self.pointer = data[0]
+        hold = self._mask(_REG_SHADOW_HOLD)
+
+        for value in data[1:]:
+            if self.pointer not in self.ro:
+                self.regs[self.pointer] = value
+
+                if self.pointer in _MODE_REGISTERS and value == TRIG_MODE['oneshot']:
+                    self._oneshot(self.pointer)
+            self._advance()
+
+        ## Newly held registers keep their live values, released ones follow their register again
+        changed = hold ^ self._mask(_REG_SHADOW_HOLD)
+        self._latch(changed & ~hold, True)
+        self._latch(changed & hold, False)
+
+        ## Like the gateware, a commit applies once the transaction has ended
+        if self.applies_commits and self._mask(_REG_COMMIT):
+            self._latch(self._mask(_REG_COMMIT) & self._mask(_REG_SHADOW_HOLD), True)
+            self.regs[_REG_COMMIT:_REG_COMMIT+3] = bytes(3)
+
+    def _field(self, mode_addr, field):
+        addr = mode_addr + trigger_offsets(self.timing_width)[field]
+        return int.from_bytes(bytes(self.live(addr + idx) for idx in range(self.timing_width // 8)), "little")
+
+    def _oneshot(self, addr):
+        strobes = self._field(addr, "delay") + self._field(addr, "duration") + 1
+        ticks = self.live(addr + _REG_TRIGGER0_PRESCALER - _REG_TRIGGER0_MODE) or self.regs[_REG_CLOCK_DIVIDER]
+        self.oneshots[addr] = time.monotonic() + strobes * ticks / TICK_HZ
+
+    def rdwr(self, data):
+        self.transfers += 1
+        self.messages += data.nmsgs
+
+        for idx in range(data.nmsgs):
+            msg = data.msgs[idx]
+
+            if msg.addr != self.address:
+                raise OSError(errno.EREMOTEIO, "Device address NAK")
+
+            if msg.flags & I2C_M_RD:
+                ctypes.memmove(msg.buf, bytes(self.read(msg.len)), msg.len)
+            else:
+                self.write(ctypes.string_at(msg.buf, msg.len))
@@ -0,0 +1,187 @@
+import math
+import threading
+import time
+
+from trigger_controller import TICK_HZ, TUNING_BITS, tuning_rate
+from board_config import TRIGGER_COUNT
+from timing_solver import COUNTER_MAX
+
+
+class RateGovernor:
+    """
+    Throttles trigger rates at the source when the downstream pipeline falls behind.
+
+    ``signal`` is called on every update and returns a backpressure level, such as a queue
+    depth or the number of frames dropped since the last call.  At or above ``high`` the
+    governed triggers are slowed down by ``step`` (a fraction of their period); at or below
+    ``low`` they are sped back up, never beyond the rates they had when the governor was
+    created and never slower than ``max_slowdown`` times those rates.  Between the two
+    thresholds nothing changes, and no two changes are closer than ``holdoff`` seconds.
+
+    Intervals are adjusted at the current Clock Divider.  When a period no longer fits in
+    the Interval register and ``adjust_divider`` is set, the divider is raised instead and the
+    Interval, Duration and Delay of every trigger are rescaled to keep their timing, as is the
+    Tuning word of those using the dds mode.  They are rescaled from the values captured when
+    the governor was created, so rounding does not accumulate and the original registers
+    come back once the divider does.  Triggers with a non-zero Prescaler don't count in the
+    Clock Divider strobe, so they are never rescaled and governed ones are adjusted at their
+    own Prescaler.  Governed triggers in the dds mode (as set when the governor was created)
+    ignore their Interval, so their Tuning word is scaled down instead.  Each change is one
+    batched transaction.
+    """
+
+    def __init__(self, ctrl, signal, triggers=(0,), high=8, low=2, step=0.25, max_slowdown=4.0,
+        holdoff=1.0, adjust_divider=True):
+
+        if low >= high:
+            raise ValueError("low threshold must be below high threshold")
+
+        self.ctrl = ctrl
+        self.signal = signal
+        self.triggers = list(triggers)
+        self.high = high
+        self.low = low
+        self.step = step
+        self.max_slowdown = max_slowdown
+        self.holdoff = holdoff
+        self.adjust_divider = adjust_divider
+
+        self.counter_max = (1 << ctrl.timing_width) - 1
+
+        self.base_divider = ctrl.clock_divider
+        self.prescalers = {idx: ctrl.trigger(idx).prescaler for idx in range(TRIGGER_COUNT)}
+        self.base_ticks = {idx: (self.prescalers[idx] or self.base_divider) * ctrl.trigger(idx).interval 
+            for idx in self.triggers if ctrl.trigger(idx).mode != "dds"}
+
+        ## Tuning words of the governed dds triggers, as a rate in tuning words per tick
+        self.base_tuning = {idx: ctrl.trigger(idx).tuning / (self.prescalers[idx] or self.base_divider)
+            for idx in self.triggers if idx not in self.base_ticks}
+
+        ## Timing registers of every trigger counting Clock Divider strobes, for rescaling them
+        ## when the divider changes
+        self.base_timing = {idx: {field: getattr(ctrl.trigger(idx), field) for field in ("interval", "duration", "delay", "tuning")}
+            for idx in range(TRIGGER_COUNT) if self.prescalers[idx] == 0}
+
+        ## Current period of the governed triggers, relative to their base period
+        self.scale = 1.0
+        self.changes = 0
+        self._last_change = None
+
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _registers(self, scale):
+        ## Clock Divider, governed intervals and governed dds tuning words for a scale
+        ticks = {idx: base * scale for idx, base in self.base_ticks.items()}
+        divided = [value for idx, value in ticks.items() if self.prescalers[idx] == 0]
+
+        if self.adjust_divider and len(divided) > 0:
+            divider = max(self.base_divider, math.ceil(max(divided) / self.counter_max))
+            divider = min(divider, COUNTER_MAX)
+        else:
+            divider = self.base_divider
+
+        intervals = {idx: min(self.counter_max, max(1, round(value / (self.prescalers[idx] or divider))))
+            for idx, value in ticks.items()}
+
+        tunings = {idx: min((1 << TUNING_BITS) - 1, max(1, round(value * (self.prescalers[idx] or divider) / scale)))
+            for idx, value in self.base_tuning.items()}
+
+        return divider, intervals, tunings
+
+    def _apply(self, scale):
+        divider, intervals, tunings = self._registers(scale)
+        current = self.ctrl.clock_divider
+
+        with self.ctrl.batch():
+            if divider != current:
+                ## The strobe is shared, so keep the timing of everything else as it was
+                for idx, timing in self.base_timing.items():
+                    trigger = self.ctrl.trigger(idx)
+
+                    for field, value in timing.items():
+                        if value == 0 or (field == "interval" and idx in intervals):
+                            continue
+                        if field == "tuning" and idx in tunings:
+                            continue
+
+                        ## A dds rate is strobe rate * tuning / 2^32, so the word scales with the divider
+                        if field == "tuning":
+                            value = min((1 << TUNING_BITS) - 1, round(value * divider / self.base_divider))
+                        else:
+                            value = min(self.counter_max, max(1, round(value * self.base_divider / divider)))
+
+                        if getattr(trigger, field) != value:
+                            setattr(trigger, field, value)
+
+                self.ctrl.clock_divider = divider
+
+            for idx, interval in intervals.items():
+                trigger = self.ctrl.trigger(idx)
+                if trigger.interval != interval:
+                    trigger.interval = interval
+
+            for idx, tuning in tunings.items():
+                trigger = self.ctrl.trigger(idx)
+                if trigger.tuning != tuning:
+                    trigger.tuning = tuning
+
+    def update(self, now=None):
+        """
+        Sample the backpressure signal and adjust the trigger rates if needed.  Returns True
+        when registers were changed.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        level = self.signal()
+
+        if level >= self.high:
+            scale = min(self.max_slowdown, self.scale * (1 + self.step))
+        elif level <= self.low:
+            scale = max(1.0, self.scale / (1 + self.step))
+        else:
+            return False
+
+        if scale == self.scale:
+            return False
+
+        if self._last_change is not None and now - self._last_change < self.holdoff:
+            return False
+
+        if self._registers(scale) != self._registers(self.scale):
+            self._apply(scale)
+
+        self.scale = scale
+        self._last_change = now
+        self.changes += 1
+
+        return True
+
+    def rates(self):
+        """Current rate of each governed trigger, in Hz"""
+        divider, intervals, tunings = self._registers(self.scale)
+
+        rates = {idx: TICK_HZ / ((self.prescalers[idx] or divider) * interval) for idx, interval in intervals.items()}
+        rates.update({idx: tuning_rate(tuning, (self.prescalers[idx] or divider) / TICK_HZ) for idx, tuning in tunings.items()})
+
+        return rates
+
+    def start(self, period=0.1):
+        """
+        Call update() every ``period`` seconds from a background thread.  The controller's bus
+        session should be created with shared=True if it is also used from other threads.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(period,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, period):
+        while not self._stop.wait(period):
+            self.update()
@@ -0,0 +1,256 @@
+import argparse
+import array
+import concurrent.futures
+import ctypes
+import gc
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from trigger_controller import (
+    BusSession, TriggerController, LinuxBackend, I2CBUS, TRIG_MODE,
+    _REG_POWER_SENSE, _REG_TRIGGER0_MODE, _REG_TRIGGER1_MODE,
+)
+from benchmark import PERCENTILES, percentile
+
+logger = logging.getLogger(__name__)
+
+## mlockall() flags from <sys/mman.h>
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+
+def _mlockall():
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    except (OSError, AttributeError) as exc:
+        logger.warning("Could not lock memory ({}), page faults may add latency".format(exc))
+        return False
+
+    return True
+
+
+def _munlockall():
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.munlockall()
+
+
+class RealtimeFirer:
+    """
+    Opt-in low latency path for software-triggered captures.
+
+    A dedicated I/O thread issues oneshot writes built ahead of time with
+    BusSession.prepare_write().  On start the thread pins itself to ``cpu``, asks for
+    SCHED_FIFO at ``priority`` and warms up the bus path with harmless reads.  Two settings
+    affect the whole process, so they are opt-in and undone by stop() : ``lock_memory``
+    locks the process memory and ``freeze_gc`` moves every existing object out of the
+    collector's reach.  Each of these is best effort : when the process lacks the privilege
+    (CAP_SYS_NICE, CAP_IPC_LOCK) it logs a warning and carries on, and ``status`` records
+    what was achieved.
+
+    The time from fire() to the write completing is recorded into a ring of the last
+    ``history`` samples; see latency().  The bus session must be created with shared=True if
+    it is also used from other threads.
+    """
+
+    def __init__(self, ctrl, cpu=None, priority=50, history=65536, warmup=1000, lock_memory=False, freeze_gc=False):
+        self.ctrl = ctrl
+        self.cpu = cpu
+        self.priority = priority
+        self.warmup = warmup
+        self.lock_memory = lock_memory
+        self.freeze_gc = freeze_gc
+
+        stride = _REG_TRIGGER1_MODE - _REG_TRIGGER0_MODE
+        self._issue = [ctrl.bus.prepare_write(_REG_TRIGGER0_MODE + idx * stride, TRIG_MODE['oneshot']) for idx in range(4)]
+
+        self._samples = array.array("q", bytes(8 * history))
+        self._next = 0
+        self.count = 0
+
+        self.status = dict(affinity=False, fifo=False, mlock=False, gc_frozen=False)
+
+        self._requests = queue.SimpleQueue()
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._ready.clear()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="trigger-rt", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+        if self._error is not None:
+            self.stop()
+            raise self._error
+
+    def stop(self):
+        if self._thread is not None:
+            self._requests.put(None)
+            self._thread.join()
+            self._thread = None
+
+        ## Nothing will issue requests made after the thread stopped
+        while True:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                break
+
+            if request is not None:
+                request[2].set_exception(RuntimeError("RealtimeFirer is stopped"))
+
+        if self.status["gc_frozen"]:
+            gc.unfreeze()
+            self.status["gc_frozen"] = False
+
+        if self.status["mlock"]:
+            _munlockall()
+            self.status["mlock"] = False
+
+    def _setup(self):
+        if self.cpu is not None:
+            try:
+                os.sched_setaffinity(0, {self.cpu})
+                self.status["affinity"] = True
+            except (OSError, AttributeError) as exc:
+                logger.warning("Could not pin the I/O thread to CPU {} ({})".format(self.cpu, exc))
+
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+            self.status["fifo"] = True
+        except (OSError, AttributeError) as exc:
+            logger.warning("Could not switch to SCHED_FIFO ({}), running at normal priority".format(exc))
+
+        if self.lock_memory:
+            self.status["mlock"] = _mlockall()
+
+        ## Run the transfer path a few times so that its code and buffers are resident.  Power
+        ## Sense is never cached, so every read goes through the session to the bus.
+        for _ in range(self.warmup):
+            self.ctrl.bus.read_register(_REG_POWER_SENSE)
+
+        ## Keep collector pauses out of the I/O thread's way
+        if self.freeze_gc:
+            gc.collect()
+            gc.freeze()
+            self.status["gc_frozen"] = True
+
+    def _run(self):
+        try:
+            self._setup()
+        except Exception as exc:
+            self._error = exc
+            return
+        finally:
+            self._ready.set()
+
+        samples = self._samples
+        size = len(samples)
+
+        while True:
+            request = self._requests.get()
+
+            if request is None:
+                return
+
+            issue, start, future = request
+
+            try:
+                issue()
+            except Exception as exc:
+                future.set_exception(exc)
+                continue
+
+            elapsed = time.perf_counter_ns() - start
+
+            samples[self._next] = elapsed
+            self._next = (self._next + 1) % size
+            self.count += 1
+
+            future.set_result(elapsed)
+
+    def fire(self, index):
+        """
+        Start a oneshot on trigger ``index``.  Returns a Future resolving to the
+        issue-to-complete latency in nanoseconds once the write has been made.
+        """
+        future = concurrent.futures.Future()
+        self._requests.put((self._issue[index], time.perf_counter_ns(), future))
+        return future
+
+    def latency(self):
+        """Distribution of the recorded issue-to-complete latencies, in microseconds"""
+        samples = sorted(self._samples[:min(self.count, len(self._samples))])
+
+        if len(samples) == 0:
+            return dict(count=0)
+
+        result = dict(count=len(samples), mean_us=sum(samples) / len(samples) / 1e3,
+            min_us=samples[0] / 1e3, max_us=samples[-1] / 1e3)
+
+        for pct in PERCENTILES:
+            result["p{}_us".format(pct)] = percentile(samples, pct) / 1e3
+
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark software trigger latency with and without real-time mode")
+    parser.add_argument("--hardware", action="store_true", help="fire the board on --bus instead of a FakeDevice")
+    parser.add_argument("--bus", type=int, default=I2CBUS)
+    parser.add_argument("--cpu", type=int, help="CPU to pin the real-time I/O thread to")
+    parser.add_argument("--priority", type=int, default=50, help="SCHED_FIFO priority")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--lock-memory", action="store_true", help="mlockall() the process while firing")
+    parser.add_argument("--freeze-gc", action="store_true", help="freeze the garbage collector while firing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.hardware:
+        backend = LinuxBackend(args.bus)
+    else:
+        from fake_device import FakeDevice
+        backend = FakeDevice()
+
+    report = dict()
+
+    with TriggerController(BusSession(backend=backend, shared=True)) as ctrl:
+        ## Plain driver call from the caller's thread, for comparison
+        samples = []
+        for _ in range(args.count):
+            start = time.perf_counter_ns()
+            ctrl.trigger(0).mode = "oneshot"
+            samples.append(time.perf_counter_ns() - start)
+
+        samples.sort()
+        report["driver"] = {"p{}_us".format(pct): percentile(samples, pct) / 1e3 for pct in PERCENTILES}
+
+        with RealtimeFirer(ctrl, cpu=args.cpu, priority=args.priority, history=args.count,
+            lock_memory=args.lock_memory, freeze_gc=args.freeze_gc) as rt:
+            for _ in range(args.count):
+                rt.fire(0).result()
+
+            report["realtime"] = rt.latency()
+            report["status"] = rt.status
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import ctypes
+import errno
+import os
+import queue
+import sys
+import threading
+
+from smbus2.smbus2 import I2C_M_RD
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gateware"))
+
+from migen import run_simulation
+from target import TriggerTarget
+
+from trigger_controller import Backend, BusSession, TriggerController, _REG_POWER_SENSE
+
+
+class SimBackend(Backend):
+    """
+    Backend which runs the gateware itself in simulation.
+
+    A full TriggerTarget (all four TriggerControllers and the CrossBarControl) is simulated
+    on a background thread.  Each transfer is turned into I2C bus conditions by the
+    I2CTargetTestbench initiator, so the host driver talks to the real register file logic
+    bit by bit.  Simulated time only advances while a transfer is in progress or when
+    ``advance()`` is called.  With ``pll`` the gateware runs its triggers from the 48 MHz
+    PLL clock domain.
+
+    :attr transfers:
+        Number of I2C_RDWR transfers performed.
+    :attr messages:
+        Number of I2C messages carried by those transfers.
+    :attr octets:
+        Number of octets on the bus, including address octets.
+    :attr cycles:
+        Number of simulated system clock cycles spent on transfers.
+    """
+
+    def __init__(self, tick_period=1200, vcd_name=None, timing_width=8, pll=False):
+        self.dut = TriggerTarget('sim', tick_period=tick_period, timing_width=timing_width, pll=pll)
+        self.sys_clk_freq = self.dut.sys_clk_freq
+
+        ## The PLL clock domain runs 4x faster than the system clock, as on hardware
+        clocks = dict(sys=8, fast=2) if pll else dict(sys=10)
+
+        self.transfers = 0
+        self.messages = 0
+        self.octets = 0
+        self.cycles = 0
+
+        self._requests = queue.Queue()
+        self._responses = queue.Queue()
+
+        self._thread = threading.Thread(
+            target=run_simulation, 
+            args=(self.dut, self._process()), 
+            kwargs=dict(clocks=clocks, vcd_name=vcd_name),
+            daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def sim_time(self):
+        """Simulated seconds spent on bus transfers"""
+        return self.cycles / self.sys_clk_freq
+
+    def reset_stats(self):
+        self.transfers = 0
+        self.messages = 0
+        self.octets = 0
+        self.cycles = 0
+
+    def _call(self, kind, arg=None):
+        self._requests.put((kind, arg))
+        result, exc = self._responses.get()
+
+        if exc is not None:
+            raise exc
+
+        return result
+
+    def rdwr(self, data):
+        msgs = []
+
+        for idx in range(data.nmsgs):
+            msg = data.msgs[idx]
+
+            if msg.flags & I2C_M_RD:
+                msgs.append((msg.addr, True, msg.len))
+            else:
+                msgs.append((msg.addr, False, ctypes.string_at(msg.buf, msg.len)))
+
+        results = self._call("rdwr", msgs)
+
+        self.transfers += 1
+        self.messages += len(msgs)
+
+        for idx, result in enumerate(results):
+            if result is not None:
+                ctypes.memmove(data.msgs[idx].buf, result, len(result))
+
+    def advance(self, seconds=None, cycles=None):
+        """Let simulated time pass without bus activity"""
+        if cycles is None:
+            cycles = int(seconds * self.sys_clk_freq)
+
+        self._call("advance", cycles)
+
+    def peek(self, signal):
+        return self._call("peek", signal)
+
+    def poke(self, signal, value):
+        self._call("poke", (signal, value))
+
+    def outputs(self):
+        """Current levels of the crossbar outputs, as lists for bank A and bank B"""
+        return self._call("outputs")
+
+    def close(self):
+        if self._thread.is_alive():
+            self._requests.put(None)
+            self._thread.join()
+
+    ## Everything below runs as the simulation generator, on the simulation thread
+
+    def _counted(self, gen):
+        value = None
+
+        while True:
+            try:
+                cmd = gen.send(value)
+            except StopIteration as stop:
+                return stop.value
+
+            if cmd is None:
+                self.cycles += 1
+
+            value = yield cmd
+
+    def _restart(self, tb):
+        yield tb.scl_o.eq(0)
+        yield
+        yield tb.sda_o.eq(1)
+        yield from tb.half_period()
+        yield tb.scl_o.eq(1)
+        yield from tb.half_period()
+        yield from tb.start()
+
+    def _transfer(self, msgs):
+        tb = self.dut.i2c_target
+        results = []
+
+        try:
+            for idx, (addr, read, payload) in enumerate(msgs):
+                if idx == 0:
+                    yield from tb.start()
+                else:
+                    yield from self._restart(tb)
+
+                yield from tb.write_octet((addr << 1) | read)
+                self.octets += 1
+
+                if (yield from tb.read_bit()) != 0:
+                    raise OSError(errno.EREMOTEIO, "Device address NAK")
+
+                if read:
+                    data = bytearray(payload)
+
+                    for pos in range(payload):
+                        data[pos] = (yield from tb.read_octet())
+                        self.octets += 1
+
+                        ## NAK the last octet of the message
+                        yield from tb.write_bit(1 if pos == payload - 1 else 0)
+
+                    results.append(bytes(data))
+
+                else:
+                    for octet in payload:
+                        yield from tb.write_octet(octet)
+                        self.octets += 1
+
+                        if (yield from tb.read_bit()) != 0:
+                            raise OSError(errno.EREMOTEIO, "Data NAK")
+
+                    results.append(None)
+
+        finally:
+            yield from tb.stop()
+
+        return results
+
+    def _process(self):
+        while True:
+            request = self._requests.get()
+
+            if request is None:
+                return
+
+            kind, arg = request
+            result, exc = None, None
+
+            try:
+                if kind == "rdwr":
+                    result = yield from self._counted(self._transfer(arg))
+                elif kind == "advance":
+                    for _ in range(arg):
+                        yield
+                elif kind == "peek":
+                    result = (yield arg)
+                elif kind == "poke":
+                    signal, value = arg
+                    yield signal.eq(value)
+                    yield
+                elif kind == "outputs":
+                    bank_a, bank_b = [], []
+                    for pin in self.dut.triggers:
+                        bank_a.append((yield pin))
+                    for pin in self.dut.resets:
+                        bank_b.append((yield pin))
+                    result = (bank_a, bank_b)
+            except Exception as e:
+                exc = e
+
+            self._responses.put((result, exc))
+
+
+def report(bus_hz=400e3):
+    """
+    Run typical driver calls against the simulated gateware and print the transfers, bus
+    octets and simulated time each one costs.  Bus time is also given at ``bus_hz``, taking
+    9 clocks per octet plus one for each start, restart and stop condition.
+    """
+    backend = SimBackend()
+
+    ## The controller doesn't own a session it is given, so close the session (and with it the
+    ## simulation thread) here
+    with BusSession(backend=backend) as bus:
+        ctrl = TriggerController(bus)
+
+        def configure():
+            with ctrl.batch():
+                ctrl.clock_divider = 10
+                for idx in range(4):
+                    trigger = ctrl.trigger(idx)
+                    trigger.mode = "interval"
+                    trigger.interval = 33
+                    trigger.duration = 5
+                    trigger.delay = idx
+                for idx in range(6):
+                    ctrl.pin("A{}".format(idx)).trigger = idx % 4
+                ctrl.enable(mask=0x0F)
+
+        def stop():
+            with ctrl.batch():
+                ctrl.disable()
+                for idx in range(4):
+                    ctrl.trigger(idx).mode = "stop"
+
+        calls = [
+            ("ident", ctrl.ident),
+            ("write", lambda: setattr(ctrl, "clock_divider", 20)),
+            ("read (uncached)", lambda: ctrl.bus.read_register(_REG_POWER_SENSE)),
+            ("read (cached)", lambda: ctrl.clock_divider),
+            ("configure board", configure),
+            ("dump register map", lambda: (ctrl.cache.invalidate(), ctrl.bus.dump())),
+            ("stop", stop),
+        ]
+
+        print("{:20} {:>9} {:>8} {:>8} {:>12} {:>12}".format(
+            "call", "transfers", "messages", "octets", "sim (us)", "bus (us)"))
+
+        for name, func in calls:
+            backend.reset_stats()
+            func()
+
+            bits = backend.octets * 9 + backend.messages + backend.transfers
+            print("{:20} {:9} {:8} {:8} {:12.1f} {:12.1f}".format(
+                name, backend.transfers, backend.messages, backend.octets, 
+                backend.sim_time * 1e6, bits / bus_hz * 1e6))
+
+
+if __name__ == "__main__":
+    report()
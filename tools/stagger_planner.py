@@ -0,0 +1,181 @@
+import argparse
+import json
+
+from trigger_controller import TICK_HZ
+from board_config import BoardConfig, TRIGGER_COUNT, _pin_address
+
+
+class Plan:
+    """
+    Staggered readout plan made by plan() :
+
+    :attr assignment:
+        Mapping of crossbar pin name to trigger index.
+    :attr delays:
+        Mapping of trigger index to its Delay register value, in strobes.
+    :attr strobe:
+        Strobe period the delays are counted in, in seconds.
+    """
+
+    def __init__(self, readouts, assignment, delays, strobe):
+        self.readouts = readouts
+        self.assignment = assignment
+        self.delays = delays
+        self.strobe = strobe
+
+    @property
+    def skew(self):
+        """Spread of capture (trigger) times across all cameras, in seconds"""
+        used = [self.delays[idx] for idx in set(self.assignment.values())]
+        return (max(used) - min(used)) * self.strobe
+
+    def peak(self):
+        """
+        Largest number of cameras reading out at the same time, assuming readout starts at
+        the trigger edge and lasts the camera's readout time.
+        """
+        events = []
+
+        for name, idx in self.assignment.items():
+            start = self.delays[idx] * self.strobe
+            events.append((start, 1))
+            events.append((start + self.readouts[name], -1))
+
+        ## Ends sort before starts at the same instant, so back-to-back readouts don't overlap
+        events.sort()
+
+        active = 0
+        peak = 0
+        for _, step in events:
+            active += step
+            peak = max(peak, active)
+
+        return peak
+
+    def config(self, interval=None, duration=None, mode=None):
+        """
+        A BoardConfig routing every pin to its trigger and setting the trigger delays.  The
+        other trigger fields are only set when given, and then apply to every used trigger.
+        """
+        triggers = dict()
+
+        for idx in sorted(set(self.assignment.values())):
+            fields = dict(delay=self.delays[idx])
+
+            if interval is not None:
+                if self.delays[idx] >= interval:
+                    raise ValueError("Trigger{} delay {} does not fit in interval {}".format(idx, self.delays[idx], interval))
+                fields["interval"] = interval
+            if duration is not None:
+                fields["duration"] = duration
+            if mode is not None:
+                fields["mode"] = mode
+
+            triggers[idx] = fields
+
+        pins = {name: dict(trigger=idx) for name, idx in self.assignment.items()}
+
+        return BoardConfig(triggers=triggers, pins=pins)
+
+    def report(self):
+        lines = []
+
+        for idx in sorted(set(self.assignment.values())):
+            names = sorted(name for name, trig in self.assignment.items() if trig == idx)
+            lines.append("Trigger{}  delay {:3d} ({:8.1f} us)  {}".format(
+                idx, self.delays[idx], self.delays[idx] * self.strobe * 1e6, " ".join(names)))
+
+        lines.append("Skew {:.1f} us  peak concurrent readouts {}".format(self.skew * 1e6, self.peak()))
+
+        return "\n".join(lines)
+
+
+def _stagger(readouts, groups, max_skew, strobe):
+    ## Split the cameras over ``groups`` (longest first, onto the least loaded trigger), then
+    ## start the groups back to back, compressed into the skew budget
+    load = {idx: 0.0 for idx in groups}
+    longest = {idx: 0.0 for idx in groups}
+    assignment = dict()
+
+    for name, readout in sorted(readouts.items(), key=lambda item: (-item[1], item[0])):
+        idx = min(groups, key=lambda idx: (load[idx], groups.index(idx)))
+        assignment[name] = idx
+        load[idx] += readout
+        longest[idx] = max(longest[idx], readout)
+
+    starts = dict()
+    offset = 0.0
+    for idx in groups:
+        starts[idx] = offset
+        offset += longest[idx]
+
+    span = starts[groups[-1]]
+    scale = min(1.0, max_skew / span) if span > 0 else 1.0
+
+    ## Round down so the quantized plan stays within the skew bound
+    delays = {idx: int(starts[idx] * scale / strobe + 1e-9) for idx in groups}
+
+    return Plan(dict(readouts), assignment, delays, strobe)
+
+
+def plan(readouts, max_skew, clock_divider, triggers=range(TRIGGER_COUNT), width=8):
+    """
+    Spread camera readouts over the triggers.
+
+    ``readouts`` maps crossbar pin name (e.g. "A0") to that camera's readout time in seconds.
+    Cameras are split across the first N of ``triggers`` so that each group carries a
+    similar share of the readout time (longest first, onto the least loaded trigger).  The
+    groups are then delayed one after the other by the longest readout of the group before,
+    and the offsets compressed if needed so no capture is more than ``max_skew`` seconds
+    after the first.  Every N is tried, and the plan with the fewest concurrent readouts
+    kept (the smallest skew on a tie) : squeezing many groups into a tight skew budget can
+    overlap more readouts than fewer, larger groups spaced further apart.  Delays are in
+    strobes of the given Clock Divider, and must fit in Delay registers of ``width`` bits.
+    """
+    triggers = list(triggers)
+
+    for name in readouts.keys():
+        _pin_address(name)
+
+    for idx in triggers:
+        if idx not in range(TRIGGER_COUNT):
+            raise ValueError("Unknown trigger {!r}".format(idx))
+
+    if len(readouts) == 0 or len(triggers) == 0:
+        raise ValueError("Need at least one camera and one trigger")
+
+    strobe = clock_divider / TICK_HZ
+
+    candidates = [_stagger(readouts, triggers[:count], max_skew, strobe)
+        for count in range(1, min(len(readouts), len(triggers)) + 1)]
+    best = min(candidates, key=lambda candidate: (candidate.peak(), candidate.skew))
+
+    for idx, delay in best.delays.items():
+        if delay >= (1 << width):
+            raise ValueError("Trigger{} delay of {} strobes does not fit in the Delay register; "
+                "use a larger Clock Divider or a smaller skew bound".format(idx, delay))
+
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plan trigger delays that stagger camera readouts")
+    parser.add_argument("camera", nargs="+", help="PIN:READOUT_US for each camera, e.g. A0:8000 A1:8000")
+    parser.add_argument("--skew", type=float, required=True, help="largest allowed capture skew, in us")
+    parser.add_argument("--clock-divider", type=int, default=10, help="Clock Divider the delays are counted in")
+    parser.add_argument("--width", type=int, default=8, help="width of the trigger timing registers")
+    parser.add_argument("--config", action="store_true", help="print the plan as a JSON BoardConfig")
+    args = parser.parse_args()
+
+    readouts = dict()
+    for spec in args.camera:
+        name, readout = spec.split(":")
+        readouts[name] = float(readout) * 1e-6
+
+    result = plan(readouts, args.skew * 1e-6, args.clock_divider, width=args.width)
+
+    if args.config:
+        config = result.config()
+        print(json.dumps(dict(triggers=config.triggers, pins=config.pins), indent=2))
+    else:
+        print(result.report())
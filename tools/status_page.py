@@ -0,0 +1,231 @@
+import argparse
+import collections
+import mmap
+import os
+import struct
+import threading
+import time
+
+from trigger_controller import (
+    TRIG_MODE, _REG_TRIGGER_ENABLES, _REG_POWER_CONTROL,
+    _REG_POWER_SENSE, _REG_CLOCK_DIVIDER, _REG_TRIGGER0_MODE, _REG_TRIGGER1_MODE,
+)
+
+STATUS_PATH = "/dev/shm/trigger_status"
+
+MAGIC = b"CRTS"
+VERSION = 3
+
+## Room for the register map up to the DDS Tuning registers; smaller maps are zero padded
+REGISTER_COUNT = 0x70
+
+## Magic, layout version, total size, sequence number
+HEADER = struct.Struct("<4sHHI")
+SEQ_OFFSET = 8
+
+## Monotonic time of the poll (ns), poll count, failed poll count, copy of the register map
+BODY = struct.Struct("<QQI{}s".format(REGISTER_COUNT))
+BODY_OFFSET = HEADER.size
+
+SIZE = HEADER.size + BODY.size
+
+_MODE_NAMES = {v: k for k, v in TRIG_MODE.items()}
+
+
+class Status(collections.namedtuple("Status", ["seq", "timestamp", "polls", "errors", "registers"])):
+    """
+    One consistent status record.  ``registers`` is the register map from address 0x00, so
+    any register is ``registers[address]``.
+    """
+
+    @property
+    def enables(self):
+        return self.registers[_REG_TRIGGER_ENABLES]
+
+    @property
+    def power_control(self):
+        return self.registers[_REG_POWER_CONTROL]
+
+    @property
+    def power_sense(self):
+        return self.registers[_REG_POWER_SENSE]
+
+    @property
+    def clock_divider(self):
+        return self.registers[_REG_CLOCK_DIVIDER]
+
+    @property
+    def modes(self):
+        stride = _REG_TRIGGER1_MODE - _REG_TRIGGER0_MODE
+        return [_MODE_NAMES.get(self.registers[_REG_TRIGGER0_MODE + idx * stride]) for idx in range(4)]
+
+
+class StatusPublisher:
+    """
+    Writer side of the status page : a fixed-layout, versioned record in a memory-mapped file.
+
+    Updates use a sequence lock.  The sequence number is made odd before the record is
+    written and even again afterwards, so readers never block the writer; they retry if
+    they saw an odd number or the number changed during their copy.
+    """
+
+    def __init__(self, path=STATUS_PATH):
+        self.path = path
+        self.polls = 0
+        self.errors = 0
+        self._seq = 0
+        self._registers = bytes(REGISTER_COUNT)
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, SIZE)
+            self._map = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, SIZE, self._seq)
+        self._write()
+
+        self._thread = None
+        self._stop = threading.Event()
+
+    def close(self):
+        self.stop()
+        self._map.close()
+
+    def _write(self):
+        self._seq += 1
+        struct.pack_into("<I", self._map, SEQ_OFFSET, self._seq)
+
+        BODY.pack_into(self._map, BODY_OFFSET, time.monotonic_ns(), self.polls, self.errors, self._registers)
+
+        self._seq += 1
+        struct.pack_into("<I", self._map, SEQ_OFFSET, self._seq)
+
+    def publish(self, registers):
+        """Publish a new copy of the register map (from address 0x00)"""
+        self.polls += 1
+        self._registers = bytes(registers).ljust(REGISTER_COUNT, b"\x00")
+        self._write()
+
+    def failed(self):
+        """Record a failed poll, keeping the last good register copy"""
+        self.errors += 1
+        self._write()
+
+    def poll(self, ctrl):
+        """
+        Read the register map through the controller and publish it.  Shadowed registers are
+        not re-read, so each poll only fetches what the gateware changes by itself.
+        """
+        try:
+            registers = ctrl.bus.dump()
+        except OSError:
+            self.failed()
+        else:
+            self.publish(registers)
+
+    def start(self, ctrl, rate=10.0):
+        """
+        Poll ``ctrl`` at ``rate`` Hz from a background thread.  The controller's bus session
+        should be created with shared=True if it is also used from other threads.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(ctrl, 1.0 / rate), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, ctrl, period):
+        deadline = time.monotonic()
+
+        while not self._stop.is_set():
+            self.poll(ctrl)
+
+            deadline += period
+            self._stop.wait(max(0, deadline - time.monotonic()))
+
+
+class StatusReader:
+    """
+    Reader side of the status page.  After opening, reads are plain memory accesses : no
+    system calls and no bus traffic.
+    """
+
+    def __init__(self, path=STATUS_PATH):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), SIZE, access=mmap.ACCESS_READ)
+
+        magic, version, size, _ = HEADER.unpack_from(self._map, 0)
+
+        if magic != MAGIC or version != VERSION or size != SIZE:
+            self._map.close()
+            raise ValueError("{} is not a version {} status page".format(path, VERSION))
+
+    def close(self):
+        self._map.close()
+
+    def read(self, timeout=0.1):
+        """
+        Return the current Status.  Raises TimeoutError if no consistent copy could be taken
+        within ``timeout`` seconds, as happens when the writer died in the middle of an update.
+        """
+        deadline = time.monotonic() + timeout
+
+        while True:
+            seq = struct.unpack_from("<I", self._map, SEQ_OFFSET)[0]
+
+            if not seq & 1:
+                body = BODY.unpack_from(self._map, BODY_OFFSET)
+
+                if struct.unpack_from("<I", self._map, SEQ_OFFSET)[0] == seq:
+                    return Status(seq, *body)
+
+            if time.monotonic() >= deadline:
+                raise TimeoutError("No consistent status record within {} s".format(timeout))
+
+            ## Let the writer finish its update
+            time.sleep(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish or read the trigger board status page")
+    parser.add_argument("command", choices=["publish", "read"])
+    parser.add_argument("--path", default=STATUS_PATH, help="status page file")
+    parser.add_argument("--rate", type=float, default=10.0, help="polls per second when publishing")
+    parser.add_argument("--fake", action="store_true", help="publish a FakeDevice instead of the board")
+    args = parser.parse_args()
+
+    if args.command == "read":
+        reader = StatusReader(args.path)
+        status = reader.read()
+        reader.close()
+
+        print("seq {}  polls {}  errors {}".format(status.seq, status.polls, status.errors))
+        print("enables 0x{:02x}  clock divider {}  power 0x{:02x} / 0x{:02x}  modes {}".format(
+            status.enables, status.clock_divider, status.power_control, status.power_sense, status.modes))
+
+    else:
+        from trigger_controller import BusSession, TriggerController
+
+        if args.fake:
+            from fake_device import FakeDevice
+            bus = BusSession(backend=FakeDevice())
+        else:
+            bus = BusSession()
+
+        publisher = StatusPublisher(args.path)
+
+        try:
+            publisher.start(TriggerController(bus), args.rate)
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            publisher.close()
+            bus.close()
@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+
+from async_trigger_controller import AsyncTriggerController
+from fake_device import FakeDevice
+from trigger_controller import BusSession
+
+
+class AsyncTriggerControllerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.device = FakeDevice()
+        self.bus = BusSession(backend=self.device)
+
+    def run_async(self, coro):
+        async def main():
+            async with AsyncTriggerController(self.bus) as ctrl:
+                return await coro(ctrl)
+
+        return asyncio.run(main())
+
+    def test_writes_batched(self):
+        async def configure(ctrl):
+            await ctrl.trigger(0).interval()
+            self.device.transfers = 0
+
+            await asyncio.gather(ctrl.trigger(0).set_interval(20), ctrl.trigger(0).set_duration(5))
+
+        self.run_async(configure)
+        self.assertEqual(self.device.transfers, 1)
+        self.assertEqual(self.device.regs[0x41:0x43], bytes([20, 5]))
+
+    def test_failed_write_dropped(self):
+        def partial(ctrl):
+            ctrl.trigger(1).interval = 30
+            raise ValueError("partial")
+
+        async def configure(ctrl):
+            return await asyncio.gather(ctrl.trigger(0).set_interval(20), ctrl.call(partial), 
+                ctrl.trigger(0).set_duration(5), return_exceptions=True)
+
+        results = self.run_async(configure)
+
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(self.device.regs[0x41:0x43], bytes([20, 5]))
+        self.assertEqual(self.device.regs[0x49], 0)
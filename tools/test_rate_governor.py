@@ -0,0 +1,43 @@
+import unittest
+
+from fake_device import FakeDevice
+from rate_governor import RateGovernor
+from trigger_controller import BusSession, TriggerController
+
+
+class RateGovernorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctrl = TriggerController(BusSession(backend=FakeDevice()))
+        self.ctrl.clock_divider = 10
+
+        self.level = 0
+
+    def governor(self, idx):
+        return RateGovernor(self.ctrl, lambda: self.level, triggers=(idx,), step=1.0, holdoff=0)
+
+    def test_interval(self):
+        trigger = self.ctrl.trigger(0)
+        trigger.interval = 33
+        trigger.mode = "interval"
+        governor = self.governor(0)
+
+        self.level = 10
+        self.assertTrue(governor.update(now=0))
+        self.assertEqual(trigger.interval, 66)
+
+    def test_dds(self):
+        trigger = self.ctrl.trigger(1)
+        trigger.rate = 30
+        trigger.mode = "dds"
+        tuning = trigger.tuning
+        governor = self.governor(1)
+
+        self.level = 10
+        self.assertTrue(governor.update(now=0))
+        self.assertEqual(trigger.tuning, round(tuning / 2))
+        self.assertAlmostEqual(trigger.rate, 15, places=3)
+        self.assertAlmostEqual(governor.rates()[1], 15, places=3)
+
+        self.level = 0
+        self.assertTrue(governor.update(now=1))
+        self.assertEqual(trigger.tuning, tuning)
@@ -0,0 +1,16 @@
+import contextlib
+import io
+import threading
+import unittest
+
+from sim_backend import report
+
+
+class SimBackendTestCase(unittest.TestCase):
+    def test_report_closes_backend(self):
+        threads = set(threading.enumerate())
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            report()
+
+        self.assertIn("configure board", out.getvalue())
+        self.assertEqual(set(threading.enumerate()), threads)
@@ -0,0 +1,21 @@
+import unittest
+
+from stagger_planner import plan
+
+
+class StaggerPlannerTestCase(unittest.TestCase):
+    def test_fewer_groups_overlap_less(self):
+        ## Four groups squeezed into 20 ms overlap two pairs; three pairs fit back to back
+        readouts = {"A{}".format(idx): 8e-3 for idx in range(6)}
+        result = plan(readouts, 20e-3, clock_divider=10)
+
+        self.assertEqual(result.peak(), 2)
+        self.assertEqual(sorted(result.delays.values()), [0, 8, 16])
+        self.assertLessEqual(result.skew, 20e-3)
+
+    def test_all_triggers_when_they_fit(self):
+        readouts = {"A{}".format(idx): 8e-3 for idx in range(4)}
+        result = plan(readouts, 40e-3, clock_divider=10)
+
+        self.assertEqual(result.peak(), 1)
+        self.assertEqual(sorted(result.delays.values()), [0, 8, 16, 24])
@@ -0,0 +1,20 @@
+import unittest
+
+from timing_solver import solve
+
+
+class TimingSolverTestCase(unittest.TestCase):
+    def test_same_period_prefers_exposure(self):
+        ## Dividers 3 and 37 both give a 333 tick period at 30 Hz; only 3 gets near 5 ms
+        solution = solve({0: (30, 5e-3, 0)})
+        timing = solution.timings[0]
+
+        self.assertEqual(solution.clock_divider * timing.interval, 333)
+        self.assertEqual(solution.clock_divider, 3)
+        self.assertAlmostEqual(timing.exposure, 5.1e-3)
+
+    def test_exact_rate(self):
+        solution = solve({0: (30, 500e-6, 0), 1: (10, 2e-3, 1e-3)})
+
+        self.assertEqual(solution.timings[1].rate_error, 0)
+        self.assertEqual(solution.clock_divider * solution.timings[0].interval, 332)
@@ -0,0 +1,159 @@
+import unittest
+
+from fake_device import FakeDevice
+from trigger_controller import (
+    BusSession, TriggerController, register_map, shadow_bit, _REG_CLOCK_DIVIDER, _REG_CROSSBAR_A0, _REG_CROSSBAR_B7,
+    _REG_SHADOW_HOLD, _REG_TRIGGER_ENABLES, _REG_TRIGGER0_FINE_DELAY, _REG_TRIGGER0_TUNING, _REG_TRIGGER1_MODE,
+)
+
+
+class TriggerControllerTestCase(unittest.TestCase):
+
+    def controller(self, **kwargs):
+        self.device = FakeDevice(**kwargs)
+        return TriggerController(BusSession(backend=self.device))
+
+    def assertRestoreDisables(self, ctrl, change):
+        ## Run triggers 0 and 1, change one register of Trigger1 and restore : only Trigger1 must
+        ## be disabled while it is rewritten
+        ctrl.trigger(0).mode = "interval"
+        ctrl.trigger(1).mode = "interval"
+        ctrl.enable(mask=0b11)
+        snapshot = ctrl.snapshot()
+
+        change(ctrl.trigger(1))
+        writes = ctrl.restore(snapshot)
+
+        self.assertEqual(writes[0], (_REG_TRIGGER_ENABLES, 0b01))
+        self.assertEqual(writes[-1], (_REG_TRIGGER_ENABLES, 0b11))
+        self.assertEqual(bytes(ctrl.snapshot(refresh=True)), bytes(snapshot))
+
+    def test_restore_interval(self):
+        self.assertRestoreDisables(self.controller(), lambda trigger: setattr(trigger, "interval", 20))
+
+    def test_restore_tuning(self):
+        self.assertRestoreDisables(self.controller(), lambda trigger: setattr(trigger, "tuning", 12872017))
+
+    def test_restore_fine_delay(self):
+        self.assertRestoreDisables(self.controller(fine_clock=48), lambda trigger: setattr(trigger, "fine_delay", 100))
+
+    def test_staged_commit(self):
+        ctrl = self.controller()
+        ctrl.trigger(0).interval = 10
+
+        with ctrl.staged(triggers=0b1, pins=0b1):
+            ctrl.trigger(0).interval = 30
+            ctrl.pin("A0").trigger = 0
+            self.assertEqual(self.device.live(0x41), 10)
+
+        self.assertEqual(self.device.live(0x41), 30)
+        self.assertEqual(self.device.live(_REG_CROSSBAR_A0), 0b1100_0000)
+        self.assertEqual(self.device.regs[_REG_SHADOW_HOLD:_REG_SHADOW_HOLD+3], bytes(3))
+
+    def test_staged_block_raises(self):
+        ctrl = self.controller()
+        ctrl.trigger(0).interval = 10
+
+        with self.assertRaises(ValueError):
+            with ctrl.staged(triggers=0b1):
+                ctrl.trigger(0).interval = 30
+                raise ValueError("abandoned")
+
+        ## Nothing was written, and plain writes still take effect
+        self.assertEqual(self.device.regs[0x41], 10)
+        self.assertEqual(self.device.regs[_REG_SHADOW_HOLD], 0)
+
+        ctrl.trigger(0).interval = 40
+        self.assertEqual(self.device.live(0x41), 40)
+
+    def test_staged_timeout(self):
+        ctrl = self.controller()
+        self.device.applies_commits = False
+
+        with self.assertRaises(TimeoutError):
+            with ctrl.staged(triggers=0b1, timeout=0.01):
+                ctrl.trigger(0).interval = 30
+
+        ## The hold is released rather than left set
+        self.assertEqual(self.device.regs[_REG_SHADOW_HOLD], 0)
+        self.assertEqual(self.device.live(0x41), 30)
+
+        self.device.applies_commits = True
+        with ctrl.staged(triggers=0b10):
+            ctrl.trigger(1).interval = 20
+
+        self.assertEqual(self.device.regs[_REG_SHADOW_HOLD], 0)
+
+    def test_staged_in_batch(self):
+        ctrl = self.controller()
+
+        with self.assertRaises(ValueError):
+            with ctrl.batch():
+                with ctrl.staged():
+                    pass
+
+    def test_batch(self):
+        ctrl = self.controller()
+        ctrl.enables
+        transfers = self.device.transfers
+
+        with ctrl.batch():
+            ctrl.trigger(0).interval = 20
+            ctrl.trigger(0).mode = "interval"
+            ctrl.enable(mask=1)
+
+        self.assertEqual(self.device.transfers, transfers + 1)
+        self.assertEqual(self.device.regs[0x40:0x42], bytes([2, 20]))
+        self.assertEqual(self.device.regs[_REG_TRIGGER_ENABLES], 1)
+
+    def test_batch_raises(self):
+        ctrl = self.controller()
+
+        with self.assertRaises(KeyError):
+            with ctrl.batch():
+                ctrl.enable(mask=1)
+                ctrl.trigger(0).mode = "intervall"
+
+        self.assertEqual(self.device.regs[_REG_TRIGGER_ENABLES], 0)
+        self.assertEqual(ctrl.enables, 0)
+
+    def test_write_out_of_range(self):
+        ctrl = self.controller()
+        ctrl.trigger(0).interval = 20
+
+        for write in (lambda: setattr(ctrl.trigger(0), "interval", 300),
+                      lambda: ctrl.bus.write_register(0x41, [20, 256]),
+                      lambda: ctrl.bus.prepare_write(0x41, -1)):
+            with self.assertRaises(ValueError):
+                write()
+
+        with self.assertRaises(ValueError):
+            with ctrl.batch():
+                ctrl.trigger(0).interval = 300
+
+        self.assertEqual(self.device.regs[0x41:0x43], bytes([20, 0]))
+        self.assertEqual(ctrl.trigger(0).interval, 20)
+
+    def test_shadow_bit(self):
+        self.assertEqual(shadow_bit(_REG_CROSSBAR_A0), 8)
+        self.assertEqual(shadow_bit(_REG_CROSSBAR_B7), 23)
+        self.assertEqual(shadow_bit(_REG_TRIGGER1_MODE + 1), 1)
+        self.assertEqual(shadow_bit(_REG_TRIGGER0_FINE_DELAY + 7), 3)
+        self.assertEqual(shadow_bit(_REG_TRIGGER0_TUNING + 8), 2)
+        self.assertIsNone(shadow_bit(_REG_TRIGGER1_MODE))
+        self.assertIsNone(shadow_bit(_REG_CLOCK_DIVIDER))
+
+    def test_capabilities(self):
+        ctrl = self.controller()
+        self.assertTrue(ctrl.prescalers and ctrl.dds and ctrl.shadow)
+
+        ## A revision 8 build without the optional features must not be driven as if it had them
+        ctrl = self.controller(prescalers=False, dds=False, shadow=False)
+        self.assertFalse(ctrl.prescalers or ctrl.dds or ctrl.shadow)
+        self.assertEqual(ctrl.registers, register_map(fine_clock=0, capabilities=True))
+
+        with self.assertRaises(ValueError):
+            ctrl.trigger(0).tuning = 1
+        with self.assertRaises(ValueError):
+            with ctrl.staged():
+                pass
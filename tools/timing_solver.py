@@ -0,0 +1,161 @@
+import argparse
+import collections
+import json
+from fractions import Fraction
+
+from trigger_controller import TICK_HZ
+from board_config import BoardConfig, TRIGGER_COUNT
+
+## Register limits : the Clock Divider feeds a Divider whose period must be non-zero, and the
+## trigger counters are 8 bits (unless the gateware is built wider) with zero meaning "not set"
+DIVIDER_RANGE = range(1, 256)
+COUNTER_MAX = 255
+
+## Requested timing of one trigger : rate in Hz, exposure pulse width and phase delay in seconds
+Target = collections.namedtuple("Target", ["rate", "exposure", "phase"])
+
+## Register values of one trigger and the timing they achieve
+Timing = collections.namedtuple("Timing", 
+    ["interval", "duration", "delay", "rate", "rate_error", "exposure", "phase"])
+
+
+class Solution:
+    """
+    Register values found by solve() : the shared ``clock_divider`` and a Timing per trigger.
+    """
+
+    def __init__(self, clock_divider, timings):
+        self.clock_divider = clock_divider
+        self.timings = timings
+
+    @property
+    def strobe(self):
+        """Period of the trigger strobe, in seconds"""
+        return self.clock_divider / TICK_HZ
+
+    @property
+    def max_rate_error(self):
+        return max(abs(timing.rate_error) for timing in self.timings.values())
+
+    def config(self, mode="interval"):
+        """A BoardConfig applying this solution, with the solved triggers set to ``mode``"""
+        triggers = {idx: dict(interval=timing.interval, duration=timing.duration, delay=timing.delay, mode=mode)
+            for idx, timing in self.timings.items()}
+
+        return BoardConfig(clock_divider=self.clock_divider, triggers=triggers)
+
+    def report(self):
+        lines = ["Clock Divider {:3d}  strobe {:.1f} us".format(self.clock_divider, self.strobe * 1e6)]
+
+        for idx, timing in sorted(self.timings.items()):
+            lines.append("Trigger{}  interval {:3d} duration {:3d} delay {:3d}  "
+                "{:10.4f} Hz ({:+.4%})  exposure {:.1f} us  phase {:.1f} us".format(
+                idx, timing.interval, timing.duration, timing.delay, 
+                timing.rate, timing.rate_error, timing.exposure * 1e6, timing.phase * 1e6))
+
+        return "\n".join(lines)
+
+
+def _timing(target, divider, tolerance, counter_max):
+    ## Best register values for one trigger at a given Clock Divider, None if out of range
+    ## or if the exposure or phase can't be represented within tolerance
+    strobe = divider / TICK_HZ
+
+    interval = max(1, round(1 / (target.rate * strobe)))
+    duration = max(1, round(target.exposure / strobe))
+    delay = round(target.phase / strobe)
+
+    if interval > counter_max or duration > counter_max or delay > counter_max:
+        return None
+
+    ## The delayed pulse must end before the next interval starts : the gateware restarts the
+    ## duration count on every interval, cutting short or merging a pulse still running
+    if delay + duration >= interval:
+        return None
+
+    if abs(duration * strobe - target.exposure) > tolerance * target.exposure:
+        return None
+
+    if abs(delay * strobe - target.phase) > tolerance * target.exposure:
+        return None
+
+    rate = 1 / (interval * strobe)
+
+    return Timing(interval, duration, delay, rate, rate / target.rate - 1, duration * strobe, delay * strobe)
+
+
+def solve(targets, tolerance=0.5, width=8):
+    """
+    Find register values for several triggers sharing one Clock Divider.
+
+    ``targets`` maps trigger index to a Target (or a (rate, exposure, phase) tuple).  Every
+    Clock Divider is tried; among those which give each exposure within ``tolerance`` (a
+    fraction of the exposure) and each phase within the same absolute error, the solution
+    has the smallest worst-case relative rate error, then the smallest total rate error, then
+    the smallest total exposure and phase error, then the finest strobe.  ``width`` is the
+    width of the timing registers (the controller's ``timing_width``).  Raises ValueError when no Clock Divider fits.
+    """
+    targets = {idx: Target(*target) for idx, target in targets.items()}
+
+    for idx, target in targets.items():
+        if idx not in range(TRIGGER_COUNT):
+            raise ValueError("Unknown trigger {!r}".format(idx))
+        if target.rate <= 0 or target.exposure <= 0 or target.phase < 0:
+            raise ValueError("Trigger{} needs a positive rate and exposure and a non-negative phase".format(idx))
+
+    counter_max = (1 << width) - 1
+    best = None
+    best_key = None
+
+    for divider in DIVIDER_RANGE:
+        timings = {idx: _timing(target, divider, tolerance, counter_max) for idx, target in targets.items()}
+
+        if None in timings.values():
+            continue
+
+        ## Compare the exact periods (interval * divider ticks) rather than the float rate
+        ## errors, so that dividers giving the same period tie and the exposure error decides
+        errors = []
+        offsets = []
+        for idx, target in targets.items():
+            timing = timings[idx]
+            exposure = Fraction(target.exposure)
+            errors.append(abs(TICK_HZ / (Fraction(target.rate) * timing.interval * divider) - 1))
+            offsets.append((abs(Fraction(timing.duration * divider, TICK_HZ) - exposure) +
+                abs(Fraction(timing.delay * divider, TICK_HZ) - Fraction(target.phase))) / exposure)
+
+        key = (max(errors), sum(errors), sum(offsets), divider)
+
+        if best_key is None or key < best_key:
+            best, best_key = Solution(divider, timings), key
+
+    if best is None:
+        raise ValueError("No Clock Divider fits all targets in {}-bit Interval, Duration and Delay registers "
+            "with {:.0%} exposure tolerance".format(width, tolerance))
+
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve trigger register values for target frame rates")
+    parser.add_argument("target", nargs="+", 
+        help="IDX:RATE_HZ:EXPOSURE_US[:PHASE_US] for each trigger, e.g. 0:30:500 1:10:2000:1000")
+    parser.add_argument("--tolerance", type=float, default=0.5, 
+        help="allowed exposure and phase error, as a fraction of the exposure (default 0.5)")
+    parser.add_argument("--width", type=int, default=8, help="width of the trigger timing registers")
+    parser.add_argument("--config", action="store_true", help="print the solution as a JSON BoardConfig")
+    args = parser.parse_args()
+
+    targets = dict()
+    for spec in args.target:
+        fields = spec.split(":")
+        phase = float(fields[3]) if len(fields) > 3 else 0
+        targets[int(fields[0])] = Target(float(fields[1]), float(fields[2]) * 1e-6, phase * 1e-6)
+
+    solution = solve(targets, args.tolerance, args.width)
+
+    if args.config:
+        config = solution.config()
+        print(json.dumps(dict(clock_divider=config.clock_divider, triggers=config.triggers), indent=2))
+    else:
+        print(solution.report())
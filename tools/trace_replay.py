@@ -0,0 +1,132 @@
+import argparse
+import time
+
+from smbus2 import i2c_msg
+from smbus2.smbus2 import i2c_rdwr_ioctl_data
+
+from bus_trace import TraceBuffer
+from trigger_controller import LinuxBackend, I2CBUS
+
+
+def transfers(records):
+    """Group trace records back into the transfers they were issued as"""
+    group = []
+
+    for record in records:
+        if not record.continued and len(group) > 0:
+            yield group
+            group = []
+        group.append(record)
+
+    if len(group) > 0:
+        yield group
+
+
+def messages(group):
+    """
+    The I2C messages of one transfer.  Truncated reads are replayed with the recorded length,
+    but a truncated write can't be replayed faithfully and raises ValueError.
+    """
+    msgs = []
+
+    for record in group:
+        if record.truncated and not record.read:
+            raise ValueError("Write of register {} was truncated in the trace".format(hex(record.address)))
+
+        if record.read:
+            if record.address != 0xFF:
+                msgs.append(i2c_msg.write(record.device, [record.address]))
+            msgs.append(i2c_msg.read(record.device, len(record.data)))
+        else:
+            msgs.append(i2c_msg.write(record.device, bytes([record.address]) + record.data))
+
+    return msgs
+
+
+def replay(records, backend, speed=1.0):
+    """
+    Re-issue the transfers of a trace against ``backend``.
+
+    With ``speed`` 1.0 transfers are issued at their original spacing, larger values
+    compress the timeline by that factor, and 0 issues them back-to-back.  Returns a list of
+    (lateness in ns, duration in ns, original duration in ns) per transfer, where lateness is
+    how far behind the scheduled issue time each transfer went out.
+    """
+    groups = list(transfers(records))
+    results = []
+
+    if len(groups) == 0:
+        return results
+
+    origin = groups[0][0].timestamp
+    start = time.perf_counter_ns()
+
+    for group in groups:
+        data = i2c_rdwr_ioctl_data.create(*messages(group))
+
+        if speed > 0:
+            due = start + (group[0].timestamp - origin) / speed
+            while True:
+                remaining = due - time.perf_counter_ns()
+                if remaining <= 0:
+                    break
+                ## Sleep most of the wait and spin the final stretch for accurate issue times
+                if remaining > 2e6:
+                    time.sleep((remaining - 1e6) / 1e9)
+        else:
+            due = time.perf_counter_ns()
+
+        issued = time.perf_counter_ns()
+        try:
+            backend.rdwr(data)
+        except OSError:
+            if not group[0].error:
+                raise
+        done = time.perf_counter_ns()
+
+        results.append((issued - due, done - issued, group[0].duration))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a captured bus trace")
+    parser.add_argument("trace", help="trace file written by TraceBuffer.dump()")
+    parser.add_argument("--speed", type=float, default=1.0, help="timeline compression factor; 0 for back-to-back")
+    parser.add_argument("--bus", type=int, default=I2CBUS, help="I2C bus to replay on")
+    parser.add_argument("--fake", action="store_true", help="replay against FakeDevice instead of hardware")
+    parser.add_argument("--sim", action="store_true", help="replay against the simulated gateware")
+    args = parser.parse_args()
+
+    records = TraceBuffer.load(args.trace)
+
+    if args.fake:
+        from fake_device import FakeDevice
+        backend = FakeDevice()
+    elif args.sim:
+        from sim_backend import SimBackend
+        backend = SimBackend()
+    else:
+        backend = LinuxBackend(args.bus)
+
+    try:
+        results = replay(records, backend, args.speed)
+    finally:
+        backend.close()
+
+    if len(results) == 0:
+        print("Trace is empty")
+        return
+
+    lateness = sorted(late for late, _, _ in results)
+    durations = [duration for _, duration, _ in results]
+    original = [duration for _, _, duration in results]
+
+    print("Replayed {} transfers ({} records)".format(len(results), len(records)))
+    print("Issue lateness  : median {:.1f} us, max {:.1f} us".format(
+        lateness[len(lateness) // 2] / 1e3, lateness[-1] / 1e3))
+    print("Transfer time   : total {:.1f} us (captured {:.1f} us)".format(sum(durations) / 1e3, sum(original) / 1e3))
+
+
+if __name__ == "__main__":
+    main()
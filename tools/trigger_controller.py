@@ -1,11 +1,56 @@
+import contextlib
+import ctypes
+import fcntl
+import functools
 import logging
+import sys
+import threading
 import time
 from smbus2 import SMBus, i2c_msg
+from smbus2.smbus2 import i2c_rdwr_ioctl_data, I2C_RDWR, I2C_M_RD
+
+from bus_metrics import BusMetrics
+from bus_trace import TraceBuffer, traced
 
 DEVICE_ADDRESS = 0x08
 DELAY = 0.001
 I2CBUS = 2
 
+## First gateware revision with an auto-incrementing register pointer
+_BURST_GATEWARE_REVISION = 2
+
+## First gateware revision reporting the width of the trigger timing registers
+_WIDE_GATEWARE_REVISION = 3
+
+## First gateware revision with a Prescaler register per trigger
+_PRESCALER_GATEWARE_REVISION = 4
+
+## First gateware revision reporting the clock of the trigger Fine Delay registers
+_FINE_GATEWARE_REVISION = 5
+
+## First gateware revision with the DDS trigger mode and its Tuning registers
+_DDS_GATEWARE_REVISION = 6
+
+## First gateware revision with double buffered trigger and crossbar registers (Shadow Hold, Commit)
+_SHADOW_GATEWARE_REVISION = 7
+
+## First gateware revision reporting which optional features it was built with (Capabilities)
+_CAPABILITY_GATEWARE_REVISION = 8
+
+## Bits of the Capabilities register
+_CAP_PRESCALERS = 0
+_CAP_DDS = 1
+_CAP_SHADOW = 2
+
+## Rate of the gateware tick which the Clock Divider register divides down to the trigger strobe
+TICK_HZ = 10_000
+
+## Width of the DDS phase accumulator : a trigger in dds mode fires strobe * tuning / 2^32 times a second
+TUNING_BITS = 32
+
+## Linux caps the number of messages in a single I2C_RDWR ioctl (I2C_RDWR_IOCTL_MAX_MSGS)
+RDWR_MAX_MSGS = 42
+
 def const(value):
     return value
 
@@ -15,6 +60,9 @@ _REG_GATEWARE_REVISION    = const(0x07)
 _REG_CAMERA_COUNT         = const(0x0A)
 _REG_GPIO_COUNT           = const(0x0B)
 _REG_TRIGGER_COUNT        = const(0x0C)
+_REG_TIMING_WIDTH         = const(0x0D)
+_REG_FINE_CLOCK           = const(0x0E)
+_REG_CAPABILITIES         = const(0x0F)
 _REG_CLOCK_DIVIDER        = const(0x14)
 _REG_POWER_CONTROL        = const(0x15)
 _REG_POWER_SENSE          = const(0x16)
@@ -23,18 +71,26 @@ _REG_TRIGGER0_MODE        = const(0x40)
 _REG_TRIGGER0_INTERVAL    = const(0x41)
 _REG_TRIGGER0_DURATION    = const(0x42)
 _REG_TRIGGER0_DELAY       = const(0x43)
+_REG_TRIGGER0_PRESCALER   = const(0x47)
 _REG_TRIGGER1_MODE        = const(0x48)
 _REG_TRIGGER1_INTERVAL    = const(0x49)
 _REG_TRIGGER1_DURATION    = const(0x4A)
 _REG_TRIGGER1_DELAY       = const(0x4B)
+_REG_TRIGGER1_PRESCALER   = const(0x4F)
 _REG_TRIGGER2_MODE        = const(0x50)
 _REG_TRIGGER2_INTERVAL    = const(0x51)
 _REG_TRIGGER2_DURATION    = const(0x52)
 _REG_TRIGGER2_DELAY       = const(0x53)
+_REG_TRIGGER2_PRESCALER   = const(0x57)
 _REG_TRIGGER3_MODE        = const(0x58)
 _REG_TRIGGER3_INTERVAL    = const(0x59)
 _REG_TRIGGER3_DURATION    = const(0x5A)
 _REG_TRIGGER3_DELAY       = const(0x5B)
+_REG_TRIGGER3_PRESCALER   = const(0x5F)
+_REG_TRIGGER0_TUNING      = const(0x60)
+_REG_TRIGGER1_TUNING      = const(0x64)
+_REG_TRIGGER2_TUNING      = const(0x68)
+_REG_TRIGGER3_TUNING      = const(0x6C)
 _REG_CROSSBAR_A0          = const(0x20)
 _REG_CROSSBAR_A1          = const(0x21)
 _REG_CROSSBAR_A2          = const(0x22)
@@ -51,21 +107,169 @@ _REG_CROSSBAR_B4          = const(0x2C)
 _REG_CROSSBAR_B5          = const(0x2D)
 _REG_CROSSBAR_B6          = const(0x2E)
 _REG_CROSSBAR_B7          = const(0x2F)
+_REG_TRIGGER0_FINE_DELAY  = const(0x30)
+_REG_TRIGGER1_FINE_DELAY  = const(0x32)
+_REG_TRIGGER2_FINE_DELAY  = const(0x34)
+_REG_TRIGGER3_FINE_DELAY  = const(0x36)
+_REG_SHADOW_HOLD          = const(0x38)
+_REG_COMMIT               = const(0x3D)
 
 TRIG_MODE = dict(
     stop = 0x00,
     idle = 0x01,
     interval = 0x02,
     oneshot = 0x03,
-    constant = 0x04
+    constant = 0x04,
+    dds = 0x05
 )
 
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+def trigger_offsets(width=8):
+    """
+    Offsets of the Interval, Duration and Delay registers from a trigger's Mode register,
+    for timing registers of ``width`` bits.  Wider registers are little endian and follow
+    each other in the trigger's 8 byte block.
+    """
+    length = width // 8
+    return dict(interval=1, duration=1+length, delay=1+2*length)
+
+
+def tuning_word(rate, strobe):
+    """
+    DDS tuning word giving the closest average ``rate`` (Hz) for a trigger counting strobes
+    ``strobe`` seconds apart.  Raises ValueError when the rate is out of reach.
+    """
+    word = round(rate * strobe * (1 << TUNING_BITS))
+
+    if word < 1 or word >= (1 << TUNING_BITS):
+        raise ValueError("A rate of {} Hz can't be generated from a {} us strobe".format(rate, strobe * 1e6))
+
+    return word
+
+
+def tuning_rate(word, strobe):
+    """Average rate (Hz) a DDS tuning word achieves for strobes ``strobe`` seconds apart"""
+    return word / (1 << TUNING_BITS) / strobe
+
+
+def register_map(width=8, prescalers=False, fine_clock=None, dds=False, shadow=False, capabilities=False):
+    """
+    Name, address, length and read-only flag of every register in the gateware, for
+    trigger timing registers of ``width`` bits (as reported by the Timing Width register).
+    ``prescalers`` adds the per-trigger Prescaler registers of gateware revision 4 and later.
+    ``fine_clock`` is the value of the Fine Clock register of revision 5 and later (None before);
+    when it is non-zero the gateware also has a Fine Delay register per trigger.  ``dds`` adds
+    the Tuning registers of revision 6 and later, ``shadow`` the Shadow Hold and Commit
+    registers of revision 7 and later, and ``capabilities`` the Capabilities register of
+    revision 8 and later.
+    """
+    offsets = trigger_offsets(width)
+
+    fields = [
+        ("Mode", _REG_TRIGGER0_MODE, 1), 
+        ("Interval", _REG_TRIGGER0_MODE + offsets["interval"], width // 8), 
+        ("Duration", _REG_TRIGGER0_MODE + offsets["duration"], width // 8), 
+        ("Delay", _REG_TRIGGER0_MODE + offsets["delay"], width // 8),
+    ]
+
+    if prescalers:
+        fields.append(("Prescaler", _REG_TRIGGER0_PRESCALER, 1))
+
+    registers = [
+        ("Product ID",          _REG_PRODUCT_ID,        6, True),
+        ("Hardware Revision",   _REG_HARDWARE_REVISION, 1, True),
+        ("Gateware Revision",   _REG_GATEWARE_REVISION, 1, True),
+        ("Camera Count",        _REG_CAMERA_COUNT,      1, True),
+        ("GPIO Count",          _REG_GPIO_COUNT,        1, True),
+        ("Trigger Count",       _REG_TRIGGER_COUNT,     1, True),
+        ("Timing Width",        _REG_TIMING_WIDTH,      1, True),
+        ("Clock Divider",       _REG_CLOCK_DIVIDER,     1, False),
+        ("Power Control",       _REG_POWER_CONTROL,     1, False),
+        ("Power Sense",         _REG_POWER_SENSE,       1, True),
+    ] + [
+        ("Crossbar {}{}".format(bank, idx), base + idx, 1, False)
+            for bank, base in (("A", _REG_CROSSBAR_A0), ("B", _REG_CROSSBAR_B0)) for idx in range(8)
+    ] + [
+        ("Trigger Enables",     _REG_TRIGGER_ENABLES,   1, False),
+    ] + [
+        ("Trigger{} {}".format(idx, field), base + idx * (_REG_TRIGGER1_MODE - _REG_TRIGGER0_MODE), length, False)
+            for idx in range(4) for field, base, length in fields
+    ]
+
+    if fine_clock is not None:
+        registers.append(("Fine Clock", _REG_FINE_CLOCK, 1, True))
+
+    if capabilities:
+        registers.append(("Capabilities", _REG_CAPABILITIES, 1, True))
+
+    if fine_clock:
+        registers += [
+            ("Trigger{} Fine Delay".format(idx), _REG_TRIGGER0_FINE_DELAY + 2 * idx, 2, False) for idx in range(4)
+        ]
+
+    if dds:
+        registers += [
+            ("Trigger{} Tuning".format(idx), _REG_TRIGGER0_TUNING + 4 * idx, 4, False) for idx in range(4)
+        ]
+
+    if shadow:
+        registers += [
+            ("Shadow Hold",     _REG_SHADOW_HOLD,       3, False),
+            ("Commit",          _REG_COMMIT,            3, False),
+        ]
+
+    ## In address order, which is also the order restore() writes them in
+    return sorted(registers, key=lambda register: register[1])
+
+
+REGISTER_MAP = register_map()
+
+## Registers driven by the gateware rather than the host, which are always re-fetched.
+## The gateware clears the Commit register once it has applied the commit.
+_VOLATILE_REGISTERS = [_REG_POWER_SENSE] + [_REG_COMMIT + idx for idx in range(3)]
+
+## The gateware moves a trigger mode from oneshot to idle, and then idle to stop, on its own.
+## A cached mode is only trusted while it is in one of the other (host controlled) modes.
+_MODE_REGISTERS = [_REG_TRIGGER0_MODE + idx * (_REG_TRIGGER1_MODE - _REG_TRIGGER0_MODE) for idx in range(4)]
+_TRANSIENT_MODES = [TRIG_MODE['oneshot'], TRIG_MODE['idle']]
+
+def _register_trigger(address):
+    ## Index of the trigger a register belongs to (its block from Mode on, Fine Delay or
+    ## Tuning), or None for registers shared by all triggers
+    if _REG_TRIGGER0_FINE_DELAY <= address < _REG_TRIGGER0_FINE_DELAY + 2 * 4:
+        return (address - _REG_TRIGGER0_FINE_DELAY) // 2
+
+    if _REG_TRIGGER0_MODE <= address < _REG_TRIGGER0_TUNING:
+        return (address - _REG_TRIGGER0_MODE) // (_REG_TRIGGER1_MODE - _REG_TRIGGER0_MODE)
+
+    if _REG_TRIGGER0_TUNING <= address < _REG_TRIGGER0_TUNING + 4 * 4:
+        return (address - _REG_TRIGGER0_TUNING) // 4
+
+    return None
+
+def shadow_bit(address):
+    """
+    Bit of the Shadow Hold and Commit masks covering a register, or None if it isn't double
+    buffered : triggers are bits 0 to 3, crossbar outputs A0 to B7 are bits 8 to 23.
+    """
+    if _REG_CROSSBAR_A0 <= address <= _REG_CROSSBAR_B7:
+        return 8 + address - _REG_CROSSBAR_A0
+
+    if address in _MODE_REGISTERS:
+        return None
 
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-logger.addHandler(ch)
+    return _register_trigger(address)
+
+def _restore_order(registers):
+    ## Host-writable registers in the order restore() writes them : the timebase and outputs
+    ## first, then trigger timing, then trigger modes.  Trigger Enables is always written last,
+    ## and a Commit is never replayed.
+    return [
+        addr + idx for _, addr, length, readonly in registers
+            if not readonly and addr not in (_REG_TRIGGER_ENABLES, _REG_COMMIT) and addr not in _MODE_REGISTERS
+            for idx in range(length)
+    ] + _MODE_REGISTERS
+
+logger = logging.getLogger(__name__)
 
 def set_bit(value, bit):
     return value | (1<<bit)
@@ -77,34 +281,517 @@ def get_bit(value, bit):
     return (value & (1<<bit)) > 0 
 
 
-def write_register(address, value):
-    logger.debug("W " + hex(address) + " " + "".join("{:02x}".format(x) for x in [value]))
+def _hexstr(values):
+    return "".join("{:02x}".format(x) for x in values)
 
-    msg_set = i2c_msg.write(DEVICE_ADDRESS, [address, value])
 
-    with SMBus(I2CBUS) as bus:
-        bus.i2c_rdwr(msg_set)
+def _check_byte(address, value):
+    ## The preallocated transfers hold ctypes bytes, which would silently truncate larger values
+    if not 0 <= value <= 0xFF:
+        raise ValueError("Register {} can't hold {}, registers are one byte".format(hex(address), value))
 
 
-def read_register(address, length=1):
+class _Transfer:
+    """
+    A preallocated I2C_RDWR payload for one register address.
 
-    result = []
-    tmp = bytearray(1)
+    Built once and reissued for every access to that address : a write transfer is one
+    message carrying the register address and a value byte which is patched in place, a
+    read transfer is a register address write followed by a read into ``view``.
+    """
+    __slots__ = ("wbuf", "rbuf", "view", "msgs", "data")
 
-    with SMBus(I2CBUS) as bus:
-        for idx in range(length):
-            msg_set = i2c_msg.write(DEVICE_ADDRESS, [address+idx])
-            msg_get = i2c_msg.read(DEVICE_ADDRESS, 1)
-            bus.i2c_rdwr(msg_set, msg_get)
+    def __init__(self, device, address, length=0):
+        if length == 0:
+            self.wbuf = (ctypes.c_uint8 * 2)(address, 0)
+            self.rbuf = None
+            self.view = None
+            self.msgs = (i2c_msg * 1)(
+                i2c_msg(addr=device, flags=0, len=2, buf=ctypes.cast(self.wbuf, ctypes.POINTER(ctypes.c_char))),
+            )
+        else:
+            self.wbuf = (ctypes.c_uint8 * 1)(address)
+            self.rbuf = (ctypes.c_uint8 * length)()
+            self.view = memoryview(self.rbuf).cast("B")
+            self.msgs = (i2c_msg * 2)(
+                i2c_msg(addr=device, flags=0, len=1, buf=ctypes.cast(self.wbuf, ctypes.POINTER(ctypes.c_char))),
+                i2c_msg(addr=device, flags=I2C_M_RD, len=length, buf=ctypes.cast(self.rbuf, ctypes.POINTER(ctypes.c_char))),
+            )
 
-            result.append(list(msg_get)[0])
+        self.data = i2c_rdwr_ioctl_data(msgs=self.msgs, nmsgs=len(self.msgs))
 
-    logger.debug("R " + hex(address) + " " + "".join("{:02x}".format(x) for x in result))
 
-    if length == 1:
-        return result[0]
-    else:
-        return bytearray(result)
+class Backend:
+    """
+    Interface between a BusSession and whatever carries its I2C transfers.
+
+    ``rdwr`` receives a ctypes ``i2c_rdwr_ioctl_data`` (the I2C_RDWR ioctl argument) and must
+    perform its messages in order, filling the buffers of read messages, or raise OSError.
+    """
+
+    def rdwr(self, data):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LinuxBackend(Backend):
+    """
+    Transfers issued as I2C_RDWR ioctls on a Linux /dev/i2c-N device node.
+    """
+
+    def __init__(self, bus=I2CBUS):
+        self.bus = bus
+        self._smbus = SMBus(bus)
+        self.rdwr = functools.partial(fcntl.ioctl, self._smbus.fd, I2C_RDWR)
+
+    def close(self):
+        self._smbus.close()
+
+
+class RegisterCache:
+    """
+    Host-side shadow copy of the device registers.
+
+    Reads are served from memory except for registers the gateware changes by itself : 
+    Power Sense is never cached and a Trigger Mode is re-fetched while it is oneshot or idle.
+    Addresses outside of the register map are not cached.
+
+    :attr hits:
+        Number of register reads served from the shadow copy.
+    :attr misses:
+        Number of register reads which had to go to the bus.
+    """
+
+    def __init__(self, registers=REGISTER_MAP):
+        self._values = dict()
+        self.remap(registers)
+
+        self.hits = 0
+        self.misses = 0
+
+    def remap(self, registers):
+        """Switch to another register map, dropping every cached value"""
+        self._cacheable = set()
+        self._values.clear()
+
+        for _, addr, length, _ in registers:
+            self._cacheable.update(range(addr, addr+length))
+
+        self._cacheable.difference_update(_VOLATILE_REGISTERS)
+
+        ## One past the last register address
+        self.end = max(self._cacheable | set(_VOLATILE_REGISTERS)) + 1
+
+    def get(self, address):
+        value = self._values.get(address)
+
+        if value is None or (address in _MODE_REGISTERS and value in _TRANSIENT_MODES):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return value
+
+    def cached(self, address):
+        """Whether a read of address would be served from the cache, without counting it"""
+        value = self._values.get(address)
+        return value is not None and not (address in _MODE_REGISTERS and value in _TRANSIENT_MODES)
+
+    def put(self, address, value):
+        if address in self._cacheable:
+            self._values[address] = value
+
+    def invalidate(self, address=None):
+        if address is None:
+            self._values.clear()
+        else:
+            self._values.pop(address, None)
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
+
+
+class BusSession:
+    """
+    A persistent handle on the I2C bus the trigger board is attached to.
+
+    The device node is opened once and every register access reuses it, instead of
+    re-running open() and ioctl(I2C_SLAVE) per access.  Transfers go through ``backend``,
+    which defaults to a LinuxBackend on the given bus number.  When ``shared`` is set, accesses
+    are serialized with a lock so one session can be used from several threads.
+
+    Within a ``batch()`` block writes are queued instead of issued, and flushed as one
+    I2C_RDWR ioctl when the outermost block exits.  If it exits with an exception the
+    queued writes are dropped instead.
+
+    Ranges of registers are read and written with a single auto-incrementing transaction.
+
+    Register values are shadowed in ``cache`` (a RegisterCache), so repeated reads of
+    host-controlled registers do not touch the bus.
+
+    ``start_trace()`` records every transfer into an in-memory ring buffer (see bus_trace),
+    and ``start_metrics()`` keeps latency histograms and error counts (see bus_metrics).
+    """
+
+    def __init__(self, bus=I2CBUS, address=DEVICE_ADDRESS, shared=False, backend=None):
+        self.bus = bus
+        self.address = address
+
+        if shared:
+            self._lock = threading.RLock()
+        else:
+            self._lock = contextlib.nullcontext()
+
+        if backend is None:
+            backend = LinuxBackend(bus)
+
+        self.backend = backend
+        self._rdwr = backend.rdwr
+        self.trace = None
+        self.metrics = None
+        self._closed = False
+
+        ## Preallocated transfers, keyed by register address (writes) or address and length (reads)
+        self._write_xfers = dict()
+        self._read_xfers = dict()
+
+        ## Address -> value of writes queued by batch(), None when not batching
+        self._pending = None
+
+        self.cache = RegisterCache()
+
+        ## Gateware revision 2 and later auto-increment the register pointer, allowing a range
+        ## of registers to be accessed in one transaction.  TriggerController clears this
+        ## when talking to older gateware.
+        self.burst = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        with self._lock:
+            if not self._closed:
+                self.backend.close()
+                self._closed = True
+
+    def start_trace(self, size=4096):
+        """
+        Record every transfer into a new TraceBuffer of ``size`` records, which is returned.
+        """
+        with self._lock:
+            self.trace = TraceBuffer(size)
+            self._rdwr = traced(self.backend.rdwr, self.trace)
+
+        return self.trace
+
+    def stop_trace(self):
+        with self._lock:
+            trace, self.trace = self.trace, None
+            self._rdwr = self.backend.rdwr
+
+        return trace
+
+    def start_metrics(self):
+        """
+        Count and time every operation into a new BusMetrics, which is returned.
+        """
+        with self._lock:
+            self.metrics = BusMetrics()
+            self.metrics.cache = self.cache
+
+        return self.metrics
+
+    def stop_metrics(self):
+        with self._lock:
+            metrics, self.metrics = self.metrics, None
+
+        return metrics
+
+    def _io(self, op, address, data):
+        metrics = self.metrics
+
+        if metrics is None:
+            self._rdwr(data)
+            return
+
+        start = time.perf_counter()
+
+        try:
+            self._rdwr(data)
+        except OSError:
+            metrics.error(op, address)
+            raise
+
+        metrics.observe(op, address, time.perf_counter() - start)
+
+    def _transfer(self, op, address, msgs):
+        self._io(op, address, i2c_rdwr_ioctl_data.create(*msgs))
+
+    def prepare_write(self, address, value):
+        """
+        Build the transfer writing value to a register ahead of time and return a function
+        which issues it, for when the delay between deciding to write and the write landing
+        matters.  The write bypasses batching.
+        """
+        _check_byte(address, value)
+
+        xfer = _Transfer(self.address, address)
+        xfer.wbuf[1] = value
+
+        def issue():
+            with self._lock:
+                self._io("write", address, xfer.data)
+                self.cache.put(address, value)
+
+        return issue
+
+    def _write_xfer(self, address):
+        xfer = self._write_xfers.get(address)
+
+        if xfer is None:
+            xfer = _Transfer(self.address, address)
+            self._write_xfers[address] = xfer
+
+        return xfer
+
+    def _read_xfer(self, address, length):
+        xfer = self._read_xfers.get((address, length))
+
+        if xfer is None:
+            xfer = _Transfer(self.address, address, length)
+            self._read_xfers[(address, length)] = xfer
+
+        return xfer
+
+    @property
+    def batching(self):
+        """Whether writes are being queued by a batch() block"""
+        return self._pending is not None
+
+    @contextlib.contextmanager
+    def batch(self):
+        with self._lock:
+            if self._pending is not None:
+                ## Nested batches are folded into the outermost one
+                yield self
+                return
+
+            self._pending = dict()
+
+            ## A block which raises sends nothing, so the board never runs a half-written configuration
+            try:
+                yield self
+            except BaseException:
+                self._pending = None
+                raise
+
+            pending, self._pending = self._pending, None
+            self._flush(pending)
+
+    @contextlib.contextmanager
+    def savepoint(self):
+        """
+        Within a batch, drop the writes queued inside the block if it raises, keeping those
+        queued before it.  Outside of a batch writes are issued at once and can't be undone.
+        """
+        with self._lock:
+            saved = None if self._pending is None else dict(self._pending)
+
+            try:
+                yield self
+            except BaseException:
+                if saved is not None:
+                    self._pending.clear()
+                    self._pending.update(saved)
+                raise
+
+    def _flush(self, pending):
+        if len(pending) == 0:
+            return
+
+        ## Trigger enables go out last so that triggers start on a fully written configuration
+        order = [addr for addr in pending.keys() if addr != _REG_TRIGGER_ENABLES]
+        if _REG_TRIGGER_ENABLES in pending:
+            order.append(_REG_TRIGGER_ENABLES)
+
+        ## Group runs of consecutive addresses so that each run is one auto-incrementing write
+        runs = []
+        for addr in order:
+            if self.burst and len(runs) > 0 and runs[-1][0] + len(runs[-1][1]) == addr:
+                runs[-1][1].append(pending[addr])
+            else:
+                runs.append((addr, [pending[addr]]))
+
+        msgs = []
+        for addr, values in runs:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("W %s %s", hex(addr), _hexstr(values))
+            msgs.append(i2c_msg.write(self.address, [addr] + values))
+
+        for idx in range(0, len(msgs), RDWR_MAX_MSGS):
+            self._transfer("flush", runs[idx][0], msgs[idx:idx+RDWR_MAX_MSGS])
+
+            for addr, values in runs[idx:idx+RDWR_MAX_MSGS]:
+                for offset, value in enumerate(values):
+                    self.cache.put(addr+offset, value)
+
+    def write_register(self, address, value):
+        """
+        Write one register, or a sequence of values to consecutive registers starting at address.
+        """
+        with self._lock:
+            if isinstance(value, int):
+                _check_byte(address, value)
+
+                if self._pending is not None:
+                    ## Drop any earlier queued write to this address, keeping the order of last writes
+                    self._pending.pop(address, None)
+                    self._pending[address] = value
+                    return
+
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("W %s %02x", hex(address), value)
+
+                ## Fast path : reissue the preallocated transfer for this register
+                xfer = self._write_xfer(address)
+                xfer.wbuf[1] = value
+                self._io("write", address, xfer.data)
+
+                self.cache.put(address, value)
+                return
+
+            values = list(value)
+
+            for offset, value in enumerate(values):
+                _check_byte(address+offset, value)
+
+            if self._pending is not None:
+                for offset, value in enumerate(values):
+                    self._pending.pop(address+offset, None)
+                    self._pending[address+offset] = value
+                return
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("W %s %s", hex(address), _hexstr(values))
+
+            if self.burst:
+                msgs = [i2c_msg.write(self.address, [address] + values)]
+            else:
+                msgs = [i2c_msg.write(self.address, [address+offset, value]) for offset, value in enumerate(values)]
+
+            self._transfer("write", address, msgs)
+
+            for offset, value in enumerate(values):
+                self.cache.put(address+offset, value)
+
+    def read_register(self, address, length=1):
+
+        with self._lock:
+            ## Fast path for a single register which is neither queued nor cached
+            if length == 1 and (self._pending is None or address not in self._pending):
+                value = self.cache.get(address)
+
+                if value is None:
+                    xfer = self._read_xfer(address, 1)
+                    self._io("read", address, xfer.data)
+
+                    value = xfer.view[0]
+                    self.cache.put(address, value)
+
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("R %s %02x", hex(address), value)
+
+                return value
+
+            result = [None] * length
+
+            for idx in range(length):
+                ## Queued writes have not reached the device yet, so report what will be written
+                if self._pending is not None and address+idx in self._pending:
+                    result[idx] = self._pending[address+idx]
+                else:
+                    result[idx] = self.cache.get(address+idx)
+
+            missing = [idx for idx in range(length) if result[idx] is None]
+
+            if len(missing) > 0 and self.burst:
+                ## Fetch everything between the first and last uncached register in one transaction
+                first, last = missing[0], missing[-1]
+
+                xfer = self._read_xfer(address+first, last-first+1)
+                self._io("read", address+first, xfer.data)
+
+                for idx, value in enumerate(xfer.view, start=first):
+                    if self._pending is None or address+idx not in self._pending:
+                        self.cache.put(address+idx, value)
+                        result[idx] = value
+
+            else:
+                for idx in missing:
+                    xfer = self._read_xfer(address+idx, 1)
+                    self._io("read", address+idx, xfer.data)
+
+                    value = xfer.view[0]
+                    self.cache.put(address+idx, value)
+                    result[idx] = value
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("R %s %s", hex(address), _hexstr(result))
+
+        if length == 1:
+            return result[0]
+        else:
+            return bytearray(result)
+
+    def read_registers(self, addresses):
+        """
+        Read several unrelated registers.  Those which are not shadowed are fetched in a single
+        transfer of pointer write and read message pairs.
+        """
+        with self._lock:
+            result = [self._pending.get(address) if self._pending is not None else None for address in addresses]
+
+            for idx, address in enumerate(addresses):
+                if result[idx] is None:
+                    result[idx] = self.cache.get(address)
+
+            missing = [idx for idx, value in enumerate(result) if value is None]
+            step = RDWR_MAX_MSGS // 2
+
+            for start in range(0, len(missing), step):
+                chunk = missing[start:start+step]
+                msgs = []
+
+                for idx in chunk:
+                    msgs.append(i2c_msg.write(self.address, [addresses[idx]]))
+                    msgs.append(i2c_msg.read(self.address, 1))
+
+                self._transfer("read", addresses[chunk[0]], msgs)
+
+                for idx, msg in zip(chunk, msgs[1::2]):
+                    value = list(msg)[0]
+                    self.cache.put(addresses[idx], value)
+                    result[idx] = value
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("R %s %s", " ".join(hex(address) for address in addresses), _hexstr(result))
+
+        return result
+
+    def dump(self):
+        """
+        Read the whole register map, from Product ID through the last trigger register.
+        """
+        return self.read_register(_REG_PRODUCT_ID, self.cache.end - _REG_PRODUCT_ID)
 
 
 class Pin:
@@ -113,19 +800,22 @@ class Pin:
     DEFAULT_BIT = 6
     INVERT_BIT  = 5
 
-    def __init__(self, name, address):
+    def __init__(self, name, address, bus):
         self.name = name
         self.address = address
+        self.bus = bus
 
-        self.fetch()
+    @property
+    def setting(self):
+        return self.bus.read_register(self.address)
 
     def fetch(self):
-        self.setting = read_register(self.address)
+        self.bus.cache.invalidate(self.address)
+        return self.setting
 
     def reset(self):
         reg = 0b0100_0000
-        write_register(self.address, reg)
-        self.setting = reg
+        self.bus.write_register(self.address, reg)
 
     @property
     def enable(self):
@@ -141,8 +831,7 @@ class Pin:
             reg = clear_bit(reg, self.ENABLE_BIT)
 
         if reg != self.setting:
-            write_register(self.address, reg)
-            self.setting = reg
+            self.bus.write_register(self.address, reg)
 
 
     @property
@@ -159,8 +848,7 @@ class Pin:
             reg = clear_bit(reg, self.DEFAULT_BIT)
 
         if reg != self.setting:
-            write_register(self.address, reg)
-            self.setting = reg
+            self.bus.write_register(self.address, reg)
 
 
     @property
@@ -177,8 +865,7 @@ class Pin:
             reg = clear_bit(reg, self.INVERT_BIT)
 
         if reg != self.setting:
-            write_register(self.address, reg)
-            self.setting = reg
+            self.bus.write_register(self.address, reg)
 
 
     @property
@@ -197,8 +884,7 @@ class Pin:
         reg = reg | selected
 
         if reg != self.setting:
-            write_register(self.address, reg)
-            self.setting = reg
+            self.bus.write_register(self.address, reg)
 
     @property
     def inverted_trigger(self):
@@ -217,21 +903,173 @@ class Pin:
         reg = reg | selected
 
         if reg != self.setting:
-            write_register(self.address, reg)
-            self.setting = reg
+            self.bus.write_register(self.address, reg)
+
+class Oneshot:
+    """
+    Completion of a oneshot trigger, resolving to True once the gateware has returned the
+    trigger's mode to stop.
+
+    This is deliberately not a concurrent.futures.Future : nothing polls the board in the
+    background, as a poller thread would race the caller on a BusSession which isn't shared.
+    Polling happens while someone calls result(), exception() or done(), which also completes
+    any other pending oneshots.  So a Oneshot can't be given to concurrent.futures.wait() or
+    asyncio.wrap_future(); run result() on a worker thread instead.
+    """
+
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+        self._completed = False
+        self._result = None
+        self._exception = None
+
+    def _set_result(self, result):
+        self._result = result
+        self._completed = True
+
+    def _set_exception(self, exception):
+        self._exception = exception
+        self._completed = True
+
+    def done(self):
+        if not self._completed:
+            self._scheduler.poll(due_only=True)
+        return self._completed
+
+    def result(self, timeout=None):
+        """Wait up to ``timeout`` seconds (forever when None), raising TimeoutError after that"""
+        self._scheduler.run_until(self, timeout)
+
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        self._scheduler.run_until(self, timeout)
+        return self._exception
+
+
+class OneshotScheduler:
+    """
+    Adaptive polling of fired oneshot triggers.
+
+    The first poll of a trigger is due when it should have completed given its Delay,
+    Duration and the Clock Divider, and later polls back off exponentially from one strobe
+    period up to ``max_interval``.  Whenever any trigger is due, the mode registers of all
+    pending triggers are read in one combined transaction.
+    """
+
+    def __init__(self, bus, max_interval=0.02):
+        self.bus = bus
+        self.max_interval = max_interval
+
+        ## Mode register address -> [future, time of next poll, poll interval, deadline]
+        self.pending = dict()
+
+    def submit(self, address, expected, strobe, timeout=None):
+        now = time.monotonic()
+        deadline = None if timeout is None else now + timeout
+
+        future = Oneshot(self)
+        self.pending[address] = [future, now + expected, strobe, deadline]
+
+        return future
+
+    def wait(self, address):
+        """Wait for an earlier oneshot of this mode register, if one is pending"""
+        entry = self.pending.get(address)
+
+        if entry is not None:
+            self.run_until(entry[0], None)
+
+    def poll(self, due_only=False):
+        if len(self.pending) == 0:
+            return
+
+        now = time.monotonic()
+
+        if due_only and min(entry[1] for entry in self.pending.values()) > now:
+            return
+
+        addresses = list(self.pending.keys())
+
+        try:
+            modes = self.bus.read_registers(addresses)
+        except OSError as exc:
+            for address in addresses:
+                self.pending.pop(address)[0]._set_exception(exc)
+            return
+
+        now = time.monotonic()
+
+        for address, mode in zip(addresses, modes):
+            entry = self.pending[address]
+
+            if mode not in _TRANSIENT_MODES:
+                del self.pending[address]
+                entry[0]._set_result(True)
+            elif entry[3] is not None and now >= entry[3]:
+                del self.pending[address]
+                entry[0]._set_exception(TimeoutError("Trigger at {} did not complete".format(hex(address))))
+            elif entry[1] <= now:
+                entry[1] = now + entry[2]
+                entry[2] = min(entry[2] * 2, self.max_interval)
+
+    def run_until(self, future, timeout):
+        limit = None if timeout is None else time.monotonic() + timeout
+
+        while not future._completed:
+            now = time.monotonic()
+
+            if limit is not None and now >= limit:
+                raise TimeoutError("Oneshot did not complete within {} s".format(timeout))
+
+            due = min(entry[1] for entry in self.pending.values())
+            if limit is not None:
+                due = min(due, limit)
+
+            if due > now:
+                time.sleep(due - now)
+
+            self.poll(due_only=True)
+
 
 class Trigger:
 
-    def __init__(self, index):
+    def __init__(self, index, bus, scheduler=None, width=8, prescalers=False, fine_clock_hz=0, dds=False):
         self.index = index
+        self.bus = bus
+        self.scheduler = scheduler
+        self.width = width
+        self.prescalers = prescalers
+        self.fine_clock_hz = fine_clock_hz
+        self.dds = dds
         self._offset = index * (_REG_TRIGGER1_MODE - _REG_TRIGGER0_MODE)
+        self._fields = {field: _REG_TRIGGER0_MODE + offset for field, offset in trigger_offsets(width).items()}
 
     def offset(self, address):
         return address + self._offset
 
+    def _get(self, field):
+        address = self.offset(self._fields[field])
+
+        if self.width == 8:
+            return self.bus.read_register(address)
+
+        return int.from_bytes(self.bus.read_register(address, self.width // 8), "little")
+
+    def _set(self, field, value):
+        address = self.offset(self._fields[field])
+
+        if self.width == 8:
+            self.bus.write_register(address, value)
+        else:
+            ## All bytes go out in one transaction, which the gateware applies atomically
+            self.bus.write_register(address, value.to_bytes(self.width // 8, "little"))
+
     @property
     def mode(self):
-        value = read_register(self.offset(_REG_TRIGGER0_MODE))
+        value = self.bus.read_register(self.offset(_REG_TRIGGER0_MODE))
 
         for key, v in TRIG_MODE.items():
             if v == value:
@@ -241,41 +1079,304 @@ class Trigger:
 
     @mode.setter
     def mode(self, name):
-        write_register(self.offset(_REG_TRIGGER0_MODE), TRIG_MODE[name])
+        self.bus.write_register(self.offset(_REG_TRIGGER0_MODE), TRIG_MODE[name])
 
     @property
     def duration(self):
-        return read_register(self.offset(_REG_TRIGGER0_DURATION))
+        return self._get("duration")
 
     @duration.setter
     def duration(self, value):
-        write_register(self.offset(_REG_TRIGGER0_DURATION), value)
+        self._set("duration", value)
 
     @property
     def interval(self):
-        return read_register(self.offset(_REG_TRIGGER0_INTERVAL))
+        return self._get("interval")
 
     @interval.setter
     def interval(self, value):
-        write_register(self.offset(_REG_TRIGGER0_INTERVAL), value)
+        self._set("interval", value)
 
     @property
     def delay(self):
-        return read_register(self.offset(_REG_TRIGGER0_DELAY))
+        return self._get("delay")
 
     @delay.setter
     def delay(self, value):
-        write_register(self.offset(_REG_TRIGGER0_DELAY), value)
+        self._set("delay", value)
+
+    @property
+    def prescaler(self):
+        """
+        Ticks per strobe of this trigger's own prescaler.  Zero (the default) runs the trigger
+        off the shared Clock Divider strobe.  Prescaled triggers enabled together start in
+        phase with the Clock Divider strobe, so they stay aligned with each other.
+        """
+        if not self.prescalers:
+            return 0
+
+        return self.bus.read_register(self.offset(_REG_TRIGGER0_PRESCALER))
+
+    @prescaler.setter
+    def prescaler(self, value):
+        if not self.prescalers:
+            raise ValueError("Trigger prescalers need gateware revision {} or later, built with them".format(_PRESCALER_GATEWARE_REVISION))
+
+        self.bus.write_register(self.offset(_REG_TRIGGER0_PRESCALER), value)
+
+    @property
+    def fine_delay(self):
+        """
+        Extra delay applied to every edge of this trigger, in cycles of the gateware's fine
+        clock (``fine_clock_hz``).  It must be shorter than the trigger's strobe period.
+        """
+        if not self.fine_clock_hz:
+            return 0
+
+        address = _REG_TRIGGER0_FINE_DELAY + 2 * self.index
+        return int.from_bytes(self.bus.read_register(address, 2), "little")
+
+    @fine_delay.setter
+    def fine_delay(self, value):
+        if not self.fine_clock_hz:
+            raise ValueError("Fine Delay needs gateware built with the PLL timebase")
+
+        ## Both bytes go out in one transaction, which the gateware applies atomically
+        address = _REG_TRIGGER0_FINE_DELAY + 2 * self.index
+        self.bus.write_register(address, value.to_bytes(2, "little"))
+
+    @property
+    def tuning(self):
+        """DDS tuning word : in dds mode the trigger fires strobe * tuning / 2^32 times a second"""
+        if not self.dds:
+            return 0
+
+        address = _REG_TRIGGER0_TUNING + 4 * self.index
+        return int.from_bytes(self.bus.read_register(address, 4), "little")
+
+    @tuning.setter
+    def tuning(self, value):
+        if not self.dds:
+            raise ValueError("The dds mode needs gateware revision {} or later, built with it".format(_DDS_GATEWARE_REVISION))
+
+        ## All bytes go out in one transaction, which the gateware applies atomically
+        address = _REG_TRIGGER0_TUNING + 4 * self.index
+        self.bus.write_register(address, value.to_bytes(4, "little"))
+
+    @property
+    def rate(self):
+        """
+        Average rate of this trigger in dds mode, in Hz.  Setting it writes the closest tuning
+        word for the current strobe (Clock Divider or Prescaler, which should be set first);
+        reading it back gives the rate actually achieved.
+        """
+        return tuning_rate(self.tuning, self.strobe())
+
+    @rate.setter
+    def rate(self, value):
+        self.tuning = tuning_word(value, self.strobe())
+
+    def strobe(self):
+        """Seconds between the strobes this trigger counts in"""
+        ticks = self.prescaler
+
+        if ticks == 0:
+            ticks = self.bus.read_register(_REG_CLOCK_DIVIDER)
+
+        return ticks / TICK_HZ
+
+    def fire(self, timeout=None):
+        """
+        Start a oneshot and return a Oneshot which resolves once it has completed, or
+        fails with TimeoutError after ``timeout`` seconds.  A oneshot still in progress on this
+        trigger is waited for first.  The trigger must be enabled.
+        """
+        if not get_bit(self.bus.read_register(_REG_TRIGGER_ENABLES), self.index):
+            raise ValueError("Trigger{} is not enabled".format(self.index))
+
+        address = self.offset(_REG_TRIGGER0_MODE)
+        self.scheduler.wait(address)
+
+        strobe = self.strobe()
+        expected = (self.delay + self.duration + 2) * strobe
+
+        self.mode = "oneshot"
+
+        return self.scheduler.submit(address, expected, strobe, timeout)
+
+class Snapshot(bytes):
+    """
+    Immutable copy of the register map from address 0x00 through the last trigger register,
+    as taken by TriggerController.snapshot().  Index it by register address.
+    """
+
+    @property
+    def product_id(self):
+        return self[_REG_PRODUCT_ID:_REG_PRODUCT_ID+6]
+
+    @property
+    def enables(self):
+        return self[_REG_TRIGGER_ENABLES]
+
+    def writes(self, current, registers=REGISTER_MAP):
+        """
+        The (address, value) writes which bring a board in state ``current`` (another Snapshot)
+        back to this one, in restore order and excluding Trigger Enables.  ``registers`` is
+        the register map of the board.
+        """
+        writes = []
+
+        for address in _restore_order(registers):
+            value = self[address]
+
+            ## Restoring a transient mode would fire the trigger again
+            if address in _MODE_REGISTERS and value in _TRANSIENT_MODES:
+                value = TRIG_MODE['stop']
+
+            if current[address] != value:
+                writes.append((address, value))
+
+        return writes
+
 
 class TriggerController:
 
-    def __init__(self):
-        self.enables = read_register(_REG_TRIGGER_ENABLES)
+    def __init__(self, bus=None):
+        ## Only close the bus session on exit if we were the one to open it
+        self._owns_bus = bus is None
+
+        if bus is None:
+            bus = BusSession()
+
+        self.bus = bus
+        self.cache = bus.cache
+
+        revision = self.bus.read_register(_REG_GATEWARE_REVISION)
+
+        ## Older gateware can only access one register per transaction
+        if revision < _BURST_GATEWARE_REVISION:
+            self.bus.burst = False
+
+        ## Gateware may be built with trigger timing registers wider than 8 bits
+        self.timing_width = 8
+        if revision >= _WIDE_GATEWARE_REVISION:
+            self.timing_width = self.bus.read_register(_REG_TIMING_WIDTH)
+
+        ## Later gateware reports which optional features it was built with; before that, every
+        ## build of a revision had all the features of that revision
+        capabilities = None
+        if revision >= _CAPABILITY_GATEWARE_REVISION:
+            capabilities = self.bus.read_register(_REG_CAPABILITIES)
+
+        def built_with(first_revision, bit):
+            if capabilities is None:
+                return revision >= first_revision
+            return get_bit(capabilities, bit)
+
+        ## Triggers may divide the tick with their own prescaler instead of the Clock Divider
+        self.prescalers = built_with(_PRESCALER_GATEWARE_REVISION, _CAP_PRESCALERS)
+
+        ## Gateware built with the PLL timebase runs its triggers from a faster clock, in MHz
+        fine_clock = None
+        if revision >= _FINE_GATEWARE_REVISION:
+            fine_clock = self.bus.read_register(_REG_FINE_CLOCK)
+
+        ## Rate of the clock Trigger Fine Delay counts in, or 0 without Fine Delay registers
+        self.fine_clock_hz = (fine_clock or 0) * 1_000_000
+
+        ## Triggers can run in dds mode, at fractional rates set by their Tuning register
+        self.dds = built_with(_DDS_GATEWARE_REVISION, _CAP_DDS)
+
+        ## Trigger timing and crossbar registers can be staged and then committed together
+        self.shadow = built_with(_SHADOW_GATEWARE_REVISION, _CAP_SHADOW)
+
+        self.registers = register_map(self.timing_width, self.prescalers, fine_clock, self.dds, self.shadow, 
+            capabilities is not None)
+        if self.registers != REGISTER_MAP:
+            self.cache.remap(self.registers)
+
         self._triggers = dict()
         self._pins = dict()
+        self.scheduler = OneshotScheduler(self.bus)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._owns_bus:
+            self.bus.close()
+
+    def batch(self):
+        """
+        Queue register writes made inside the block and issue them as a single bus
+        transaction on exit, with the Trigger Enables register written last.  Nothing is
+        written if the block raises.
+
+            with ctrl.batch():
+                ctrl.trigger(0).interval = 20
+                ctrl.trigger(0).mode = "interval"
+                ctrl.enable(mask=1)
+        """
+        return self.bus.batch()
+
+    @contextlib.contextmanager
+    def staged(self, triggers=0x0F, pins=0xFFFF, timeout=None):
+        """
+        Stage the timing of the ``triggers`` and the crossbar settings of the ``pins`` (bit masks,
+        pins A0 to A7 then B0 to B7) written inside the block, and make them all take effect on
+        the same Clock Divider strobe on exit.  The writes go out as one batch, followed by the
+        Commit; the block returns once the gateware has applied it.  Trigger Modes and Enables
+        are not staged and should be changed after the block.
+
+            with ctrl.staged(triggers=0b11):
+                ctrl.trigger(0).interval = 30
+                ctrl.trigger(1).interval = 60
+
+        If the block raises, the writes queued in it are dropped and nothing reaches the board.
+        Raises TimeoutError if the commit isn't applied within ``timeout`` seconds (by default
+        ten strobe periods, and at least 10 ms).  The Shadow Hold register is put back as it was
+        in every case, so a commit which timed out leaves the staged values live unsynchronized
+        rather than held forever.  It can't be used inside a batch(), whose writes would only
+        go out after the wait for the Commit.
+        """
+        if not self.shadow:
+            raise ValueError("Staged updates need gateware revision {} or later, built with shadow registers".format(_SHADOW_GATEWARE_REVISION))
+
+        if self.bus.batching:
+            raise ValueError("Staged updates can't be made inside a batch")
+
+        mask = list((triggers | (pins << 8)).to_bytes(3, "little"))
+        hold = self.bus.read_register(_REG_SHADOW_HOLD, 3)
+
+        try:
+            with self.batch(), self.bus.savepoint():
+                self.bus.write_register(_REG_SHADOW_HOLD, [a | b for a, b in zip(hold, mask)])
+                yield self
+                self.bus.write_register(_REG_COMMIT, mask)
+
+            if timeout is None:
+                timeout = max(0.01, 10 * self.clock_divider / TICK_HZ)
+
+            deadline = time.monotonic() + timeout
+
+            while any(self.bus.read_register(_REG_COMMIT, 3)):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError("Commit of {} was not applied".format(_hexstr(mask)))
+                time.sleep(DELAY)
+
+        finally:
+            self.bus.write_register(_REG_SHADOW_HOLD, hold)
 
     def ident(self):
-        data = read_register(0x00, 8)
+        if self.bus.metrics is not None:
+            with self.bus.metrics.timed("ident"):
+                data = self.bus.read_register(0x00, 8)
+        else:
+            data = self.bus.read_register(0x00, 8)
+
         mpn = ''.join([chr(v) for v in data[0:6]])
         hwr = data[6]
         gwr = data[7]
@@ -284,63 +1385,142 @@ class TriggerController:
 
     def trigger(self, index):
         if index not in self._triggers.keys():
-            self._triggers[index] = Trigger(index)
+            self._triggers[index] = Trigger(index, self.bus, self.scheduler, self.timing_width, self.prescalers, 
+                self.fine_clock_hz, self.dds)
 
         return self._triggers[index]        
 
     def pin(self, name):
         if name not in self._pins.keys():
             if name[0] == 'A':
-                self._pins[name] = Pin(name, _REG_CROSSBAR_A0 + int(name[1]))
+                self._pins[name] = Pin(name, _REG_CROSSBAR_A0 + int(name[1]), self.bus)
             if name[0] == 'B':
-                self._pins[name] = Pin(name, _REG_CROSSBAR_B0 + int(name[1]))
+                self._pins[name] = Pin(name, _REG_CROSSBAR_B0 + int(name[1]), self.bus)
+
+            ## Shadow the whole crossbar with one burst read instead of one read per pin
+            if not self.cache.cached(self._pins[name].address):
+                self.bus.read_register(_REG_CROSSBAR_A0, _REG_CROSSBAR_B7 - _REG_CROSSBAR_A0 + 1)
 
         return self._pins[name]
 
+    @property
+    def enables(self):
+        return self.bus.read_register(_REG_TRIGGER_ENABLES)
+
     def enable(self, mask=0xFF):
         if mask != self.enables:
-            write_register(_REG_TRIGGER_ENABLES, mask)
-            self.enables = mask
+            self.bus.write_register(_REG_TRIGGER_ENABLES, mask)
 
     def disable(self):
         reg = 0
 
         if reg != self.enables:
-            write_register(_REG_TRIGGER_ENABLES, reg)
-            self.enables = reg
+            self.bus.write_register(_REG_TRIGGER_ENABLES, reg)
 
     @property
     def clock_divider(self):
-        return read_register(_REG_CLOCK_DIVIDER)
+        return self.bus.read_register(_REG_CLOCK_DIVIDER)
 
     @clock_divider.setter
     def clock_divider(self, value):
-        write_register(_REG_CLOCK_DIVIDER, value)
+        self.bus.write_register(_REG_CLOCK_DIVIDER, value)
+
+    def snapshot(self, refresh=False):
+        """
+        Capture the whole register map as a Snapshot.  Shadowed registers come from the cache
+        and the rest are fetched in one burst read; ``refresh`` re-reads everything from the board.
+        """
+        if refresh:
+            self.cache.invalidate()
+
+        return Snapshot(self.bus.dump())
+
+    def restore(self, snapshot):
+        """
+        Bring the board back to a Snapshot, writing only the registers which differ.
+
+        Enabled triggers whose configuration changes are disabled first.  The remaining writes
+        go out as one batch : clock divider, power and crossbar, then trigger timing, then
+        modes, and Trigger Enables last.  Triggers captured in oneshot or idle are restored
+        as stopped.  Returns the writes made.
+        """
+        current = self.snapshot()
+
+        if snapshot.product_id != current.product_id:
+            raise ValueError("Snapshot is of a different device ({!r})".format(snapshot.product_id))
+
+        writes = snapshot.writes(current, self.registers)
+        enables = current.enables
+
+        changed = 0
+        for address, _ in writes:
+            trigger = _register_trigger(address)
+            if trigger is not None:
+                changed = set_bit(changed, trigger)
+
+        if enables & changed:
+            enables &= ~changed
+            self.bus.write_register(_REG_TRIGGER_ENABLES, enables)
+            writes.insert(0, (_REG_TRIGGER_ENABLES, enables))
+
+        with self.batch():
+            for address, value in writes:
+                if address != _REG_TRIGGER_ENABLES:
+                    self.bus.write_register(address, value)
+
+            if snapshot.enables != enables:
+                self.bus.write_register(_REG_TRIGGER_ENABLES, snapshot.enables)
+                writes.append((_REG_TRIGGER_ENABLES, snapshot.enables))
+
+        return writes
+
+
+def measure_latency(count=1000):
+    """
+    Compare the per-access latency of re-opening the device node for every register
+    read (the original access pattern) against reading through a persistent BusSession.
+    """
+    start = time.perf_counter()
+    for _ in range(count):
+        with SMBus(I2CBUS) as bus:
+            msg_set = i2c_msg.write(DEVICE_ADDRESS, [_REG_TRIGGER_ENABLES])
+            msg_get = i2c_msg.read(DEVICE_ADDRESS, 1)
+            bus.i2c_rdwr(msg_set, msg_get)
+    reopen = (time.perf_counter() - start) / count
 
+    with BusSession() as bus:
+        start = time.perf_counter()
+        for _ in range(count):
+            bus.read_register(_REG_TRIGGER_ENABLES)
+        session = (time.perf_counter() - start) / count
+
+    print("Re-open per access  : {:8.1f} us".format(reopen * 1e6))
+    print("Persistent session  : {:8.1f} us".format(session * 1e6))
 
-if __name__ == "__main__":
 
+def demo():
     ctrl = TriggerController()
     print(ctrl.ident())
 
-    ctrl.trigger(0).interval = 20
-    ctrl.trigger(0).duration = 10
+    with ctrl.batch():
+        ctrl.trigger(0).interval = 20
+        ctrl.trigger(0).duration = 10
 
-    ctrl.trigger(1).interval = 20
-    ctrl.trigger(1).duration = 10
-    ctrl.trigger(1).delay = 5
+        ctrl.trigger(1).interval = 20
+        ctrl.trigger(1).duration = 10
+        ctrl.trigger(1).delay = 5
 
-    a0 = ctrl.pin("A0")
-    a1 = ctrl.pin("A1")
+        a0 = ctrl.pin("A0")
+        a1 = ctrl.pin("A1")
 
-    a0.trigger = 0
-    a1.trigger = 1
-    # a1.invert = True
+        a0.trigger = 0
+        a1.trigger = 1
+        # a1.invert = True
 
-    ctrl.trigger(0).mode = "interval"
-    ctrl.trigger(1).mode = "interval"
+        ctrl.trigger(0).mode = "interval"
+        ctrl.trigger(1).mode = "interval"
 
-    ctrl.enable(mask=3)
+        ctrl.enable(mask=3)
 
     time.sleep(0.05)
 
@@ -350,4 +1530,15 @@ if __name__ == "__main__":
     ctrl.trigger(1).mode = "stop"
 
     a0.reset()
-    a1.reset()
\ No newline at end of file
+    a1.reset()
+
+    ctrl.close()
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'latency':
+        measure_latency()
+    else:
+        logging.basicConfig(level=logging.DEBUG, format="%(message)s")
+        demo()
@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+
+from trigger_controller import BusSession, I2CBUS
+from async_trigger_controller import AsyncTriggerController
+from board_config import BoardConfig
+from status_page import StatusPublisher, STATUS_PATH
+
+SOCKET_PATH = "/tmp/trigger_controller.sock"
+
+## Clients need read and write access to the socket; only the owner and its group get it
+SOCKET_MODE = 0o660
+
+logger = logging.getLogger(__name__)
+
+
+class TriggerDaemon:
+    """
+    Long-running owner of the trigger board, serving other processes over a Unix socket.
+
+    Requests and responses are single-line JSON objects.  A request has an ``op`` and an
+    optional ``id`` which is echoed in the response :
+
+        {"id": 1, "op": "read", "address": 64, "length": 4}
+        {"id": 1, "ok": true, "result": [2, 33, 5, 0]}
+
+    Supported ops are read, write (``value`` is a byte or a list of bytes), ident, enable
+    (``mask``), disable, apply (``config`` as accepted by BoardConfig.from_dict) and stats.
+    Failed requests are answered with ``"ok": false`` and an ``error`` message.
+
+    All bus access goes through one AsyncTriggerController, so requests arriving together
+    from any number of clients are batched into shared bus transactions, and reads of
+    shadowed registers are answered directly from the shadow copy.
+
+    With ``status`` (a StatusPublisher) the register map is also published to that status
+    page ``status_rate`` times a second, through the same controller.
+    """
+
+    def __init__(self, bus=None, path=SOCKET_PATH, status=None, status_rate=10.0):
+        self.ctrl = AsyncTriggerController(bus)
+        self.path = path
+        self.status = status
+        self.status_rate = status_rate
+        self.requests = 0
+        self.shadow_reads = 0
+        self._server = None
+        self._status_task = None
+
+    async def start(self):
+        ## A socket left by a daemon which has died is replaced, but a live daemon is not taken over
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+            try:
+                probe.connect(self.path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.path)
+            else:
+                raise RuntimeError("A trigger daemon is already serving on {}".format(self.path))
+            finally:
+                probe.close()
+
+        self._server = await asyncio.start_unix_server(self._client, path=self.path)
+        os.chmod(self.path, SOCKET_MODE)
+
+        ## Open the device up front so the first client doesn't pay for it
+        await self.ctrl.ident()
+
+        if self.status is not None:
+            self._status_task = asyncio.create_task(self._publish_status())
+
+    async def _publish_status(self):
+        period = 1.0 / self.status_rate
+
+        while True:
+            try:
+                registers = await self.ctrl.call(lambda ctrl: ctrl.bus.dump(), write=False)
+            except OSError:
+                self.status.failed()
+            else:
+                self.status.publish(registers)
+
+            await asyncio.sleep(period)
+
+    async def serve_forever(self):
+        try:
+            await self.start()
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self._status_task is not None:
+            self._status_task.cancel()
+            self._status_task = None
+
+        ## Only remove the socket if it is ours
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+        await self.ctrl.aclose()
+
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                response = await self._handle(line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, line):
+        self.requests += 1
+        request = dict()
+
+        try:
+            request = json.loads(line)
+            result = await self._dispatch(request)
+            response = dict(ok=True, result=result)
+        except Exception as exc:
+            response = dict(ok=False, error="{}: {}".format(type(exc).__name__, exc))
+
+        if "id" in request:
+            response["id"] = request["id"]
+
+        return response
+
+    async def _dispatch(self, request):
+        op = request.get("op")
+
+        if op == "read":
+            address, length = request["address"], request.get("length", 1)
+
+            value = self.ctrl.shadow(address, length)
+            if value is not None:
+                self.shadow_reads += 1
+            else:
+                value = await self.ctrl.read_register(address, length)
+
+            return value if length == 1 else list(value)
+
+        if op == "write":
+            await self.ctrl.write_register(request["address"], request["value"])
+            return None
+
+        if op == "ident":
+            return list(await self.ctrl.ident())
+
+        if op == "enable":
+            await self.ctrl.enable(request.get("mask", 0xFF))
+            return None
+
+        if op == "disable":
+            await self.ctrl.disable()
+            return None
+
+        if op == "apply":
+            config = BoardConfig.from_dict(request["config"])
+            ## apply() batches its own writes, and a staged commit must not wait inside a batch
+            writes = await self.ctrl.call(config.apply, write=False)
+            return [list(write) for write in writes]
+
+        if op == "stats":
+            stats = await self.ctrl.call(lambda ctrl: ctrl.cache.stats(), write=False)
+            stats.update(requests=self.requests, shadow_reads=self.shadow_reads)
+            return stats
+
+        raise ValueError("Unknown op '{}'".format(op))
+
+
+class TriggerClient:
+    """
+    Blocking client for TriggerDaemon.
+
+        with TriggerClient() as client:
+            client.write_register(0x41, 33)
+            print(client.read_register(0x40, 4))
+    """
+
+    def __init__(self, path=SOCKET_PATH):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._file = self._sock.makefile("rwb")
+        self._id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def request(self, op, **kwargs):
+        self._id += 1
+        kwargs.update(op=op, id=self._id)
+
+        self._file.write(json.dumps(kwargs).encode() + b"\n")
+        self._file.flush()
+
+        response = json.loads(self._file.readline())
+
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+
+        return response["result"]
+
+    def read_register(self, address, length=1):
+        return self.request("read", address=address, length=length)
+
+    def write_register(self, address, value):
+        self.request("write", address=address, value=value)
+
+    def ident(self):
+        return tuple(self.request("ident"))
+
+    def enable(self, mask=0xFF):
+        self.request("enable", mask=mask)
+
+    def disable(self):
+        self.request("disable")
+
+    def apply(self, config):
+        return self.request("apply", config=config)
+
+    def stats(self):
+        return self.request("stats")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trigger board control daemon")
+    parser.add_argument("--bus", type=int, default=I2CBUS, help="I2C bus number of the board")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="path of the Unix socket to serve on")
+    parser.add_argument("--fake", action="store_true", help="serve a FakeDevice instead of the board")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this local port")
+    parser.add_argument("--status-page", nargs="?", const=STATUS_PATH, 
+        help="publish the register map to this status page (default {})".format(STATUS_PATH))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.fake:
+        from fake_device import FakeDevice
+        bus = BusSession(args.bus, backend=FakeDevice())
+    else:
+        bus = BusSession(args.bus)
+
+    if args.metrics_port is not None:
+        bus.start_metrics().serve(args.metrics_port)
+        logger.info("Metrics on http://127.0.0.1:{}/metrics".format(args.metrics_port))
+
+    status = None
+    if args.status_page is not None:
+        status = StatusPublisher(args.status_page)
+        logger.info("Status page at {}".format(args.status_page))
+
+    daemon = TriggerDaemon(bus, args.socket, status)
+    logger.info("Serving on {}".format(args.socket))
+
+    try:
+        asyncio.run(daemon.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as exc:
+        logger.error(str(exc))
+        sys.exit(1)
+    finally:
+        if status is not None:
+            status.close()